@@ -1,44 +1,239 @@
-from typing import Callable, Literal, Optional, Hashable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, FrozenSet, Iterator, List, Literal, Optional, Hashable, Sequence, Tuple
 
-from django.db.models import signals
+from django.db import connection, transaction
+from django.db.models import signals, Model
 from django.dispatch import receiver
 
 from specifyweb.specify import models
+from .exceptions import AbortSave
 
 # See https://docs.djangoproject.com/en/3.2/ref/signals/#module-django.db.models.signals
 MODEL_SIGNAL = Literal["pre_init", "post_init", "pre_save",
                        "post_save", "pre_delete", "post_delete", "m2m_changed"]
 
+# The set-based implementations of rules, by signal and model name
+# (None for the rules of every model), with the dispatch_uid they were
+# registered under, see orm_signal_handler.
+batch_rules: Dict[Tuple[MODEL_SIGNAL, Optional[str]], List[Tuple[Optional[Hashable], Callable]]] = {}
 
-def orm_signal_handler(signal: MODEL_SIGNAL, model: Optional[str] = None, **kwargs):
+# (signal, id(instance)) for the instances being saved or deleted by
+# save_batch or delete_batch, whose set-based rules have already run
+_batched: ContextVar[FrozenSet[Tuple[str, int]]] = ContextVar('batched_instances', default=frozenset())
+
+
+def orm_signal_handler(signal: MODEL_SIGNAL, model: Optional[str] = None, batch: Optional[Callable] = None, **kwargs):
+    """Register the decorated rule as a receiver of signal for model,
+    or every model if None.
+
+    batch can be a set-based implementation of the rule which is run
+    once for all the instances saved or deleted together by save_batch
+    or delete_batch, instead of the rule being run for each of them.
+    It gets the list of instances, preceded by their model if model is
+    None.
+    """
     def _dec(rule):
         receiver_kwargs = kwargs
+        if batch is not None:
+            batch_rules.setdefault((signal, model), []).append((kwargs.get('dispatch_uid'), batch))
+
+        def handled_in_batch(instance) -> bool:
+            return batch is not None and (signal, id(instance)) in _batched.get()
+
         if model is not None:
             receiver_kwargs['sender'] = getattr(models, model)
 
             def handler(sender, **kwargs):
-                if kwargs.get('raw', False):
+                if kwargs.get('raw', False) or handled_in_batch(kwargs['instance']):
                     return
                 # since the rule knows what model the signal comes from
                 # the sender value is redundant.
                 rule(kwargs['instance'])
         else:
             def handler(sender, **kwargs):
-                if kwargs.get('raw', False):
+                if kwargs.get('raw', False) or handled_in_batch(kwargs['instance']):
                     return
                 rule(sender, kwargs['instance'])
 
+        # lets connect_signal restore the batch after disconnect_signal
+        handler.batch = batch
         return receiver(getattr(signals, signal), **receiver_kwargs)(handler)
     return _dec
 
 
+def batch_rule(signal: MODEL_SIGNAL, model: Optional[str] = None, dispatch_uid: Optional[Hashable] = None):
+    """Register the decorated function as a set-based rule, run by
+    save_batch or delete_batch only, with no per-instance counterpart.
+    """
+    def _dec(rule):
+        batch_rules.setdefault((signal, model), []).append((dispatch_uid, rule))
+        return rule
+    return _dec
+
+def run_batch_rules(signal: MODEL_SIGNAL, model, instances: List[Model]) -> None:
+    for _, rule in batch_rules.get((signal, model.__name__), []):
+        rule(instances)
+    for _, rule in batch_rules.get((signal, None), []):
+        rule(model, instances)
+
+@contextmanager
+def _batch(batch_signals: Sequence[MODEL_SIGNAL], instances: List[Model]) -> Iterator[None]:
+    token = _batched.set(_batched.get() | frozenset(
+        (signal, id(instance)) for signal in batch_signals for instance in instances))
+    try:
+        yield
+    finally:
+        _batched.reset(token)
+
+def _batch_model(instances: Sequence[Model]):
+    model = type(instances[0])
+    if any(type(instance) is not model for instance in instances): raise AssertionError(
+        "Instances of different models in one batch",
+        {"localizationKey": "batchOfDifferentModels"})
+    return model
+
+def save_batch(instances: Sequence[Model], **save_kwargs) -> None:
+    """Save the instances, which must be of one model, in order.
+
+    The rules with a set-based implementation are run once for the
+    whole batch: the pre_save ones before any instance is saved and
+    the post_save ones after all of them are. The other rules are run
+    for each instance as it is saved. If any rule fails none of the
+    instances are saved.
+    """
+    if not instances:
+        return
+    instances = list(instances)
+    model = _batch_model(instances)
+
+    with transaction.atomic():
+        run_batch_rules('pre_save', model, instances)
+        with _batch(('pre_save', 'post_save'), instances):
+            for instance in instances:
+                instance.save(**save_kwargs)
+        run_batch_rules('post_save', model, instances)
+
+# Rows written by each multi-row INSERT of insert_batch
+INSERT_BATCH_SIZE = 500
+
+_autoinc_lock_mode: Optional[int] = None
+
+def consecutive_autoinc() -> bool:
+    """Whether the ids InnoDB assigns to the rows of one multi-row
+    INSERT are consecutive, so that they follow from LAST_INSERT_ID().
+    That holds for the "traditional" (0) and "consecutive" (1)
+    innodb_autoinc_lock_mode, which cannot change while the server runs.
+    """
+    global _autoinc_lock_mode
+    if connection.vendor != 'mysql':
+        return False
+    if _autoinc_lock_mode is None:
+        with connection.cursor() as cursor:
+            cursor.execute("select @@innodb_autoinc_lock_mode")
+            _autoinc_lock_mode = int(cursor.fetchone()[0])
+    return _autoinc_lock_mode <= 1
+
+def _plain_save(model) -> bool:
+    "Whether saving an instance of model does nothing beyond Model.save and the signals."
+    return all('save' not in vars(cls) for cls in model.__mro__[1:]
+               if cls is not Model and issubclass(cls, Model))
+
+def _insert_rows(model, instances: List[Model]) -> None:
+    """Insert the instances with multi-row INSERTs, setting their ids
+    from the consecutive range starting at LAST_INSERT_ID().
+    """
+    for start in range(0, len(instances), INSERT_BATCH_SIZE):
+        rows = instances[start:start + INSERT_BATCH_SIZE]
+        model.objects.bulk_create(rows)
+        with connection.cursor() as cursor:
+            cursor.execute("select last_insert_id(), row_count()")
+            first_id, inserted = cursor.fetchone()
+        if inserted != len(rows): raise AssertionError(
+            f"Inserted {inserted} of {len(rows)} {model.__name__} records")
+        for offset, instance in enumerate(rows):
+            instance.id = first_id + offset
+
+def insert_batch(instances: Sequence[Model]) -> List[Model]:
+    """Insert the new instances, which must be of one model, running
+    the rules as save_batch does, and return the ones inserted, with
+    their ids set. Those a rule aborts the save of are left out.
+
+    Where the ids of a multi-row INSERT can be told, see
+    consecutive_autoinc, the instances are written with one INSERT per
+    INSERT_BATCH_SIZE instances. The pre_save and post_save signals are
+    then sent for each instance around the INSERT, as saving it would.
+    Otherwise, or if the model overrides save, each instance is saved
+    in turn.
+    """
+    if not instances:
+        return []
+    instances = list(instances)
+    model = _batch_model(instances)
+
+    if not (consecutive_autoinc() and _plain_save(model)):
+        with transaction.atomic():
+            run_batch_rules('pre_save', model, instances)
+            with _batch(('pre_save', 'post_save'), instances):
+                for instance in instances:
+                    instance.save(force_insert=True)
+            inserted = [instance for instance in instances if instance.id is not None]
+            run_batch_rules('post_save', model, inserted)
+        return inserted
+
+    using = connection.alias
+    with transaction.atomic():
+        run_batch_rules('pre_save', model, instances)
+        with _batch(('pre_save', 'post_save'), instances):
+            inserted = []
+            for instance in instances:
+                try:
+                    signals.pre_save.send(sender=model, instance=instance, raw=False, using=using, update_fields=None)
+                except AbortSave:
+                    continue
+                inserted.append(instance)
+
+            _insert_rows(model, inserted)
+
+            for instance in inserted:
+                signals.post_save.send(sender=model, instance=instance, created=True, update_fields=None, raw=False, using=using)
+        run_batch_rules('post_save', model, inserted)
+    return inserted
+
+def delete_batch(instances: Sequence[Model]) -> None:
+    "Delete the instances, which must be of one model, running the rules as save_batch does."
+    if not instances:
+        return
+    instances = list(instances)
+    model = _batch_model(instances)
+
+    with transaction.atomic():
+        run_batch_rules('pre_delete', model, instances)
+        with _batch(('pre_delete', 'post_delete'), instances):
+            for instance in instances:
+                instance.delete()
+        run_batch_rules('post_delete', model, instances)
+
+
+def _remove_batch_rules(signal: MODEL_SIGNAL, model_name: Optional[str], dispatch_uid: Hashable) -> None:
+    rules = batch_rules.get((signal, model_name), [])
+    rules[:] = [(uid, rule) for uid, rule in rules if uid != dispatch_uid]
+
 def disconnect_signal(signal: MODEL_SIGNAL, model_name: Optional[str] = None, dispatch_uid: Optional[Hashable] = None) -> bool:
     fetched_signal = getattr(signals, signal)
     django_model = None if model_name is None else getattr(models, model_name)
-    return fetched_signal.disconnect(
+    disconnected = fetched_signal.disconnect(
         sender=django_model, dispatch_uid=dispatch_uid)
+    if disconnected and dispatch_uid is not None:
+        _remove_batch_rules(signal, model_name, dispatch_uid)
+    return disconnected
 
 def connect_signal(signal: MODEL_SIGNAL, callback: Callable, model_name: Optional[str] = None, dispatch_uid: Optional[Hashable] = None):
     fetched_signal = getattr(signals, signal)
     django_model = None if model_name is None else getattr(models, model_name)
-    return fetched_signal.connect(callback, sender=django_model, dispatch_uid=dispatch_uid)
\ No newline at end of file
+    batch = getattr(callback, 'batch', None)
+    if batch is not None:
+        if dispatch_uid is not None:
+            _remove_batch_rules(signal, model_name, dispatch_uid)
+        batch_rules.setdefault((signal, model_name), []).append((dispatch_uid, batch))
+    return fetched_signal.connect(callback, sender=django_model, dispatch_uid=dispatch_uid)
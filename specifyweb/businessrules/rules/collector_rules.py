@@ -1,9 +1,34 @@
+from typing import Dict, List
+
 from django.db.models import Max
 from specifyweb.businessrules.orm_signal_handler import orm_signal_handler
 from specifyweb.specify.models import Collector
 
 
-@orm_signal_handler('pre_save', 'Collector')
+def collectors_pre_save(collectors: List[Collector]) -> None:
+    to_number = [c for c in collectors if c.id is None and c.ordernumber is None]
+    if not to_number:
+        return
+
+    event_ids = set(c.collectingevent_id for c in collectors)
+    others = Collector.objects.filter(collectingevent__in=[e for e in event_ids if e is not None])
+    if None in event_ids:
+        others = others | Collector.objects.filter(collectingevent=None)
+
+    # the order numbers of the collectors of each event as the
+    # collectors are saved one after the other
+    ordernumbers: Dict = {}
+    for collector_id, event_id, ordernumber in others.values_list('id', 'collectingevent_id', 'ordernumber'):
+        ordernumbers.setdefault(event_id, {})[collector_id] = ordernumber
+
+    for collector in collectors:
+        event = ordernumbers.setdefault(collector.collectingevent_id, {})
+        if collector.id is None and collector.ordernumber is None:
+            numbers = [n for n in event.values() if n is not None]
+            collector.ordernumber = max(numbers) + 1 if numbers else 0
+        event[collector.id if collector.id is not None else object()] = collector.ordernumber
+
+@orm_signal_handler('pre_save', 'Collector', batch=collectors_pre_save)
 def collector_pre_save(collector):
     if collector.id is None:
         if collector.ordernumber is None:
@@ -1,9 +1,63 @@
+from typing import Dict, List, Optional
+
 from specifyweb.businessrules.orm_signal_handler import orm_signal_handler
 
-from specifyweb.specify.models import Determination, Taxon
+from specifyweb.specify.models import Collectionobject, Determination, Taxon
+
+
+def preferred_taxon_id(taxon_id: int, accepted: Dict[int, Optional[int]]) -> int:
+    """Follow the accepted taxa of taxon_id, given by accepted, to the
+    taxon that is not synonymized.
+    """
+    acceptedtaxon_id = accepted[taxon_id]
+    limit = 100
+    while acceptedtaxon_id is not None:
+        if acceptedtaxon_id == taxon_id:
+            break
+        limit -= 1
+        if not limit > 0:
+            raise AssertionError(f"Could not find accepted taxon for synonymized taxon (id ='{taxon_id}')", {
+                                 "taxonId": taxon_id, "localizationKey": "limitReachedDeterminingAccepted"})
+        taxon_id = acceptedtaxon_id
+        acceptedtaxon_id = accepted[taxon_id]
+    return taxon_id
+
+def accepted_taxa(taxon_ids) -> Dict[int, Optional[int]]:
+    "The accepted taxa of taxon_ids and of those in turn, locking them."
+    accepted: Dict[int, Optional[int]] = {}
+    to_fetch = set(taxon_ids)
+    # bounded like preferred_taxon_id, which raises for longer chains
+    for _ in range(101):
+        if not to_fetch:
+            break
+        fetched = dict(Taxon.objects.select_for_update().filter(
+            id__in=to_fetch).values_list('id', 'acceptedtaxon_id'))
+        missing = to_fetch - fetched.keys()
+        if missing:
+            raise Taxon.DoesNotExist(f"Taxon matching query does not exist: {sorted(missing)}")
+        accepted.update(fetched)
+        to_fetch = set(a for a in fetched.values() if a is not None) - accepted.keys()
+    return accepted
+
+def determinations_pre_save(dets: List[Determination]) -> None:
+    missing_member = [det for det in dets if det.collectionmemberid is None]
+    if missing_member:
+        memberids = dict(Collectionobject.objects.filter(
+            id__in=set(det.collectionobject_id for det in missing_member)
+        ).values_list('id', 'collectionmemberid'))
+        for det in missing_member:
+            if det.collectionobject_id not in memberids:
+                raise Collectionobject.DoesNotExist()
+            det.collectionmemberid = memberids[det.collectionobject_id]
 
+    accepted = accepted_taxa(det.taxon_id for det in dets if det.taxon_id is not None)
+    for det in dets:
+        if det.taxon_id is None:
+            det.preferredtaxon = None
+        else:
+            det.preferredtaxon_id = preferred_taxon_id(det.taxon_id, accepted)
 
-@orm_signal_handler('pre_save', 'Determination')
+@orm_signal_handler('pre_save', 'Determination', batch=determinations_pre_save)
 def determination_pre_save(det):
     if det.collectionmemberid is None:
         det.collectionmemberid = det.collectionobject.collectionmemberid
@@ -12,24 +66,21 @@ def determination_pre_save(det):
     if taxon_id is None:
         det.preferredtaxon = None
     else:
-        acceptedtaxon_id = Taxon.objects.select_for_update().values_list(
-            'acceptedtaxon_id', flat=True).get(id=taxon_id)
-        limit = 100
-        while acceptedtaxon_id is not None:
-            if acceptedtaxon_id == taxon_id:
-                break
-            limit -= 1
-            if not limit > 0:
-                raise AssertionError(f"Could not find accepted taxon for synonymized taxon (id ='{taxon_id}')", {
-                                     "taxonId": taxon_id, "localizationKey": "limitReachedDeterminingAccepted"})
-            taxon_id = acceptedtaxon_id
-            acceptedtaxon_id = Taxon.objects.select_for_update().values_list(
-                'acceptedtaxon_id', flat=True).get(id=taxon_id)
-
-        det.preferredtaxon_id = taxon_id
-
-
-@orm_signal_handler('pre_save', 'Determination')
+        det.preferredtaxon_id = preferred_taxon_id(taxon_id, accepted_taxa([taxon_id]))
+
+
+def only_one_determination_iscurrent_batch(dets: List[Determination]) -> None:
+    # as when they are saved one by one, the last of the current
+    # determinations of a collection object stays current
+    last_current = {det.collectionobject_id: det for det in dets if det.iscurrent}
+    for det in dets:
+        if det.iscurrent and last_current[det.collectionobject_id] is not det:
+            det.iscurrent = False
+    if last_current:
+        Determination.objects.filter(
+            collectionobject__in=last_current.keys()).update(iscurrent=False)
+
+@orm_signal_handler('pre_save', 'Determination', batch=only_one_determination_iscurrent_batch)
 def only_one_determination_iscurrent(determination):
     if determination.iscurrent:
         Determination.objects.filter(
@@ -1,5 +1,9 @@
+from math import prod
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
 from specifyweb.businessrules.orm_signal_handler import orm_signal_handler
 from specifyweb.businessrules.exceptions import BusinessRuleException
+from specifyweb.specify.models import Exchangeoutprep, Giftpreparation, Loanpreparation, Preparation
 from django.db import connection
 
 
@@ -27,51 +31,137 @@ def get_availability(prep, iprepid, iprepid_fld):
         return row[0]
 
 
-@orm_signal_handler('pre_save', 'Loanpreparation')
+def loan_term(lp) -> Optional[int]:
+    return None if lp.quantity is None or lp.quantityresolved is None else lp.quantity - lp.quantityresolved
+
+def quantity_term(ip) -> Optional[int]:
+    return ip.quantity
+
+# the id fields of the interaction preparations get_availability
+# subtracts the quantities of, with their models, the terms and the
+# fields the terms are computed from
+AVAILABILITY_TERMS = {
+    'loanpreparationid': (Loanpreparation, loan_term, ('quantity', 'quantityresolved')),
+    'giftpreparationid': (Giftpreparation, quantity_term, ('quantity',)),
+    'exchangeoutprepid': (Exchangeoutprep, quantity_term, ('quantity',)),
+}
+
+def availability_terms(prep_ids: Iterable[int]) -> Dict[str, Dict[int, Dict[Any, Optional[int]]]]:
+    """The terms get_availability subtracts from the counts of the
+    preparations prep_ids, by the id field of the interaction
+    preparations they come from, preparation and interaction
+    preparation id.
+    """
+    prep_ids = list(prep_ids)
+    terms: Dict[str, Dict[int, Dict[Any, Optional[int]]]] = {}
+    for iprepid_fld, (model, term, fields) in AVAILABILITY_TERMS.items():
+        by_prep = terms[iprepid_fld] = {}
+        for ip in model.objects.filter(preparation_id__in=prep_ids).only('id', 'preparation_id', *fields):
+            by_prep.setdefault(ip.preparation_id, {})[ip.id] = term(ip)
+    return terms
+
+def availability_from_terms(countamt, terms: Dict[str, Dict[Any, Optional[int]]], iprepid, iprepid_fld) -> Optional[int]:
+    """What get_availability returns for a preparation with count
+    countamt and the given terms of its interaction preparations.
+    The query joins the interaction preparations of the three kinds,
+    so each term is subtracted once for every combination with the
+    interaction preparations of the other kinds.
+    """
+    counts = {}
+    sums = {}
+    for field, values in terms.items():
+        items = list(values.items()) or [(None, None)]
+        if iprepid is not None and field == iprepid_fld:
+            items = [(i, v) for i, v in items if i is not None and i != iprepid]
+        counts[field] = len(items)
+        sums[field] = sum(v for _, v in items if v is not None)
+
+    rows = prod(counts.values())
+    if rows == 0:
+        return countamt
+    if countamt is None:
+        return None
+    return countamt - sum(sums[field] * (rows // counts[field]) for field in terms)
+
+def availability_batch(iprepid_fld: str, check: Callable[[Any, Any], None]) -> Callable[[List], None]:
+    """A set-based implementation of the availability rule of the
+    interaction preparations with id field iprepid_fld, which is
+    check(ipreparation, available).
+    """
+    _, term, __ = AVAILABILITY_TERMS[iprepid_fld]
+
+    def rule(ipreparations: List) -> None:
+        ipreparations = [ip for ip in ipreparations if ip.preparation_id is not None]
+        if not ipreparations:
+            return
+        prep_ids = set(ip.preparation_id for ip in ipreparations)
+        countamts = dict(Preparation.objects.filter(id__in=prep_ids).values_list('id', 'countamt'))
+        terms = availability_terms(prep_ids)
+
+        # the interaction preparations are saved one after the other,
+        # each seeing the ones before it with their new quantities
+        for ip in ipreparations:
+            prep_terms = {field: by_prep.setdefault(ip.preparation_id, {}) for field, by_prep in terms.items()}
+            check(ip, availability_from_terms(countamts.get(ip.preparation_id), prep_terms, ip.id, iprepid_fld) or 0)
+            prep_terms[iprepid_fld][ip.id if ip.id is not None else object()] = term(ip)
+
+    return rule
+
+
+def check_loanprep_availability(ipreparation, available):
+    quantity = ipreparation.quantity or 0
+    quantityresolved = ipreparation.quantityresolved or 0
+    if available < (quantity - quantityresolved):
+        raise BusinessRuleException(
+            f"loan preparation quantity exceeds availability ({ipreparation.id}: {quantity - quantityresolved} {available})",
+            {"table": "LoanPreparation",
+             "fieldName": "quantity",
+             "preparationid": ipreparation.id,
+             "quantity": quantity,
+             "quantityresolved": quantityresolved,
+             "available": available})
+
+@orm_signal_handler('pre_save', 'Loanpreparation', batch=availability_batch('loanpreparationid', check_loanprep_availability))
 def loanprep_quantity_must_be_lte_availability(ipreparation):
     if ipreparation.preparation is not None:
         available = get_availability(
             ipreparation.preparation, ipreparation.id, "loanpreparationid") or 0
-        quantity = ipreparation.quantity or 0
-        quantityresolved = ipreparation.quantityresolved or 0
-        if available < (quantity - quantityresolved):
-            raise BusinessRuleException(
-                f"loan preparation quantity exceeds availability ({ipreparation.id}: {quantity - quantityresolved} {available})",
-                {"table": "LoanPreparation",
-                 "fieldName": "quantity",
-                 "preparationid": ipreparation.id,
-                 "quantity": quantity,
-                 "quantityresolved": quantityresolved,
-                 "available": available})
-
-
-@orm_signal_handler('pre_save', 'Giftpreparation')
+        check_loanprep_availability(ipreparation, available)
+
+
+def check_giftprep_availability(ipreparation, available):
+    quantity = ipreparation.quantity or 0
+    if available < quantity:
+        raise BusinessRuleException(
+            f"gift preparation quantity exceeds availability ({ipreparation.id}: {quantity} {available})",
+            {"table": "GiftPreparation",
+             "fieldName": "quantity",
+             "preparationid": ipreparation.id,
+             "quantity": quantity,
+             "available": available})
+
+@orm_signal_handler('pre_save', 'Giftpreparation', batch=availability_batch('giftpreparationid', check_giftprep_availability))
 def giftprep_quantity_must_be_lte_availability(ipreparation):
     if ipreparation.preparation is not None:
         available = get_availability(
             ipreparation.preparation, ipreparation.id, "giftpreparationid") or 0
-        quantity = ipreparation.quantity or 0
-        if available < quantity:
-            raise BusinessRuleException(
-                f"gift preparation quantity exceeds availability ({ipreparation.id}: {quantity} {available})",
-                {"table": "GiftPreparation",
-                 "fieldName": "quantity",
-                 "preparationid": ipreparation.id,
-                 "quantity": quantity,
-                 "available": available})
-
-
-@orm_signal_handler('pre_save', 'Exchangeoutprep')
+        check_giftprep_availability(ipreparation, available)
+
+
+def check_exchangeoutprep_availability(ipreparation, available):
+    quantity = ipreparation.quantity or 0
+    if available < quantity:
+        raise BusinessRuleException(
+            "exchangeout preparation quantity exceeds availability ({ipreparation.id}: {quantity} {available})",
+            {"table": "ExchangeOutPrep",
+             "fieldName": "quantity",
+             "preparationid": ipreparation.id,
+             "quantity": quantity,
+             "available": available})
+
+@orm_signal_handler('pre_save', 'Exchangeoutprep', batch=availability_batch('exchangeoutprepid', check_exchangeoutprep_availability))
 def exchangeoutprep_quantity_must_be_lte_availability(ipreparation):
     if ipreparation.preparation is not None:
         available = get_availability(
             ipreparation.preparation, ipreparation.id, "exchangeoutprepid") or 0
-        quantity = ipreparation.quantity or 0
-        if available < quantity:
-            raise BusinessRuleException(
-                "exchangeout preparation quantity exceeds availability ({ipreparation.id}: {quantity} {available})",
-                {"table": "ExchangeOutPrep",
-                 "fieldName": "quantity",
-                 "preparationid": ipreparation.id,
-                 "quantity": quantity,
-                 "available": available})
+        check_exchangeoutprep_availability(ipreparation, available)
@@ -3,6 +3,7 @@ from unittest import skip
 from specifyweb.specify import models
 from specifyweb.specify.api_tests import ApiTests
 from ..exceptions import BusinessRuleException
+from ..orm_signal_handler import save_batch
 
 class CollectorTests(ApiTests):
     def test_agent_unique_in_collecting_event(self):
@@ -22,6 +23,31 @@ class CollectorTests(ApiTests):
                 division=self.division,
                 agent=self.agent)
 
+    def test_ordernumbers_in_batch(self):
+        collectingevent = models.Collectingevent.objects.create(
+            discipline=self.discipline)
+
+        collectingevent.collectors.create(
+            isprimary=True,
+            ordernumber=0,
+            division=self.division,
+            agent=self.agent)
+
+        collectors = [
+            models.Collector(
+                collectingevent=collectingevent,
+                isprimary=False,
+                division=self.division,
+                agent=models.Agent.objects.create(
+                    agenttype=0,
+                    firstname="",
+                    lastname=f"collector {i}",
+                    division=self.division))
+            for i in range(2)]
+
+        save_batch(collectors)
+        self.assertEqual([c.ordernumber for c in collectors], [1, 2])
+
     @skip("business rule removed in https://github.com/specify/specify7/issues/327")
     def test_division_cannot_be_null(self):
         collectingevent = models.Collectingevent.objects.create(
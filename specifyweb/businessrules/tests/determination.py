@@ -1,4 +1,6 @@
+from specifyweb.specify import models
 from specifyweb.specify.api_tests import ApiTests
+from ..orm_signal_handler import save_batch
 
 class DeterminationTests(ApiTests):
     def test_only_one_determination_iscurrent(self):
@@ -11,6 +13,18 @@ class DeterminationTests(ApiTests):
         d2.save()
         self.assertEqual(determinations.get(iscurrent=True).id, d2.id)
 
+    def test_only_one_determination_iscurrent_in_batch(self):
+        co = self.collectionobjects[0]
+        co.determinations.create(iscurrent=True)
+        dets = [
+            models.Determination(collectionobject=co, iscurrent=True),
+            models.Determination(collectionobject=co, iscurrent=False),
+            models.Determination(collectionobject=co, iscurrent=True),
+        ]
+        save_batch(dets)
+        self.assertEqual(co.determinations.get(iscurrent=True).id, dets[2].id)
+        self.assertEqual(dets[0].collectionmemberid, co.collectionmemberid)
+
     def test_iscurrent_doesnt_interfere_across_colleciton_objects(self):
         for co in self.collectionobjects:
             co.determinations.create(iscurrent=True)
@@ -124,3 +124,72 @@ class UniquenessTests(ApiTests):
                 division=self.division,
                 text1="test",
             )
+
+    def test_batch_check(self):
+        from specifyweb.businessrules.uniqueness_rules import check_unique_batch
+
+        new = [
+            models.Collectionobject(collection=self.collection, catalognumber="batch-1"),
+            models.Collectionobject(collection=self.collection, catalognumber="batch-2"),
+        ]
+        check_unique_batch(models.Collectionobject, new)
+
+        existing = models.Collectionobject(collection=self.collection, catalognumber="NUM-0 ")
+        with self.assertRaises(BusinessRuleException) as context:
+            check_unique_batch(models.Collectionobject, [*new, existing])
+        self.assertEqual([self.collectionobjects[0].id], context.exception.args[1]['conflicting'])
+
+        # the database decides which values are the same
+        with self.assertRaises(BusinessRuleException) as context:
+            check_unique_batch(models.Collectionobject, [
+                *new,
+                models.Collectionobject(collection=self.collection, catalognumber="num-0"),
+            ])
+        self.assertEqual([self.collectionobjects[0].id], context.exception.args[1]['conflicting'])
+
+        # records are not in conflict with themselves
+        check_unique_batch(models.Collectionobject, self.collectionobjects)
+
+    def test_batch_conflicts_within_batch(self):
+        from specifyweb.businessrules.orm_signal_handler import save_batch
+
+        batch = [
+            models.Collectionobject(collection=self.collection, catalognumber="batch-1"),
+            models.Collectionobject(collection=self.collection, catalognumber="batch-2"),
+            models.Collectionobject(collection=self.collection, catalognumber="BATCH-1"),
+        ]
+        with self.assertRaises(BusinessRuleException) as context:
+            save_batch(batch)
+        self.assertEqual([batch[0].id], context.exception.args[1]['conflicting'])
+        self.assertFalse(models.Collectionobject.objects.filter(
+            catalognumber__in=["batch-1", "batch-2"]).exists())
+
+    def test_disconnected_rules_skipped_in_batch(self):
+        from specifyweb.businessrules.orm_signal_handler import connect_signal, disconnect_signal, save_batch
+        from specifyweb.businessrules.uniqueness_rules import UNIQUENESS_DISPATCH_UID, check_unique
+
+        rule = UniquenessRule.objects.create(
+            discipline=self.discipline, modelName="Collectionobject", isDatabaseConstraint=False)
+        rule.fields.set(["text1"])
+        models.Collectionobject.objects.create(collection=self.collection, catalognumber="num-new", text1="test")
+
+        disconnect_signal('pre_save', None, dispatch_uid=UNIQUENESS_DISPATCH_UID)
+        try:
+            save_batch([models.Collectionobject(collection=self.collection, catalognumber="num-other", text1="test")])
+        finally:
+            connect_signal('pre_save', check_unique, None, dispatch_uid=UNIQUENESS_DISPATCH_UID)
+
+        with self.assertRaises(BusinessRuleException):
+            save_batch([models.Collectionobject(collection=self.collection, catalognumber="num-third", text1="test")])
+
+    def test_rule_registry_invalidated(self):
+        models.Collectionobject.objects.create(collection=self.collection, catalognumber="num-new", text1="test")
+
+        UniquenessRule.objects.filter(modelName="Collectionobject").delete()
+        models.Collectionobject.objects.create(collection=self.collection, catalognumber="num-new")
+
+        rule = UniquenessRule.objects.create(
+            discipline=self.discipline, modelName="Collectionobject", isDatabaseConstraint=False)
+        rule.fields.set(["text1"])
+        with self.assertRaises(BusinessRuleException):
+            models.Collectionobject.objects.create(collection=self.collection, text1="test")
@@ -1,18 +1,21 @@
 from functools import reduce
 import logging
 import json
-from typing import Dict, List, Union, Iterable
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union, Iterable
 
-from django.db import connections
+from django.db import connection
 from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import IntegerField, Value, signals
 from django.core.exceptions import ObjectDoesNotExist
 from specifyweb.specify import models
 from specifyweb.specify.datamodel import datamodel
 from specifyweb.middleware.general import serialize_django_obj
 from specifyweb.specify.scoping import in_same_scope
-from .orm_signal_handler import orm_signal_handler
+from .orm_signal_handler import batch_rule, orm_signal_handler
 from .exceptions import BusinessRuleException
-from .models import UniquenessRule
+from .models import UniquenessRule, UniquenessRule_Field
 
 DEFAULT_UNIQUENESS_RULES:  Dict[str, List[Dict[str, Union[List[List[str]], bool]]]] = json.load(
     open('specifyweb/businessrules/uniqueness_rules.json'))
@@ -26,89 +29,241 @@ NO_FIELD_VALUE = {}
 logger = logging.getLogger(__name__)
 
 
-@orm_signal_handler('pre_save', None, dispatch_uid=UNIQUENESS_DISPATCH_UID)
+class CompiledRule(NamedTuple):
+    rule: UniquenessRule
+    # the lower cased paths of the fields that must be unique
+    field_names: List[str]
+    # the path of the field the values must be unique within, if any
+    scope: Optional[str]
+    is_global: bool
+
+    @property
+    def all_fields(self) -> List[str]:
+        return self.field_names if self.scope is None else [*self.field_names, self.scope.lower()]
+
+    def applies_to(self, instance) -> bool:
+        return self.is_global or in_same_scope(self.rule, instance)
+
+    def get_matchable(self, instance):
+        """The field lookups and values for the records conflicting with
+        instance, or None if the rule does not constrain instance.
+        """
+        model_name = instance.__class__.__name__
+
+        def best_match_or_none(field_name: str):
+            try:
+                return field_path_with_value(instance, model_name, field_name, NO_FIELD_VALUE)
+            except ObjectDoesNotExist:
+                pass
+            return None
+
+        matchable = {}
+        field_map = {}
+        for field in self.all_fields:
+            matched_or_none = best_match_or_none(field)
+            if matched_or_none is not None:
+                field_map[field] = matched_or_none[0]
+                matchable[matched_or_none[0]] = matched_or_none[1]
+
+        if len(matchable.keys()) == 0 or set(self.all_fields) != set(field_map.keys()):
+            return None
+        return field_map, matchable
+
+    def get_exception(self, model_name, conflicting_ids, matchable, field_map):
+        error_message = '{} must have unique {}'.format(model_name,
+                                                        join_with_and(self.field_names))
+
+        response = {"table": model_name,
+                    "localizationKey": "fieldNotUnique"
+                    if self.scope is None
+                    else "childFieldNotUnique",
+                    "fieldName": ','.join(self.field_names),
+                    "fieldData": serialize_multiple_django(matchable, field_map, self.field_names),
+                    }
+
+        if self.scope is not None:
+            error_message += ' in {}'.format(self.scope.lower())
+            response.update({
+                "parentField": self.scope,
+                "parentData": serialize_multiple_django(matchable, field_map, [self.scope.lower()])
+            })
+        response['conflicting'] = list(conflicting_ids[:100])
+        return BusinessRuleException(error_message, response)
+
+# How often other processes' changes to the rules are looked for, in
+# seconds. Changes made in this process are seen immediately.
+RULES_RECHECK_INTERVAL = 5
+
+RULES_VERSION_SQL = """
+select
+  (select count(*) from uniquenessrule), (select max(uniquenessruleid) from uniquenessrule),
+  (select count(*) from uniquenessrule_fields), (select max(uniquenessrule_fieldid) from uniquenessrule_fields)
+"""
+
+_rules_lock = threading.Lock()
+_rules: Optional[Dict[str, List[CompiledRule]]] = None
+_rules_version: Optional[Tuple] = None
+_rules_checked_at = 0.0
+_migration_applied = False
+
+def rules_version() -> Tuple:
+    with connection.cursor() as cursor:
+        cursor.execute(RULES_VERSION_SQL)
+        return tuple(cursor.fetchone())
+
+def load_rules() -> Dict[str, List[CompiledRule]]:
+    fields_by_rule: Dict[int, List[UniquenessRule_Field]] = {}
+    for field in UniquenessRule_Field.objects.order_by('uniquenessrule_fieldid'):
+        fields_by_rule.setdefault(field.uniquenessrule_id, []).append(field)
+
+    rules: Dict[str, List[CompiledRule]] = {}
+    for rule in UniquenessRule.objects.select_related('discipline').order_by('id'):
+        fields = fields_by_rule.get(rule.id, [])
+        scopes = [field.fieldPath for field in fields if field.isScope]
+        rules.setdefault(rule.modelName, []).append(CompiledRule(
+            rule=rule,
+            field_names=[field.fieldPath.lower() for field in fields if not field.isScope],
+            scope=scopes[0] if scopes else None,
+            is_global=rule_is_global(tuple(scopes)),
+        ))
+    return rules
+
+def migration_applied() -> bool:
+    "Whether the uniqueness rule tables exist yet."
+    global _migration_applied
+    if not _migration_applied:
+        _migration_applied = MigrationRecorder.Migration.objects.filter(
+            app='businessrules', name='0001_initial').exists()
+    return _migration_applied
+
+def uniqueness_rules_for(model_name: str) -> List[CompiledRule]:
+    "The uniqueness rules of model_name, from the in-process registry."
+    global _rules, _rules_version, _rules_checked_at
+    if not migration_applied():
+        return []
+
+    with _rules_lock:
+        if _rules is not None and time.monotonic() - _rules_checked_at < RULES_RECHECK_INTERVAL:
+            return _rules.get(model_name, [])
+
+    version = rules_version()
+    with _rules_lock:
+        if _rules is None or version != _rules_version:
+            _rules = load_rules()
+            _rules_version = version
+        _rules_checked_at = time.monotonic()
+        return _rules.get(model_name, [])
+
+def clear_rules() -> None:
+    global _rules
+    with _rules_lock:
+        _rules = None
+
+def rules_changed(sender, **kwargs) -> None:
+    clear_rules()
+
+for _model in (UniquenessRule, UniquenessRule_Field):
+    signals.post_save.connect(rules_changed, sender=_model, dispatch_uid=f'uniqueness_rules_{_model.__name__}_save')
+    signals.post_delete.connect(rules_changed, sender=_model, dispatch_uid=f'uniqueness_rules_{_model.__name__}_delete')
+
+
+def constrained_instances(model_name: str, instances: Sequence) -> Iterable[Tuple[CompiledRule, List[Tuple[int, Any, Dict, Dict]]]]:
+    """The uniqueness rules of model_name with the instances each of them
+    constrains, as (position, instance, field_map, matchable), going
+    through the rules as check_unique does for each instance.
+    """
+    # check_unique stops at the first rule that does not constrain an instance
+    unconstrained = set()
+
+    for rule in uniqueness_rules_for(model_name):
+        to_check = []
+        for position, instance in enumerate(instances):
+            if position in unconstrained or not rule.applies_to(instance):
+                continue
+            match_result = rule.get_matchable(instance)
+            if match_result is None:
+                unconstrained.add(position)
+                continue
+            to_check.append((position, instance, *match_result))
+        if to_check:
+            yield rule, to_check
+
+# Number of instances whose matching records are found by one query.
+MATCH_BATCH_SIZE = 100
+
+def matching_records(model, to_check: List[Tuple[int, Any, Dict, Dict]]) -> Dict[int, List[int]]:
+    """The ids of the records matching each of to_check, by position.
+    The records are matched by the database, with one tagged subquery
+    per instance, so values compare as the collations of the columns
+    have them.
+    """
+    matches: Dict[int, List[int]] = {}
+    for start in range(0, len(to_check), MATCH_BATCH_SIZE):
+        queries = [
+            model.objects.filter(**matchable).order_by()
+            .annotate(position=Value(position, output_field=IntegerField()))
+            .values_list('position', 'id')
+            for position, _, __, matchable in to_check[start:start + MATCH_BATCH_SIZE]
+        ]
+        for position, record_id in queries[0].union(*queries[1:], all=True):
+            matches.setdefault(position, []).append(record_id)
+    return matches
+
+def check_unique_batch(model, instances: Sequence) -> None:
+    """Check the uniqueness rules for instances of model about to be
+    saved together against the existing records, as check_unique does
+    for each of them, with one query per rule and batch of instances.
+    Conflicts between the instances themselves are found once they are
+    saved, by check_unique_saved_batch.
+    """
+    if not instances:
+        return
+    model_name = model.__name__
+
+    for rule, to_check in constrained_instances(model_name, instances):
+        matches = matching_records(model, to_check)
+        for position, instance, field_map, matchable in to_check:
+            conflicting_ids = [record_id for record_id in matches.get(position, []) if record_id != instance.id]
+            if conflicting_ids:
+                raise rule.get_exception(model_name, conflicting_ids, matchable, field_map)
+
+@batch_rule('post_save', None, dispatch_uid=UNIQUENESS_DISPATCH_UID)
+def check_unique_saved_batch(model, instances: Sequence) -> None:
+    """Check the uniqueness rules between instances of model saved
+    together by save_batch. As when they are saved one by one, an
+    instance conflicts with the instances saved before it.
+    """
+    model_name = model.__name__
+    positions = {instance.id: position for position, instance in enumerate(instances)}
+
+    for rule, to_check in constrained_instances(model_name, instances):
+        matches = matching_records(model, to_check)
+        for position, instance, field_map, matchable in to_check:
+            conflicting_ids = [
+                record_id for record_id in matches.get(position, [])
+                if record_id in positions and positions[record_id] < position
+            ]
+            if conflicting_ids:
+                raise rule.get_exception(model_name, conflicting_ids, matchable, field_map)
+
+@orm_signal_handler('pre_save', None, batch=check_unique_batch, dispatch_uid=UNIQUENESS_DISPATCH_UID)
 def check_unique(model, instance):
     model_name = instance.__class__.__name__
-    rules = UniquenessRule.objects.filter(modelName=model_name)
-    applied_migrations = MigrationRecorder(
-        connections['default']).applied_migrations()
-
-    for migration in applied_migrations:
-        app, migration_name = migration
-        if app == 'businessrules' and migration_name == '0001_initial':
-            break
-    else:
-        return
 
-    for rule in rules:
-        if not rule_is_global(tuple(field.fieldPath for field in rule.fields.filter(isScope=True))) and not in_same_scope(rule, instance):
+    for rule in uniqueness_rules_for(model_name):
+        if not rule.applies_to(instance):
             continue
 
-        field_names = [
-            field.fieldPath.lower() for field in rule.fields.filter(isScope=False)]
-
-        _scope = rule.fields.filter(isScope=True)
-        scope = None if len(_scope) == 0 else _scope[0]
-
-        all_fields = [*field_names]
-
-        if scope is not None:
-            all_fields.append(scope.fieldPath.lower())
-
-        def get_matchable(instance):
-            def best_match_or_none(field_name: str):
-                try:
-                    return field_path_with_value(instance, model_name, field_name, NO_FIELD_VALUE)
-                except ObjectDoesNotExist:
-                    pass
-                return None
-
-            matchable = {}
-            field_mapping = {}
-            for field in all_fields:
-                matched_or_none = best_match_or_none(field)
-                if matched_or_none is not None:
-                    field_mapping[field] = matched_or_none[0]
-                    matchable[matched_or_none[0]] = matched_or_none[1]
-
-            return field_mapping, matchable
-
-        def get_exception(conflicts, matchable, field_map):
-            error_message = '{} must have unique {}'.format(model_name,
-                                                            join_with_and(field_names))
-
-            response = {"table": model_name,
-                        "localizationKey": "fieldNotUnique"
-                        if scope is None
-                        else "childFieldNotUnique",
-                        "fieldName": ','.join(field_names),
-                        "fieldData": serialize_multiple_django(matchable, field_map, field_names),
-                        }
-
-            if scope is not None:
-                error_message += ' in {}'.format(scope.fieldPath.lower())
-                response.update({
-                    "parentField": scope.fieldPath,
-                    "parentData": serialize_multiple_django(matchable, field_map, [scope.fieldPath.lower()])
-                })
-            response['conflicting'] = list(
-                conflicts.values_list('id', flat=True)[:100])
-            return BusinessRuleException(error_message, response)
-
-        match_result = get_matchable(instance)
+        match_result = rule.get_matchable(instance)
         if match_result is None:
             return
 
         field_map, matchable = match_result
-        if len(matchable.keys()) == 0 or set(all_fields) != set(field_map.keys()):
-            return
-
         conflicts = model.objects.only('id').filter(**matchable)
         if instance.id is not None:
             conflicts = conflicts.exclude(id=instance.id)
         if conflicts:
-            raise get_exception(conflicts, matchable, field_map)
-
+            raise rule.get_exception(model_name, conflicts.values_list('id', flat=True), matchable, field_map)
 
 def field_path_with_value(instance, model_name, field_path, default):
     object_or_field = reduce(lambda obj, field: getattr(
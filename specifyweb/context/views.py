@@ -405,16 +405,10 @@ def app_resource(request):
 @cache_control(max_age=86400, private=True)
 def available_related_searches(request):
     """Return a list of the available 'related' express searches."""
-    from specifyweb.express_search import related_searches
-    from specifyweb.express_search.views import get_express_search_config
+    from specifyweb.express_search.views import get_express_search_config, active_related_searches
 
     express_search_config = get_express_search_config(request.specify_collection, request.specify_user)
-    active = [int(q.find('id').text)
-              for q in express_search_config.findall('relatedQueries/relatedquery')
-              if q.attrib.get('isactive', None) == 'true'  or q.find("[isActive='true']")]
-
-    result = [name for name in related_searches.__all__
-              if getattr(related_searches, name).id in active]
+    result = active_related_searches(express_search_config)
 
     return HttpResponse(json.dumps(result), content_type='application/json')
 
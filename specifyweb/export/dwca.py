@@ -1,3 +1,5 @@
+import csv
+import io
 import os
 import errno
 import logging
@@ -5,6 +7,8 @@ import re
 import shutil
 from tempfile import mkdtemp
 from collections import namedtuple
+from itertools import islice
+from zipfile import ZipFile
 from uuid import uuid4
 from datetime import date
 from django.utils.translation import gettext as _
@@ -12,9 +16,12 @@ from django.utils.translation import gettext as _
 from xml.etree import ElementTree as ET
 from xml.dom import minidom
 
-from specifyweb.stored_queries.execution import EphemeralField, query_to_csv
+from sqlalchemy import sql, Column, Index, MetaData, String, Table
+
+from specifyweb.stored_queries.execution import EphemeralField, build_query, query_to_csv, \
+    set_group_concat_max_len
 from specifyweb.stored_queries.queryfield import QueryField
-from specifyweb.stored_queries.models import session_context
+from specifyweb.stored_queries.models import session_context, models_by_tableid
 
 logger = logging.getLogger(__name__)
 ET.register_namespace('eml', 'eml://ecoinformatics.org/eml-2.1.1')
@@ -178,7 +185,23 @@ class ConstantField(namedtuple('ConstantField', 'value term')):
         return cls(value=node.attrib['value'], term=node.attrib['term'])
 
 
-def make_dwca(collection, user, definition, output_file, eml=None):
+def make_dwca(collection, user, definition, output_file, eml=None, progress=None, update=None):
+    """Write the DwCA described by definition to output_file. If given,
+    progress is called with the number of rows exported so far and an
+    estimate of the total, see estimate_rows.
+
+    The ids of the core records are loaded from the exported core rows
+    into a temporary table so that the extension queries are joined to
+    them in the database.
+
+    If update is given as a pair (previous_archive, since), only the
+    core records modified since the datetime since are exported again.
+    The rows of the other core records still selected by the core
+    queries are copied from the archive previous_archive, which must
+    have been made from the same definition. Changes to records of
+    other tables than the base tables of the core queries are not
+    picked up this way.
+    """
     output_dir = mkdtemp()
     try:
         element_tree = ET.fromstring(definition)
@@ -203,31 +226,165 @@ def make_dwca(collection, user, definition, output_file, eml=None):
         with open(os.path.join(output_dir, 'meta.xml'), 'w') as meta_xml:
             meta_xml.write(prettify(output_node))
 
-        core_ids = set()
-        def collect_ids(row):
-            core_ids.add(row[core_stanza.id_field_idx + 1])
-            return True
-
+        if update is not None and not all(
+                hasattr(models_by_tableid[query.tableid], 'timestampModified')
+                for query in core_stanza.queries
+        ):
+            logger.warning('core tables lack modification timestamps, exporting all records')
+            update = None
+
+        extension_queries = sum(len(stanza.queries) for stanza in extension_stanzas)
+        # the number of core records exported, once known
+        core_count = None
+        exported = 0
         with session_context() as session:
-            for query in core_stanza.queries:
-                path = os.path.join(output_dir, query.file_name)
-                query_to_csv(session, collection, user, query.tableid, query.get_field_specs(), path,
-                             strip_id=True, row_filter=collect_ids)
-
-            for stanza in extension_stanzas:
-                def filter_ids(row):
-                    return row[stanza.id_field_idx + 1] in core_ids
-
-                for query in stanza.queries:
-                    path = os.path.join(output_dir, query.file_name)
-                    query_to_csv(session, collection, user, query.tableid, query.get_field_specs(), path,
-                                 strip_id=True, row_filter=filter_ids)
+            core_ids = create_core_ids_table(session)
+            changed = create_core_ids_table(session) if update is not None else None
+            try:
+                if update is not None:
+                    # the core rows are only exported for the changed
+                    # records, so the ids of all of them are queried for
+                    previous_archive, since = update
+                    for query in core_stanza.queries:
+                        insert_core_ids(session, collection, user, query, core_stanza.id_field_idx, core_ids)
+                        insert_core_ids(session, collection, user, query, core_stanza.id_field_idx, changed, modified_since=since)
+                    changed_ids = {id for id, in session.execute(sql.select([changed.c.id]))}
+                    logger.info('exporting %d changed core records', len(changed_ids))
+                    core_count = len(changed_ids)
+
+                    def present_ids(ids):
+                        return {id for id, in session.execute(sql.select([core_ids.c.id]).where(core_ids.c.id.in_(ids)))}
+
+                for stanza in [core_stanza] + extension_stanzas:
+                    if update is not None:
+                        query_filter = core_id_filter(stanza.id_field_idx, changed)
+                    elif not stanza.is_core:
+                        query_filter = core_id_filter(stanza.id_field_idx, core_ids)
+                    else:
+                        query_filter = None
+
+                    for query in stanza.queries:
+                        fetched = 0
+                        def query_progress(current, total):
+                            nonlocal fetched
+                            fetched = current
+                            progress(exported + current, estimate_rows(
+                                exported + current, core_count,
+                                None if total is None else exported + total,
+                                extension_queries))
+
+                        path = os.path.join(output_dir, query.file_name)
+                        changed_path = path + '.changed' if update is not None else path
+                        query_to_csv(session, collection, user, query.tableid, query.get_field_specs(), changed_path,
+                                     strip_id=True, query_filter=query_filter,
+                                     progress=query_progress if progress is not None else None)
+                        exported += fetched
+
+                        if stanza.is_core and update is None:
+                            # the core ids are taken from the exported rows
+                            # instead of running the core query again
+                            load_core_ids(session, changed_path, stanza.id_field_idx, core_ids)
+
+                        if update is not None:
+                            copy_unchanged_rows(previous_archive, query.file_name, path, stanza.id_field_idx, changed_ids, present_ids)
+                            with open(changed_path, 'rb') as source, open(path, 'ab') as dest:
+                                shutil.copyfileobj(source, dest)
+                            os.remove(changed_path)
+
+                    if stanza.is_core and update is None:
+                        core_count = session.execute(
+                            sql.select([sql.func.count()]).select_from(core_ids)).scalar()
+            finally:
+                # the connection goes back to the pool with its temporary tables
+                core_ids.drop(session.connection())
+                if changed is not None:
+                    changed.drop(session.connection())
 
         basename = re.sub(r'\.zip$', '', output_file)
         shutil.make_archive(basename, 'zip', output_dir, logger=logger)
     finally:
         shutil.rmtree(output_dir)
 
+def estimate_rows(exported, core_count, core_estimate, extension_queries):
+    """Estimate the number of rows a DwCA export writes, given the rows
+    exported so far, assuming a row per core record from each extension
+    query. The number of core records is core_count once the core rows
+    are exported, and core_estimate, the estimated rows of the core
+    queries, before that. Returns None if neither is known.
+    """
+    core = core_count if core_count is not None else core_estimate
+    if core is None:
+        return None
+    return max(exported, core * (1 + extension_queries))
+
+def copy_unchanged_rows(previous_archive, file_name, path, id_field_idx, changed_ids, present_ids, batch_size=2000):
+    """Copy the rows of the file file_name in the DwCA previous_archive to
+    path, leaving out those for the core ids in changed_ids, which are
+    exported again, and those for ids missing from the result of
+    present_ids(ids), i.e. core records that were deleted or are no
+    longer selected.
+    """
+    with ZipFile(previous_archive, 'r') as archive, archive.open(file_name) as source, \
+         open(path, 'w', newline='', encoding='utf-8') as f:
+        reader = csv.reader(io.TextIOWrapper(source, encoding='utf-8', newline=''))
+        writer = csv.writer(f)
+        while True:
+            rows = list(islice(reader, batch_size))
+            if not rows:
+                break
+            batch = [row for row in rows if row[id_field_idx] not in changed_ids]
+            present = present_ids({row[id_field_idx] for row in batch}) if batch else set()
+            writer.writerows(row for row in batch if row[id_field_idx] in present)
+
+def create_core_ids_table(session):
+    """Create a temporary table on the connection of session to hold the
+    ids of the core records of an archive. Extension rows are only
+    exported for the ids in it.
+    """
+    name = 'dwca_core_ids_%s' % uuid4().hex
+    core_ids = Table(
+        name, MetaData(),
+        Column('id', String(1024)),
+        Index(name + '_id', 'id', mysql_length=255),
+        prefixes=['TEMPORARY'],
+    )
+    core_ids.create(session.connection())
+    return core_ids
+
+def insert_core_ids(session, collection, user, query, id_field_idx, core_ids, modified_since=None):
+    """Insert the ids of the records selected by the core query into
+    core_ids, on the server. If modified_since is given, only the ids of
+    the records modified since then are inserted.
+    """
+    set_group_concat_max_len(session)
+    built, __ = build_query(session, collection, user, query.tableid, query.get_field_specs(), replace_nulls=True)
+    if modified_since is not None:
+        built = built.filter(models_by_tableid[query.tableid].timestampModified >= modified_since)
+    id_expr = query_id_expr(built, id_field_idx)
+    session.execute(core_ids.insert().from_select(['id'], built.with_entities(id_expr).statement))
+
+def load_core_ids(session, path, id_field_idx, core_ids, batch_size=2000):
+    """Insert the ids of the core rows in the CSV file at path into
+    core_ids, batch_size rows at a time.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        while True:
+            rows = list(islice(reader, batch_size))
+            if not rows:
+                break
+            session.execute(core_ids.insert(), [{'id': row[id_field_idx]} for row in rows])
+
+def core_id_filter(id_field_idx, core_ids):
+    "Returns a query_filter for query_to_csv restricting extension rows to the ids in core_ids."
+    def query_filter(query):
+        return query.filter(query_id_expr(query, id_field_idx).in_(sql.select([core_ids.c.id])))
+    return query_filter
+
+def query_id_expr(query, id_field_idx):
+    "The expression of the id field of a query built with its record id column first."
+    return query.column_descriptions[id_field_idx + 1]['expr']
+
 def write_eml(source, output_path, pub_date=None, package_id=None):
     if pub_date is None:
         pub_date = date.today()
@@ -1,8 +1,10 @@
 import errno
+import hashlib
 import json
 import logging
 import os
 import time
+from datetime import datetime
 from xml.etree import ElementTree as ET
 
 from django.conf import settings
@@ -46,8 +48,16 @@ def update_feed(force=False, notify_user=None):
             user = Specifyuser.objects.get(id=item_node.attrib['userId'])
             dwca_def, _, __ = get_app_resource(collection, user, item_node.attrib['definition'])
             eml, _, __ = get_app_resource(collection, user, item_node.attrib['metadata'])
-            make_dwca(collection, user, dwca_def, temp_file, eml=eml)
+
+            started = datetime.now()
+            update = None
+            if not force and item_node.attrib.get('incremental', None) == 'true':
+                update = incremental_update(path, dwca_def)
+                logger.info('Updating incrementally: %s', update is not None)
+
+            make_dwca(collection, user, dwca_def, temp_file, eml=eml, update=update)
             os.rename(temp_file, path)
+            write_build_state(path, dwca_def, started)
 
             logger.info('Finished updating: %s', filename)
             if notify_user is not None:
@@ -59,6 +69,38 @@ def update_feed(force=False, notify_user=None):
         else:
             logger.info('No update needed: %s', filename)
 
+def build_state_path(path):
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, '.%s.state.json' % filename)
+
+def write_build_state(path, definition, started):
+    """Record when the archive at path was built from definition, so the
+    next build of an incremental feed item can start from there.
+    """
+    with open(build_state_path(path), 'w') as f:
+        json.dump({
+            'started': started.isoformat(),
+            'definition': hashlib.sha256(definition.encode('utf-8')).hexdigest(),
+        }, f)
+
+def incremental_update(path, definition):
+    """Returns the update argument to make_dwca for rebuilding the
+    archive at path from the records modified since it was built, or
+    None if it has to be built from scratch because it is missing or
+    was built from a different definition.
+    """
+    try:
+        with open(build_state_path(path)) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if not os.path.exists(path) or \
+       state['definition'] != hashlib.sha256(definition.encode('utf-8')).hexdigest():
+        return None
+
+    return path, datetime.fromisoformat(state['started'])
+
 def needs_update(path, days):
     try:
         mtime = os.path.getmtime(path)
@@ -0,0 +1,71 @@
+import json
+import os
+import traceback
+from typing import Optional
+
+from celery.utils.log import get_task_logger # type: ignore
+
+from django.conf import settings
+
+from specifyweb.celery_tasks import LogErrorsTask, app
+from specifyweb.notifications.exports import run_export
+from specifyweb.notifications.models import Message
+from specifyweb.specify import models
+
+from .dwca import make_dwca
+from .feed import update_feed
+
+Collection = getattr(models, 'Collection')
+Specifyuser = getattr(models, 'Specifyuser')
+
+logger = get_task_logger(__name__)
+
+@app.task(base=LogErrorsTask, bind=True)
+def dwca_export(self, export_id: int, collection_id: int, user_id: int, definition: str, eml: Optional[str], filename: str) -> None:
+
+    def progress(current: int, total: Optional[int]) -> None:
+        if not self.request.called_directly:
+            self.update_state(state='PROGRESS', meta={'current': current, 'total': total})
+
+    collection = Collection.objects.get(id=collection_id)
+    user = Specifyuser.objects.get(id=user_id)
+    path = os.path.join(settings.DEPOSITORY_DIR, filename)
+
+    def do_export() -> None:
+        try:
+            make_dwca(collection, user, definition, path, eml=eml, progress=progress)
+        except Exception as e:
+            tb = traceback.format_exc()
+            logger.error('make_dwca failed: %s', tb)
+            Message.objects.create(user=user, content=json.dumps({
+                'type': 'dwca-export-failed',
+                'exception': str(e),
+                'traceback': tb if settings.DEBUG else None,
+            }))
+            raise
+        else:
+            Message.objects.create(user=user, content=json.dumps({
+                'type': 'dwca-export-complete',
+                'file': filename
+            }))
+
+    run_export(export_id, do_export)
+
+@app.task(base=LogErrorsTask, bind=True)
+def force_update_feed(self, export_id: int, user_id: int) -> None:
+    user = Specifyuser.objects.get(id=user_id)
+
+    def do_update() -> None:
+        try:
+            update_feed(force=True, notify_user=user)
+        except Exception as e:
+            tb = traceback.format_exc()
+            logger.error('update_feed failed: %s', tb)
+            Message.objects.create(user=user, content=json.dumps({
+                'type': 'update-feed-failed',
+                'exception': str(e),
+                'traceback': tb if settings.DEBUG else None,
+            }))
+            raise
+
+    run_export(export_id, do_update)
@@ -14,3 +14,29 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+class CopyUnchangedRowsTest(TestCase):
+    def test_changed_and_missing_rows_left_out(self):
+        import os
+        from tempfile import mkdtemp
+        from zipfile import ZipFile
+        from .dwca import copy_unchanged_rows
+
+        directory = mkdtemp()
+        archive = os.path.join(directory, 'previous.zip')
+        with ZipFile(archive, 'w') as z:
+            z.writestr('occurrence.csv', 'a,1\r\nb,2\r\nc,3\r\nb,4\r\nd,"five, six"\r\n')
+
+        path = os.path.join(directory, 'occurrence.csv')
+        copy_unchanged_rows(archive, 'occurrence.csv', path, 0, {'b'}, lambda ids: ids - {'c'}, batch_size=2)
+
+        with open(path, newline='') as f:
+            self.assertEqual('a,1\r\nd,"five, six"\r\n', f.read())
+
+class EstimateRowsTest(TestCase):
+    def test_estimate(self):
+        from .dwca import estimate_rows
+        self.assertIsNone(estimate_rows(10, None, None, 2))
+        self.assertEqual(300, estimate_rows(10, None, 100, 2))
+        self.assertEqual(150, estimate_rows(10, 50, 100, 2))
+        self.assertEqual(200, estimate_rows(200, 50, None, 2))
@@ -1,24 +1,21 @@
 import errno
-import json
 import logging
 import os
-import traceback
 from datetime import datetime
 from email.utils import formatdate
-from threading import Thread
 from xml.etree import ElementTree as ET
 from zipfile import ZipFile
 
-from django.conf import settings
 from django.http import HttpResponse, HttpResponseBadRequest, Http404
 from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST, require_GET
 
-from .dwca import make_dwca, prettify
+from .dwca import prettify
 from .extract_query import extract_query as extract
-from .feed import FEED_DIR, get_feed_resource, update_feed
+from .feed import FEED_DIR, get_feed_resource
+from .tasks import dwca_export, force_update_feed
 from ..context.app_resource import get_app_resource
-from ..notifications.models import Message
+from ..notifications.exports import ExportLimitExceeded, start_export
 from ..permissions.permissions import PermissionTarget, PermissionTargetAction, \
     check_permission_targets
 from ..specify.models import Spquery
@@ -125,28 +122,12 @@ def export(request):
         eml = None
 
     filename = 'dwca_export_%s.zip' % datetime.now().isoformat()
-    path = os.path.join(settings.DEPOSITORY_DIR, filename)
 
-    def do_export():
-        try:
-            make_dwca(collection, user, definition, path, eml=eml)
-        except Exception as e:
-            tb = traceback.format_exc()
-            logger.error('make_dwca failed: %s', tb)
-            Message.objects.create(user=user, content=json.dumps({
-                'type': 'dwca-export-failed',
-                'exception': str(e),
-                'traceback': tb if settings.DEBUG else None,
-            }))
-        else:
-            Message.objects.create(user=user, content=json.dumps({
-                'type': 'dwca-export-complete',
-                'file': filename
-            }))
-
-    thread = Thread(target=do_export)
-    thread.daemon = True
-    thread.start()
+    try:
+        start_export(dwca_export, [collection.id, user.id, definition, eml, filename],
+                     user, collection, 'dwca', filename, 'dwca-export-starting')
+    except ExportLimitExceeded as e:
+        return HttpResponse(str(e), status=429, content_type='text/plain')
     return HttpResponse('OK', content_type='text/plain')
 
 class ExportFeedPT(PermissionTarget):
@@ -162,22 +143,11 @@ def force_update(request):
     """
     check_permission_targets(None, request.specify_user.id, [ExportFeedPT.force_update])
 
-    user = request.specify_user # I don't want to close over the entire request.
-    def try_update_feed():
-        try:
-            update_feed(force=True, notify_user=user)
-        except Exception as e:
-            tb = traceback.format_exc()
-            logger.error('update_feed failed: %s', tb)
-            Message.objects.create(user=user, content=json.dumps({
-                'type': 'update-feed-failed',
-                'exception': str(e),
-                'traceback': tb if settings.DEBUG else None,
-            }))
-
-    thread = Thread(target=try_update_feed)
-    thread.daemon = True
-    thread.start()
+    try:
+        start_export(force_update_feed, [request.specify_user.id],
+                     request.specify_user, None, 'feed', None, 'update-feed-starting')
+    except ExportLimitExceeded as e:
+        return HttpResponse(str(e), status=429, content_type='text/plain')
     return HttpResponse('OK', content_type='text/plain')
 
 @login_maybe_required
@@ -0,0 +1,137 @@
+"""
+Express search through MySQL FULLTEXT indexes.
+
+Matching text fields with LIKE, as Term.create_text_filter does, has to
+scan the whole table when the pattern starts with a wildcard. Where a
+search field has a FULLTEXT index of its own, the express search
+matches terms against the words of the field through the index
+instead. The indexes are maintained by the database, so they stay up
+to date however the records are written.
+
+The indexes are not part of the schema. They are created for the text
+search fields of the ExpressSearchConfig resources by the
+express_search_fulltext_index management command and are picked up by
+running servers within FULLTEXT_INDEX_REFRESH seconds.
+
+With an index, a term matches whole words: 'term' and 'term*' are still
+required to match the field as with LIKE, but '*term*' matches fields
+with a word starting with 'term' rather than containing it anywhere.
+Suffix searches, '*term', and terms with words the index does not hold,
+being too short or stopwords, are still matched with LIKE.
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import FrozenSet, Optional, Tuple
+
+from django.db import DatabaseError, connection
+from sqlalchemy.sql.expression import and_
+
+logger = logging.getLogger(__name__)
+
+FULLTEXT_INDEX_REFRESH = 300
+
+INDEX_PREFIX = 'ft_express_search_'
+
+# MySQL's full-text parser takes words to be runs of these characters
+WORD_RE = re.compile(r'\w+')
+
+class FulltextInfo(object):
+    def __init__(self, columns: FrozenSet[Tuple[str, str]], min_word_length: int, stopwords: FrozenSet[str]):
+        # (table, column) pairs, lower cased, with a FULLTEXT index on just that column
+        self.columns = columns
+        self.min_word_length = min_word_length
+        self.stopwords = stopwords
+
+_lock = threading.Lock()
+_info: Optional[FulltextInfo] = None
+_loaded_at = 0.0
+
+NO_INDEXES = FulltextInfo(frozenset(), 0, frozenset())
+
+def load_info() -> FulltextInfo:
+    """Find the FULLTEXT indexes and how they split text into words.
+    If that fails, for instance because the database user may not read
+    the stopwords, which takes the PROCESS privilege, the indexes are
+    taken not to exist and all terms are matched with LIKE.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+            select lower(table_name), lower(min(column_name))
+            from information_schema.statistics
+            where table_schema = database() and index_type = 'FULLTEXT'
+            group by table_name, index_name
+            having count(*) = 1
+            """)
+            columns = frozenset(cursor.fetchall())
+            if not columns:
+                return NO_INDEXES
+
+            cursor.execute("select @@innodb_ft_min_token_size, @@innodb_ft_enable_stopword")
+            min_word_length, enable_stopword = cursor.fetchone()
+
+            if enable_stopword:
+                cursor.execute("select value from information_schema.innodb_ft_default_stopword")
+                stopwords = frozenset(word.lower() for word, in cursor.fetchall())
+            else:
+                stopwords = frozenset()
+    except DatabaseError:
+        logger.warning("unable to load the FULLTEXT indexes, express search will not use them", exc_info=True)
+        return NO_INDEXES
+
+    return FulltextInfo(columns, min_word_length, stopwords)
+
+def fulltext_info() -> FulltextInfo:
+    global _info, _loaded_at
+    with _lock:
+        if _info is None or time.monotonic() - _loaded_at > FULLTEXT_INDEX_REFRESH:
+            _info = load_info()
+            _loaded_at = time.monotonic()
+        return _info
+
+def clear() -> None:
+    global _info
+    with _lock:
+        _info = None
+
+def has_index(table, field) -> bool:
+    "Whether the column of field of table has a FULLTEXT index of its own."
+    return (table.table.lower(), field.column.lower()) in fulltext_info().columns
+
+def boolean_query(term) -> Optional[str]:
+    """The boolean mode full-text query for the words of term, or None
+    if the index can't be used to match it.
+    """
+    if term.is_suffix and not term.is_prefix:
+        return None
+
+    info = fulltext_info()
+    words = WORD_RE.findall(term.term)
+    if not words or any(len(w) < info.min_word_length or w.lower() in info.stopwords for w in words):
+        return None
+
+    if len(words) > 1 and not term.is_prefix:
+        return '+"%s"' % ' '.join(words)
+
+    required = ['+' + w for w in words]
+    if term.is_prefix:
+        required[-1] += '*'
+    return ' '.join(required)
+
+def create_text_filter(term, column):
+    """A filter matching term against column through its FULLTEXT
+    index, or None if the index can't be used.
+    """
+    query = boolean_query(term)
+    if query is None:
+        return None
+
+    if term.is_suffix:
+        # '*term*': any word of the field starting with term
+        return column.match(query)
+
+    # the index finds the candidates, LIKE keeps the exact semantics
+    return and_(column.match(query), term.create_like_filter(column))
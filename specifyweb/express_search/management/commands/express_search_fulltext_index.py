@@ -0,0 +1,76 @@
+from xml.etree import ElementTree
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from specifyweb.context.app_resource import get_app_resource
+from specifyweb.express_search import fulltext
+from specifyweb.specify.models import Collection, Spappresourcedata, datamodel
+
+TEXT_TYPES = ('text', 'java.lang.String')
+
+def search_configs():
+    "The ExpressSearchConfig resources of every collection and user."
+    for collection in Collection.objects.all():
+        found = get_app_resource(collection, None, 'ExpressSearchConfig')
+        if found is not None:
+            yield found[0]
+    for data in Spappresourcedata.objects.filter(spappresource__name='ExpressSearchConfig'):
+        yield data.data
+
+def text_search_columns():
+    columns = set()
+    for resource in search_configs():
+        config = ElementTree.XML(resource)
+        for searchtable in config.findall('tables/searchtable'):
+            table = datamodel.get_table(searchtable.find('tableName').text)
+            if table is None:
+                continue
+            for fieldname in searchtable.findall('.//searchfield/fieldName'):
+                field = table.get_field(fieldname.text)
+                if field is not None and not field.is_relationship and field.type in TEXT_TYPES:
+                    columns.add((table.table, field.column))
+    return sorted(columns)
+
+class Command(BaseCommand):
+    help = ('Creates FULLTEXT indexes on the text fields searched by the express search. '
+            'Adding the first FULLTEXT index to a table rebuilds it, which can take a while on large tables.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            dest='drop',
+            default=False,
+            help='Drop the indexes created by this command instead.',
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['drop']:
+            self.drop_indexes()
+        else:
+            self.create_indexes()
+        fulltext.clear()
+
+    def create_indexes(self):
+        existing = fulltext.load_info().columns
+        with connection.cursor() as cursor:
+            for table, column in text_search_columns():
+                if (table.lower(), column.lower()) in existing:
+                    continue
+                index = (fulltext.INDEX_PREFIX + column)[:64]
+                self.stdout.write(f'Adding FULLTEXT index on {table}.{column}')
+                cursor.execute(f'alter table `{table}` add fulltext index `{index}` (`{column}`)')
+        self.stdout.write(self.style.SUCCESS('Finished creating express search indexes.'))
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+            select distinct table_name, index_name
+            from information_schema.statistics
+            where table_schema = database() and index_type = 'FULLTEXT' and index_name like %s
+            """, [fulltext.INDEX_PREFIX + '%'])
+            for table, index in cursor.fetchall():
+                self.stdout.write(f'Dropping index {index} on {table}')
+                cursor.execute(f'alter table `{table}` drop index `{index}`')
+        self.stdout.write(self.style.SUCCESS('Finished dropping express search indexes.'))
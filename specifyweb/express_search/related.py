@@ -73,21 +73,40 @@ class RelatedSearch(object, metaclass=RelatedSearchMeta):
 
     @classmethod
     def execute(cls, session, config, terms, collection, user, limit, offset):
-        queries = [_f for _f in (
-            cls(defn).build_related_query(session, config, terms, collection, user)
-            for defn in cls.definitions) if _f]
+        query = cls.build_search_query(session, config, terms, collection, user)
 
-        if len(queries) > 0:
-            query = queries[0].union(*queries[1:])
+        if query is not None:
             count = query.count()
             results = list(query.limit(limit).offset(offset))
         else:
             count = 0
             results = []
 
+        return cls.make_result(count, results)
+
+    @classmethod
+    def build_search_query(cls, session, config, terms, collection, user, primary_ids=None):
+        """The union of the related queries of all the definitions, or
+        None if none of them can match. See build_related_query for
+        primary_ids.
+        """
+        queries = [_f for _f in (
+            cls(defn).build_related_query(session, config, terms, collection, user, primary_ids)
+            for defn in cls.definitions) if _f]
+
+        return queries[0].union(*queries[1:]) if len(queries) > 0 else None
+
+    @classmethod
+    def pivot_tables(cls):
+        "The tables the definitions pivot on."
+        return set(cls(defn).pivot_table() for defn in cls.definitions)
+
+    @classmethod
+    def make_result(cls, count, results, timed_out=False):
         return {
             'totalCount': count,
             'results': results,
+            'timedOut': timed_out,
             'definition': {
                 'name': cls.__name__,
                 'root': cls.root.name,
@@ -100,25 +119,35 @@ class RelatedSearch(object, metaclass=RelatedSearchMeta):
     def __init__(self, definition):
         self.definition = definition
 
-    def build_related_query(self, session, config, terms, collection, user):
+    def pivot_table(self):
+        return QueryFieldSpec.from_path(self.definition.split('.'), add_id=True).table
+
+    def build_related_query(self, session, config, terms, collection, user, primary_ids=None):
+        """The query for the records related by the definition to the
+        records of the pivot table matching terms. primary_ids can map
+        the names of pivot tables to the ids of those records when
+        they have been found beforehand. Otherwise they are found by a
+        subquery.
+        """
         logger.info('%s: building related query using definition: %s',
                     self.__class__.__name__, self.definition)
 
-        from .views import build_primary_query
+        from .views import build_primary_query, find_searchtable
 
         primary_fieldspec = QueryFieldSpec.from_path(self.definition.split('.'), add_id=True)
 
         pivot = primary_fieldspec.table
 
         logger.debug('pivoting on: %s', pivot)
-        for searchtable in config.findall('tables/searchtable'):
-            if searchtable.find('tableName').text == pivot.name:
-                break
+        if primary_ids is not None and pivot.name in primary_ids:
+            primary_query = primary_ids[pivot.name] or None
         else:
-            return None
+            searchtable = find_searchtable(config, pivot)
+            if searchtable is None:
+                return None
 
-        logger.debug('using %s for primary search', searchtable.find('tableName').text)
-        primary_query = build_primary_query(session, searchtable, terms, collection, user, as_scalar=True)
+            logger.debug('using %s for primary search', searchtable.find('tableName').text)
+            primary_query = build_primary_query(session, searchtable, terms, collection, user, as_scalar=True)
 
         if primary_query is None:
             return None
@@ -42,7 +42,11 @@ class Term(namedtuple("Term", "term is_suffix is_prefix is_number maybe_year is_
 
         return cls(term, is_suffix, is_prefix, is_number, maybe_year, is_integer, as_date)
 
-    def create_filter(self, table, field):
+    def create_filter(self, table, field, fulltext=False):
+        """The filter for field of table matching this term, or None if
+        the term can't match the field. With fulltext, text fields are
+        matched through their full-text index where possible.
+        """
         model = getattr(models, table.name)
         column = getattr(model, field.name)
 
@@ -79,9 +83,19 @@ class Term(namedtuple("Term", "term is_suffix is_prefix is_number maybe_year is_
             }
 
         create = filter_map.get(field.type, lambda f: None)
+
+        if fulltext and create == self.create_text_filter:
+            from . import fulltext as ft
+            fulltext_filter = ft.create_text_filter(self, column)
+            if fulltext_filter is not None:
+                return fulltext_filter
+
         return create(column)
 
     def create_text_filter(self, column):
+        return self.create_like_filter(column)
+
+    def create_like_filter(self, column):
         if self.is_prefix and self.is_suffix:
             return column.ilike('%' + self.term + '%')
 
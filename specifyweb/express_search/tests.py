@@ -14,3 +14,106 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+import time
+
+from specifyweb.specify.api_tests import ApiTests
+from . import fulltext, views
+from .search_terms import Term
+
+class ExpressSearchConfigCacheTests(ApiTests):
+    def setUp(self) -> None:
+        super().setUp()
+        views.clear_config_cache()
+        self.addCleanup(views.clear_config_cache)
+
+    def test_config_cached(self) -> None:
+        config = views.get_express_search_config(self.collection, self.specifyuser)
+        self.assertIs(config, views.get_express_search_config(self.collection, self.specifyuser))
+
+        views.clear_config_cache()
+        reloaded = views.get_express_search_config(self.collection, self.specifyuser)
+        self.assertIsNot(config, reloaded)
+        self.assertEqual(
+            [t.find('tableName').text for t in config.findall('tables/searchtable')],
+            [t.find('tableName').text for t in reloaded.findall('tables/searchtable')],
+        )
+
+class FulltextQueryTests(TestCase):
+    def setUp(self) -> None:
+        fulltext._info = fulltext.FulltextInfo(frozenset(), 3, frozenset(['the']))
+        fulltext._loaded_at = time.monotonic()
+        self.addCleanup(fulltext.clear)
+
+    def test_boolean_query(self) -> None:
+        query = lambda s: fulltext.boolean_query(Term.make_term(s))
+        self.assertEqual('+quercus', query('quercus'))
+        self.assertEqual('+quercus*', query('quercus*'))
+        self.assertEqual('+quercus*', query('*quercus*'))
+        self.assertEqual('+"2020 001"', query('2020-001'))
+        self.assertEqual('+2020 +001*', query('2020-001*'))
+
+    def test_unindexable_terms(self) -> None:
+        query = lambda s: fulltext.boolean_query(Term.make_term(s))
+        self.assertIsNone(query('*quercus'))
+        self.assertIsNone(query('ab*'))
+        self.assertIsNone(query('the'))
+        self.assertIsNone(query('--'))
+
+class FulltextInfoTests(TestCase):
+    def test_unreadable_info_means_no_indexes(self) -> None:
+        from unittest import mock
+        from django.db import OperationalError
+        with mock.patch.object(fulltext.connection, 'cursor', side_effect=OperationalError(1227, "Access denied")):
+            self.assertIs(fulltext.NO_INDEXES, fulltext.load_info())
+
+class RelatedSearchBatchTests(TestCase):
+    def test_active_related_searches(self) -> None:
+        from xml.etree import ElementTree
+        config = ElementTree.XML("""
+        <searchConfig>
+          <relatedQueries>
+            <relatedquery isactive="true"><id>1</id></relatedquery>
+            <relatedquery isactive="false"><id>2</id></relatedquery>
+            <relatedquery isactive="true"><id>3</id></relatedquery>
+          </relatedQueries>
+        </searchConfig>
+        """)
+        self.assertEqual(['CollObjToDeterminer', 'CollObject'], views.active_related_searches(config))
+
+    def test_batch_form_names(self) -> None:
+        form = views.RelatedSearchBatchForm({'q': 'quercus', 'name': 'CollObject,GeoToTaxon'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(['CollObject', 'GeoToTaxon'], form.cleaned_data['name'])
+
+        form = views.RelatedSearchBatchForm({'q': 'quercus', 'name': 'CollObject,Nonexistent'})
+        self.assertFalse(form.is_valid())
+
+        form = views.RelatedSearchBatchForm({'q': 'quercus'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual([], form.cleaned_data['name'])
+
+        # names of module attributes that are not related searches
+        for name in ['RelatedSearch', 'QueryOps', '__all__']:
+            self.assertFalse(views.RelatedSearchBatchForm({'q': 'quercus', 'name': name}).is_valid())
+            self.assertFalse(views.RelatedSearchForm({'q': 'quercus', 'name': name}).is_valid())
+        self.assertTrue(views.RelatedSearchForm({'q': 'quercus', 'name': 'CollObject'}).is_valid())
+
+class FindPrimaryIdsTests(ApiTests):
+    def test_timed_out_table_searched_by_related_searches(self) -> None:
+        from unittest import mock
+        from specifyweb.specify.models import datamodel
+        from specifyweb.stored_queries import models
+        from .search_terms import parse_search_str
+
+        config = views.get_express_search_config(self.collection, self.specifyuser)
+        terms = parse_search_str(self.collection, 'num')
+        table = datamodel.get_table_strict('Collectionobject')
+
+        def find(timed_out):
+            with models.session_context() as session, \
+                 mock.patch.object(views, 'run_timed', return_value=(0, [(1,), (2,)], timed_out)):
+                return views.find_primary_ids(session, config, [table], terms, self.collection, self.specifyuser)
+
+        self.assertEqual({table.name: [1, 2]}, find(timed_out=False))
+        self.assertEqual({}, find(timed_out=True))
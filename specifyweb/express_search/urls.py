@@ -4,5 +4,6 @@ from . import views
 urlpatterns = [
     url(r'^$', views.search),
     url(r'^related/$', views.related_search),
+    url(r'^related/batch/$', views.related_search_batch),
     url(r'^querycbx/(?P<modelname>\w*)/$', views.querycbx_search),
 ]
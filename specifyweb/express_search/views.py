@@ -3,17 +3,25 @@ Implements the express search mechanism
 """
 
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
+from typing import Any, Dict, Hashable, List, Optional, Tuple
 from xml.etree import ElementTree
 
 from django import forms
+from django.conf import settings
+from django.db import connection
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.views.decorators.http import require_GET
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.sql.expression import or_, and_
 
+from . import fulltext
 from .search_terms import parse_search_str
 from ..context.app_resource import get_app_resource
-from ..permissions.permissions import check_table_permissions
+from ..permissions.permissions import check_table_permissions, NoMatchingRuleException
 from ..specify.api import toJson
 from ..specify.models import datamodel, Collection
 from ..specify.views import login_maybe_required
@@ -23,12 +31,67 @@ from ..stored_queries.queryfieldspec import QueryFieldSpec
 
 logger = logging.getLogger(__name__)
 
+# MySQL error raised by a statement stopped with KILL QUERY
+ER_QUERY_INTERRUPTED = 1317
+
+CONFIG_CACHE_SIZE = 128
+
+# a related search pivoting on a table with more matches than this
+# searches the table itself rather than getting the matching ids
+RELATED_SEARCH_ID_LIMIT = 10000
+
+_config_lock = threading.Lock()
+_configs: "OrderedDict[Hashable, ElementTree.Element]" = OrderedDict()
+_configs_version: Optional[Tuple] = None
+
+def app_resources_version() -> Tuple:
+    "A value that changes whenever any app resource is saved or deleted."
+    with connection.cursor() as cursor:
+        cursor.execute("select max(TimestampModified), count(*) from spappresourcedata")
+        return tuple(cursor.fetchone())
+
 def get_express_search_config(collection, user):
-    resource, _, __ = get_app_resource(collection, user, 'ExpressSearchConfig')
-    return ElementTree.XML(resource)
+    """The parsed ExpressSearchConfig app resource for user in collection.
+    The parsed configs are cached, per process, until any app resource
+    changes. They must not be modified.
+    """
+    global _configs_version
+    key = (collection.id, user.id, user.usertype)
+    version = app_resources_version()
+    with _config_lock:
+        if version != _configs_version:
+            _configs.clear()
+            _configs_version = version
+        config = _configs.get(key, None)
+        if config is not None:
+            _configs.move_to_end(key)
+            return config
 
+    resource, _, __ = get_app_resource(collection, user, 'ExpressSearchConfig')
+    config = ElementTree.XML(resource)
+
+    with _config_lock:
+        if version == _configs_version:
+            _configs[key] = config
+            while len(_configs) > CONFIG_CACHE_SIZE:
+                _configs.popitem(last=False)
+    return config
+
+def clear_config_cache() -> None:
+    global _configs_version
+    with _config_lock:
+        _configs.clear()
+        _configs_version = None
+
+
+def find_searchtable(config, table):
+    "The searchtable element of config for table, if any."
+    for searchtable in config.findall('tables/searchtable'):
+        if searchtable.find('tableName').text == table.name:
+            return searchtable
+    return None
 
-def build_primary_query(session, searchtable, terms, collection, user, as_scalar=False):
+def build_primary_query(session, searchtable, terms, collection, user, as_scalar=False, ids_only=False):
     table = datamodel.get_table(searchtable.find('tableName').text)
     check_table_permissions(collection, user, table, "read")
 
@@ -39,20 +102,36 @@ def build_primary_query(session, searchtable, terms, collection, user, as_scalar
               for fn in searchtable.findall('.//searchfield/fieldName')]
 
     q_fields = [id_field]
-    if not as_scalar:
+    if not (as_scalar or ids_only):
         q_fields.extend([
             getattr(model, table.get_field(fn.text).name)
             for fn in searchtable.findall('.//displayfield/fieldName')])
 
-    filters = [fltr for fltr in [
-                t.create_filter(table, f) for f in fields for t in terms]
+    indexed = [fulltext.has_index(table, f) for f in fields]
+    filters = [(fltr, use_index) for fltr, use_index in [
+                (t.create_filter(table, f, fulltext=use_index), use_index)
+                for f, use_index in zip(fields, indexed) for t in terms]
                if fltr is not None]
 
     if len(filters) > 0:
-        reduced = reduce(or_, filters)
-        query = session.query(*q_fields).filter(reduced)
+        if any(use_index for _, use_index in filters):
+            # MySQL only uses a full-text index for a MATCH that is not
+            # OR-ed with anything, so each of those gets a select of
+            # its own
+            selects = [session.query(id_field.label('id')).filter(fltr)
+                       for fltr, use_index in filters if use_index]
+            others = [fltr for fltr, use_index in filters if not use_index]
+            if others:
+                selects.append(session.query(id_field.label('id')).filter(reduce(or_, others)))
+            matches = selects[0].union(*selects[1:]).subquery()
+            query = session.query(*q_fields).join(matches, matches.c.id == id_field)
+        else:
+            reduced = reduce(or_, [fltr for fltr, _ in filters])
+            query = session.query(*q_fields).filter(reduced)
         query = filter_by_collection(model, query, collection)
-        return query.as_scalar() if as_scalar else query.order_by(id_field)
+        if as_scalar:
+            return query.as_scalar()
+        return query if ids_only else query.order_by(id_field)
 
     logger.info("no filters for query. model: %s fields: %s terms: %s", table, fields, terms)
     return None
@@ -64,24 +143,87 @@ def make_fieldspecs(searchtable):
             for fieldname in searchtable.findall('.//displayfield/fieldName')]
 
 
-def run_primary_search(session, searchtable, terms, collection, user, limit, offset):
-    query = build_primary_query(session, searchtable, terms, collection, user)
-
-    if query is not None:
-        total_count = query.count()
-        results = list(query.limit(limit).offset(offset))
-    else:
-        total_count = 0
-        results = []
-
+def primary_search_result(searchtable, total_count, results, timed_out=False):
     return { searchtable.find('tableName').text : {
         'totalCount': total_count,
         'results': results,
+        'timedOut': timed_out,
         'displayOrder': int( searchtable.find('displayOrder').text ),
         'fieldSpecs': [{'stringId': f.to_stringid(), 'isRelationship': False}
                        for f in make_fieldspecs(searchtable)]
         }}
 
+_executor_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def search_executor() -> ThreadPoolExecutor:
+    """The pool of threads the table searches of all requests run on.
+    Each thread uses one database connection at a time, so this also
+    bounds the connections taken by express searches.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.EXPRESS_SEARCH_MAX_WORKERS,
+                thread_name_prefix='express-search',
+            )
+        return _executor
+
+def kill_query(connection_id: int) -> None:
+    with models.engine.connect() as conn:
+        conn.execute(f"kill query {int(connection_id)}")
+
+def run_timed(query, limit: int, offset: int, timeout: float, description: str, count: bool = True) -> Tuple[int, list, bool]:
+    """Fetch the page of the results of query at offset, and count them
+    unless count is false, in a session of its own, killing its
+    statements once they have taken timeout seconds. Returns the total
+    count, the page of results and whether the time ran out, in which
+    case the results found by then are returned and the count may be
+    too low.
+    """
+    total_count = 0
+    results: list = []
+    timed_out = False
+
+    with models.session_context() as session:
+        # the session keeps using this connection until it is closed
+        connection_id = session.execute("select connection_id()").scalar()
+        lock = threading.Lock()
+        finished = False
+
+        def expire() -> None:
+            nonlocal timed_out
+            with lock:
+                if not finished:
+                    timed_out = True
+                    kill_query(connection_id)
+
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+        try:
+            # fetching the page is usually fast even when counting all
+            # the matches is not, so it goes first
+            results = list(query.with_session(session).limit(limit).offset(offset))
+            total_count = offset + len(results)
+            if count and (len(results) == limit or (offset > 0 and not results)):
+                total_count = query.with_session(session).count()
+        except OperationalError as e:
+            if e.orig.args[0] != ER_QUERY_INTERRUPTED:
+                raise
+            logger.warning("express search of %s exceeded %s seconds", description, timeout)
+        finally:
+            with lock:
+                finished = True
+            timer.cancel()
+
+    return total_count, results, timed_out
+
+def run_timed_search(searchtable, query, limit: int, offset: int, timeout: float) -> Dict[str, Any]:
+    "Run the primary search query for searchtable with run_timed."
+    return primary_search_result(searchtable, *run_timed(
+        query, limit, offset, timeout, searchtable.find('tableName').text))
+
 class SearchForm(forms.Form):
     q = forms.CharField()
     name = forms.CharField(required=False)
@@ -119,28 +261,105 @@ def search(request):
     limit = form.cleaned_data['limit']
     offset = form.cleaned_data['offset']
 
-    with models.session_context() as session:
-        results = [run_primary_search(session, searchtable, terms, collection, user, limit, offset)
-                   for searchtable in express_search_config.findall('tables/searchtable')
-                   if specific_table == "" or searchtable.find('tableName').text.lower() == specific_table]
+    searchtables = [
+        searchtable for searchtable in express_search_config.findall('tables/searchtable')
+        if specific_table == "" or searchtable.find('tableName').text.lower() == specific_table
+    ]
 
-        result = {k: v for r in results for (k,v) in list(r.items())}
-        return HttpResponse(toJson(result), content_type='application/json')
+    # the queries are built here, checking the permissions, and only
+    # run in the pool
+    with models.session_context() as session:
+        queries = [build_primary_query(session, searchtable, terms, collection, user)
+                   for searchtable in searchtables]
+
+    timeout = settings.EXPRESS_SEARCH_TABLE_TIMEOUT
+    futures = [
+        search_executor().submit(run_timed_search, searchtable, query, limit, offset, timeout)
+        for searchtable, query in zip(searchtables, queries)
+        if query is not None
+    ]
+    results = [
+        primary_search_result(searchtable, 0, [])
+        for searchtable, query in zip(searchtables, queries)
+        if query is None
+    ] + [future.result() for future in futures]
+
+    result = {k: v for r in results for (k,v) in list(r.items())}
+    return HttpResponse(toJson(result), content_type='application/json')
+
+def related_search_classes() -> Dict[str, Any]:
+    "The related searches by name."
+    from . import related_searches
+    return {name: getattr(related_searches, name) for name in related_searches.__all__}
+
+def active_related_searches(config):
+    "The names of the related searches activated in config."
+    active = [int(q.find('id').text)
+              for q in config.findall('relatedQueries/relatedquery')
+              if q.attrib.get('isactive', None) == 'true'  or q.find("[isActive='true']")]
+
+    return [name for name, search in related_search_classes().items()
+            if search.id in active]
+
+def find_primary_ids(session, config, tables, terms, collection, user) -> Dict[str, List[int]]:
+    """The ids of the records of each of tables matching terms, keyed
+    by table name, for the tables with at most RELATED_SEARCH_ID_LIMIT
+    matches. The related searches pivoting on those tables can use the
+    ids rather than searching the table again.
+
+    The tables are searched concurrently on the express search pool,
+    each with the per-table time budget. A table whose search runs out
+    of time is left out, for the related searches to search it
+    themselves.
+    """
+    primary_ids: Dict[str, List[int]] = {}
+    queries = []
+    for table in tables:
+        searchtable = find_searchtable(config, table)
+        if searchtable is None:
+            primary_ids[table.name] = []
+            continue
+        try:
+            query = build_primary_query(session, searchtable, terms, collection, user, ids_only=True)
+        except NoMatchingRuleException:
+            # left to the related searches to deal with
+            continue
+        if query is None:
+            primary_ids[table.name] = []
+            continue
+        queries.append((table, query))
+
+    timeout = settings.EXPRESS_SEARCH_TABLE_TIMEOUT
+    futures = [
+        (table, search_executor().submit(
+            run_timed, query, RELATED_SEARCH_ID_LIMIT + 1, 0, timeout, table.name, count=False))
+        for table, query in queries
+    ]
+    for table, future in futures:
+        _, results, timed_out = future.result()
+        if not timed_out and len(results) <= RELATED_SEARCH_ID_LIMIT:
+            primary_ids[table.name] = [id for (id,) in results]
+    return primary_ids
 
 class RelatedSearchForm(SearchForm):
     name = forms.CharField(required=True)
 
+    def clean_name(self):
+        name = self.cleaned_data['name']
+        if name not in related_search_classes():
+            raise forms.ValidationError(f"unknown related search: {name}")
+        return name
+
 @require_GET
 @login_maybe_required
 def related_search(request):
     """Performs an express search "related query" and returns the results. """
-    from . import related_searches
     form = RelatedSearchForm(request.GET)
     if not form.is_valid():
         return HttpResponseBadRequest(toJson(form.errors), content_type='application/json')
     logger.debug("parameters: %s", form.cleaned_data)
 
-    related_search = getattr(related_searches, form.cleaned_data['name'])
+    related_search = related_search_classes()[form.cleaned_data['name']]
 
     config = get_express_search_config(request.specify_collection, request.specify_user)
     terms = parse_search_str(request.specify_collection, form.cleaned_data['q'])
@@ -154,6 +373,76 @@ def related_search(request):
 
         return HttpResponse(toJson(result), content_type='application/json')
 
+class RelatedSearchBatchForm(SearchForm):
+    def clean_name(self):
+        classes = related_search_classes()
+        names = [n for n in self.cleaned_data['name'].split(',') if n]
+        for name in names:
+            if name not in classes:
+                raise forms.ValidationError(f"unknown related search: {name}")
+        return names
+
+@require_GET
+@login_maybe_required
+def related_search_batch(request):
+    """Performs the related searches for an express search together.
+    Based on the GET parameters:
+    'q' = the query string (required)
+    'name' = comma separated names of the related searches to perform,
+             the ones active in the express search config by default
+    'limit' = number of results to return for each
+    'offset' = offset into the results of each
+
+    The records matching the query string in each table the searches
+    pivot on are found once and the searches are run concurrently.
+    Returns the results keyed by the names of the searches, leaving out
+    the searches the user does not have permission for.
+    """
+    form = RelatedSearchBatchForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(toJson(form.errors), content_type='application/json')
+    logger.debug("parameters: %s", form.cleaned_data)
+
+    collection = request.specify_collection
+    user = request.specify_user
+    config = get_express_search_config(collection, user)
+    terms = parse_search_str(collection, form.cleaned_data['q'])
+    names = form.cleaned_data['name'] or active_related_searches(config)
+    limit = form.cleaned_data['limit']
+    offset = form.cleaned_data['offset']
+
+    classes = related_search_classes()
+    searches = [classes[name] for name in names]
+    pivots = set(table for search in searches for table in search.pivot_tables())
+
+    queries = []
+    with models.session_context() as session:
+        primary_ids = find_primary_ids(session, config, pivots, terms, collection, user)
+        for search in searches:
+            try:
+                query = search.build_search_query(session, config, terms, collection, user, primary_ids)
+            except NoMatchingRuleException:
+                logger.debug("no permission for related search %s", search.__name__)
+                continue
+            queries.append((search, query))
+
+    timeout = settings.EXPRESS_SEARCH_TABLE_TIMEOUT
+    futures = [
+        (search, search_executor().submit(run_timed, query, limit, offset, timeout, search.__name__))
+        for search, query in queries
+        if query is not None
+    ]
+    result = {
+        search.__name__: search.make_result(0, [])
+        for search, query in queries
+        if query is None
+    }
+    result.update(
+        (search.__name__, search.make_result(*future.result()))
+        for search, future in futures
+    )
+    return HttpResponse(toJson(result), content_type='application/json')
+
 @require_GET
 @login_maybe_required
 def querycbx_search(request, modelname):
@@ -35,7 +35,10 @@ export function usePrimarySearch(
         status === Http.FORBIDDEN
           ? false
           : Object.entries(data)
-              .filter(([_tableName, { totalCount }]) => totalCount > 0)
+              .filter(
+                ([_tableName, { totalCount, timedOut }]) =>
+                  totalCount > 0 || timedOut === true
+              )
               .map(([tableName, tableResults]) => ({
                 table: strictGetTable(tableName),
                 caption: strictGetTable(tableName).label,
@@ -67,6 +70,8 @@ export type QueryTableResult = {
   readonly fieldSpecs: RA<FieldSpec>;
   readonly results: RA<RA<number | string>>;
   readonly totalCount: number;
+  // The search ran out of time, so results and totalCount may be incomplete
+  readonly timedOut?: boolean;
 };
 
 type RelatedTableResult = {
@@ -79,6 +84,7 @@ type RelatedTableResult = {
   };
   readonly results: RA<RA<number | string>>;
   readonly totalCount: number;
+  readonly timedOut?: boolean;
 };
 
 export function useSecondarySearch(
@@ -88,23 +94,35 @@ export function useSecondarySearch(
     React.useCallback(async () => {
       if (query === '') return false;
       const relatedSearches = await relatedSearchesPromise;
-      const results = await Promise.all(
-        relatedSearches.map(async (name) => {
-          const ajaxUrl = formatUrl('/express_search/related/', {
-            q: query,
-            name,
-            limit: expressSearchFetchSize,
-          });
-          return ajax<RelatedTableResult>(ajaxUrl, {
-            headers: { Accept: 'application/json' },
-            expectedErrors: [Http.FORBIDDEN],
-          }).then(({ data, status }) =>
-            status === Http.FORBIDDEN ? undefined : ([ajaxUrl, data] as const)
-          );
-        })
+      if (relatedSearches.length === 0) return [];
+      // Run all related searches in one request
+      const { data } = await ajax<IR<RelatedTableResult>>(
+        formatUrl('/express_search/related/batch/', {
+          q: query,
+          name: relatedSearches.join(','),
+          limit: expressSearchFetchSize,
+        }),
+        {
+          headers: { Accept: 'application/json' },
+        }
+      );
+      const results = relatedSearches.map((name) =>
+        data[name] === undefined
+          ? undefined
+          : ([
+              formatUrl('/express_search/related/', {
+                q: query,
+                name,
+                limit: expressSearchFetchSize,
+              }),
+              data[name],
+            ] as const)
       );
       return filterArray(results)
-        .filter(([_ajaxUrl, { totalCount }]) => totalCount > 0)
+        .filter(
+          ([_ajaxUrl, { totalCount, timedOut }]) =>
+            totalCount > 0 || timedOut === true
+        )
         .map(([ajaxUrl, tableResult]) => {
           const table = strictGetTable(tableResult.definition.root);
           const idFieldIndex = 0;
@@ -143,6 +161,7 @@ export function useSecondarySearch(
               results: tableResult.results,
               fieldSpecs: tableResult.definition.fieldSpecs,
               totalCount: tableResult.totalCount,
+              timedOut: tableResult.timedOut,
             },
             ajaxUrl,
           };
@@ -233,10 +233,12 @@ function TableResult({
           hover:!text-white dark:bg-brand-500 hover:dark:!bg-brand-400
         `}
       >
-        {commonText.countLine({
-          resource: caption,
-          count: tableResults.totalCount,
-        })}
+        {tableResults.timedOut === true
+          ? headerText.searchTimedOut({ resource: caption })
+          : commonText.countLine({
+              resource: caption,
+              count: tableResults.totalCount,
+            })}
       </summary>
       <ErrorBoundary dismissible>
         <QueryResults
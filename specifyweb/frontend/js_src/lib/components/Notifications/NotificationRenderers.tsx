@@ -1,12 +1,20 @@
 import React from 'react';
 import type { LocalizedString } from 'typesafe-i18n';
 
+import { useAsyncState } from '../../hooks/useAsyncState';
 import { mergingText } from '../../localization/merging';
 import { notificationsText } from '../../localization/notifications';
 import { StringToJsx } from '../../localization/utils';
+import { ajax } from '../../utils/ajax';
+import { Http } from '../../utils/ajax/definitions';
+import { ping } from '../../utils/ajax/ping';
 import type { IR } from '../../utils/types';
+import { Progress } from '../Atoms';
+import { Button } from '../Atoms/Button';
 import { Link } from '../Atoms/Link';
+import { LoadingContext } from '../Core/Contexts';
 import { getTable } from '../DataModel/tables';
+import { softFail } from '../Errors/Crash';
 import { userInformation } from '../InitialContext/userInformation';
 import { mergingQueryParameter } from '../Merging/queryString';
 import { FormattedResource } from '../Molecules/FormattedResource';
@@ -21,6 +29,85 @@ export type GenericNotification = {
   readonly payload: IR<LocalizedString>;
 };
 
+type ExportStatus = {
+  readonly taskstatus: string;
+  readonly taskprogress: {
+    readonly current: number;
+    readonly total: number | null;
+  } | null;
+};
+
+const activeExportStatuses = new Set(['PENDING', 'EXPORTING']);
+
+/**
+ * The message for an export that has been queued, with its progress and a
+ * button to cancel it while it is still running
+ */
+function ExportStarted({
+  notification,
+  children,
+}: {
+  readonly notification: GenericNotification;
+  readonly children: React.ReactNode;
+}): JSX.Element {
+  const taskId = notification.payload.task_id;
+  const [status, setStatus] = useAsyncState<ExportStatus | false>(
+    React.useCallback(
+      async () =>
+        ajax<ExportStatus>(`/notifications/exports/${taskId}/`, {
+          headers: { Accept: 'application/json' },
+          expectedErrors: [Http.NOT_FOUND],
+        }).then(({ data, status }) =>
+          status === Http.NOT_FOUND ? false : data
+        ),
+      [taskId]
+    ),
+    false
+  );
+  const loading = React.useContext(LoadingContext);
+  const progress = typeof status === 'object' ? status.taskprogress : null;
+  const isActive =
+    typeof status === 'object' && activeExportStatuses.has(status.taskstatus);
+  return (
+    <>
+      {children}
+      {progress !== null && (
+        <>
+          {typeof progress.total === 'number' && progress.total > 0 && (
+            <Progress value={(progress.current / progress.total) * 100} />
+          )}
+          <p>
+            {typeof progress.total === 'number'
+              ? notificationsText.exportProgressWithTotal({
+                  current: progress.current,
+                  total: progress.total,
+                })
+              : notificationsText.exportProgress({
+                  current: progress.current,
+                })}
+          </p>
+        </>
+      )}
+      {isActive && (
+        <Button.Small
+          className="w-fit"
+          onClick={(): void =>
+            loading(
+              ping(`/notifications/exports/${taskId}/abort/`, {
+                method: 'POST',
+              })
+                .then(() => setStatus(false))
+                .catch(softFail)
+            )
+          }
+        >
+          {notificationsText.abortExport()}
+        </Button.Small>
+      )}
+    </>
+  );
+}
+
 export const notificationRenderers: IR<
   (notification: GenericNotification) => React.ReactNode
 > = {
@@ -109,6 +196,37 @@ export const notificationRenderers: IR<
       </>
     );
   },
+  'query-export-starting'(notification) {
+    return (
+      <ExportStarted notification={notification}>
+        {notificationsText.queryExportStarted()}
+      </ExportStarted>
+    );
+  },
+  'dwca-export-starting'(notification) {
+    return (
+      <ExportStarted notification={notification}>
+        {notificationsText.dwcaExportStarted()}
+      </ExportStarted>
+    );
+  },
+  'update-feed-starting'(notification) {
+    return (
+      <ExportStarted notification={notification}>
+        {notificationsText.updateFeedStarted()}
+      </ExportStarted>
+    );
+  },
+  'export-aborted'(notification) {
+    return (
+      <>
+        {notificationsText.exportAborted()}
+        {typeof notification.payload.file === 'string' && (
+          <p>{notification.payload.file}</p>
+        )}
+      </>
+    );
+  },
   'dataset-ownership-transferred'(notification) {
     return (
       <StringToJsx
@@ -240,6 +240,9 @@ export const headerText = createDictionary({
     'uk-ua': 'Вторинний пошук',
     'de-ch': 'Sekundäre Suche',
   },
+  searchTimedOut: {
+    'en-us': '{resource:string} (search timed out, results may be incomplete)',
+  },
   menuItems: {
     'en-us': 'Menu Items',
     'ru-ru': 'Элементы меню',
@@ -110,6 +110,27 @@ export const notificationsText = createDictionary({
     'uk-ua': 'Експорт запиту в KML завершено.',
     'de-ch': 'Der Abfrageexport nach KML wurde abgeschlossen.',
   },
+  queryExportStarted: {
+    'en-us': 'Query export started.',
+  },
+  dwcaExportStarted: {
+    'en-us': 'DwCA export started.',
+  },
+  updateFeedStarted: {
+    'en-us': 'Export feed update started.',
+  },
+  exportAborted: {
+    'en-us': 'Export canceled.',
+  },
+  exportProgress: {
+    'en-us': '{current:number} rows exported',
+  },
+  exportProgressWithTotal: {
+    'en-us': '{current:number} of about {total:number} rows exported',
+  },
+  abortExport: {
+    'en-us': 'Cancel export',
+  },
   dataSetOwnershipTransferred: {
     'en-us': `
       <userName /> transferred the ownership of the <dataSetName /> dataset to
@@ -0,0 +1,146 @@
+"""
+Bookkeeping of export jobs.
+
+Query, DwCA and export feed exports run as celery tasks (see
+stored_queries.tasks and export.tasks) tracked by Spexport records. A
+user can have at most settings.EXPORT_MAX_CONCURRENT_PER_USER exports
+queued or running at once. When an export is queued a message carrying
+its task id is created for the user, so clients can pick up its status
+again, e.g. after reloading the page, until the completion message
+arrives.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import transaction
+
+from specifyweb.celery_tasks import app
+from .models import Message, Spexport, Specifyuser
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('PENDING', 'EXPORTING')
+
+CELERY_EXPORT_STATUS_MAP = {
+    'STARTED': 'EXPORTING',
+    'PROGRESS': 'EXPORTING',
+    'SUCCESS': 'SUCCEEDED',
+    'FAILURE': 'FAILED',
+    'REVOKED': 'ABORTED',
+    'REJECTED': 'FAILED',
+}
+
+class ExportLimitExceeded(Exception):
+    pass
+
+def start_export(task, args: List[Any], user, collection, exporttype: str, filename: Optional[str], message_type: str) -> Spexport:
+    """Queue the export task with the id of a new Spexport record
+    followed by args, unless user already has the maximum number of
+    exports in progress, in which case ExportLimitExceeded is raised.
+    """
+    with transaction.atomic():
+        # serializes the exports started by the same user
+        Specifyuser.objects.select_for_update().get(id=user.id)
+
+        active = [
+            export for export in Spexport.objects.filter(specifyuser=user, status__in=ACTIVE_STATUSES)
+            if refresh_status(export) in ACTIVE_STATUSES
+        ]
+        if len(active) >= settings.EXPORT_MAX_CONCURRENT_PER_USER:
+            raise ExportLimitExceeded(
+                f"{len(active)} exports are already in progress. Please try again when one of them has finished."
+            )
+
+        taskid = str(uuid4())
+        export = Spexport.objects.create(
+            taskid=taskid,
+            exporttype=exporttype,
+            status='PENDING',
+            filename=filename,
+            collection=collection,
+            specifyuser=user,
+        )
+        Message.objects.create(user=user, content=json.dumps({
+            'type': message_type,
+            'task_id': taskid,
+            'file': filename,
+        }))
+
+        # the task must not start before the export record is committed
+        transaction.on_commit(lambda: task.apply_async([export.id, *args], task_id=taskid))
+
+    return export
+
+def run_export(export_id: int, do_export: Callable[[], None]) -> None:
+    "Run do_export within the celery task of the export <export_id>, recording its outcome."
+    try:
+        export = Spexport.objects.get(id=export_id)
+    except Spexport.DoesNotExist:
+        logger.info("export %s no longer exists", export_id)
+        return
+
+    if export.status != 'PENDING':
+        logger.info("export %s is %s, not starting it", export.taskid, export.status)
+        return
+
+    running = Spexport.objects.filter(id=export_id, status__in=ACTIVE_STATUSES)
+    running.update(status='EXPORTING')
+    try:
+        do_export()
+    except Exception:
+        running.update(status='FAILED')
+        raise
+    running.update(status='SUCCEEDED')
+
+def refresh_status(export: Spexport) -> str:
+    """Reconcile the status of an active export with the state of its
+    celery task, which ends without updating the record when it is
+    revoked or the worker dies.
+    """
+    if export.status in ACTIVE_STATUSES:
+        status = CELERY_EXPORT_STATUS_MAP.get(app.AsyncResult(export.taskid).state, export.status)
+        if status != export.status and status not in ACTIVE_STATUSES:
+            export.status = status
+            export.save(update_fields=['status', 'timestampmodified'])
+    return export.status
+
+def export_status(export: Spexport) -> Dict[str, Any]:
+    status = refresh_status(export)
+    info = app.AsyncResult(export.taskid).info if status in ACTIVE_STATUSES else None
+    return {
+        'taskid': export.taskid,
+        'exporttype': export.exporttype,
+        'taskstatus': status,
+        'taskprogress': info if isinstance(info, dict) else None,
+        'file': export.filename,
+    }
+
+def abort_export(export: Spexport) -> bool:
+    """Revoke the celery task of export, removing any partially written
+    file. Returns False if the export was no longer in progress.
+    """
+    if refresh_status(export) not in ACTIVE_STATUSES:
+        return False
+
+    app.control.revoke(export.taskid, terminate=True)
+    export.status = 'ABORTED'
+    export.save(update_fields=['status', 'timestampmodified'])
+
+    if export.filename is not None:
+        try:
+            os.remove(os.path.join(settings.DEPOSITORY_DIR, export.filename))
+        except FileNotFoundError:
+            pass
+
+    Message.objects.create(user=export.specifyuser, content=json.dumps({
+        'type': 'export-aborted',
+        'task_id': export.taskid,
+        'exporttype': export.exporttype,
+        'file': export.filename,
+    }))
+    return True
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specify', '__first__'),
+        ('notifications', '0004_rename_merge_policy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Spexport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taskid', models.CharField(max_length=256, unique=True)),
+                ('exporttype', models.CharField(max_length=32)),
+                ('status', models.CharField(max_length=32)),
+                ('filename', models.CharField(max_length=256, null=True)),
+                ('collection', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='specify.Collection')),
+                ('specifyuser', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('timestampcreated', models.DateTimeField(default=django.utils.timezone.now)),
+                ('timestampmodified', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'spexport'
+            },
+        ),
+    ]
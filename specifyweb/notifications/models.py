@@ -32,3 +32,17 @@ class Spmerging(models.Model):
     class Meta:
         db_table = 'spmerging'
         # managed = False
+
+class Spexport(models.Model):
+    "An export job run by a celery task. See notifications.exports."
+    taskid = models.CharField(max_length=256, unique=True)
+    exporttype = models.CharField(max_length=32)
+    status = models.CharField(max_length=32)
+    filename = models.CharField(max_length=256, null=True)
+    collection = models.ForeignKey(Collection, null=True, on_delete=models.CASCADE)
+    specifyuser = models.ForeignKey(Specifyuser, on_delete=models.CASCADE)
+    timestampcreated = models.DateTimeField(default=timezone.now)
+    timestampmodified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'spexport'
@@ -35,3 +35,24 @@ class NotificationsTests(ApiTests):
         self.assertEqual(mockResponse[0]['read'], responseReturned[0]['read'])
         self.assertEqual(mockResponse[0]['timestamp'][:-7], responseReturned[0]['timestamp'][:-7])
 
+
+class ExportLimitTests(ApiTests):
+    def test_concurrent_exports_limited(self):
+        from unittest import mock
+        from django.test import override_settings
+        from specifyweb.celery_tasks import app
+        from .exports import ExportLimitExceeded, start_export
+        from .models import Spexport
+
+        task = mock.Mock()
+        with override_settings(EXPORT_MAX_CONCURRENT_PER_USER=2), \
+             mock.patch.object(app, 'AsyncResult', return_value=mock.Mock(state='PENDING')):
+            Spexport.objects.create(taskid='done', exporttype='csv', status='SUCCEEDED', specifyuser=self.specifyuser)
+            for _ in range(2):
+                start_export(task, [], self.specifyuser, self.collection, 'csv', 'test.csv', 'query-export-starting')
+
+            with self.assertRaises(ExportLimitExceeded):
+                start_export(task, [], self.specifyuser, self.collection, 'csv', 'test.csv', 'query-export-starting')
+
+        self.assertEqual(2, Spexport.objects.filter(specifyuser=self.specifyuser, status='PENDING').count())
+        self.assertEqual(2, Message.objects.filter(user=self.specifyuser, content__contains='query-export-starting').count())
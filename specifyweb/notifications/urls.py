@@ -5,5 +5,8 @@ from . import views
 urlpatterns = [
     url(r'^messages/$', views.get_messages),
     url(r'^mark_read/$', views.mark_read),
-    url(r'^delete/$', views.delete)
+    url(r'^delete/$', views.delete),
+    url(r'^exports/$', views.exports),
+    url(r'^exports/(?P<taskid>[0-9a-fA-F-]+)/$', views.export_task_status),
+    url(r'^exports/(?P<taskid>[0-9a-fA-F-]+)/abort/$', views.abort_export_task),
 ]
@@ -1,14 +1,15 @@
 import json
 from datetime import datetime, timedelta
 
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, Http404
 from django.views.decorators.http import require_GET, require_POST
 from django.conf import settings
 
 from ..specify.views import login_maybe_required
 from ..specify.api import toJson
 
-from .models import Message
+from .exports import abort_export, export_status, ACTIVE_STATUSES
+from .models import Message, Spexport
 
 @require_GET
 @login_maybe_required
@@ -45,3 +46,31 @@ def delete(request):
         return HttpResponseBadRequest()
     Message.objects.filter(user=request.specify_user, id=request.POST['message_id']).delete()
     return HttpResponse('OK', content_type='text/plain')
+
+@require_GET
+@login_maybe_required
+def exports(request):
+    "Returns the status of the exports of the logged in user that are in progress."
+    active = Spexport.objects.filter(specifyuser=request.specify_user, status__in=ACTIVE_STATUSES).order_by('timestampcreated')
+    statuses = [export_status(export) for export in active]
+    return JsonResponse([s for s in statuses if s['taskstatus'] in ACTIVE_STATUSES], safe=False)
+
+def get_export(request, taskid):
+    try:
+        return Spexport.objects.get(specifyuser=request.specify_user, taskid=taskid)
+    except Spexport.DoesNotExist:
+        raise Http404(f'The export task id is not found: {taskid}')
+
+@require_GET
+@login_maybe_required
+def export_task_status(request, taskid):
+    "Returns the status and progress of the export task <taskid>."
+    return JsonResponse(export_status(get_export(request, taskid)))
+
+@require_POST
+@login_maybe_required
+def abort_export_task(request, taskid):
+    "Aborts the export task <taskid> if it is still in progress."
+    if abort_export(get_export(request, taskid)):
+        return HttpResponse(f'Task {taskid} has been aborted.', content_type='text/plain')
+    return HttpResponse(f'Task {taskid} is not running and cannot be aborted.', content_type='text/plain')
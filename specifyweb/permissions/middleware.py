@@ -4,13 +4,15 @@ from django import http
 
 from .permissions import PermissionsException, NoMatchingRuleException, \
     CollectionAccessPT, check_permission_targets
+from .policy_cache import permissions_scope
 
 class PermissionsMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        response = self.get_response(request)
+        with permissions_scope():
+            response = self.get_response(request)
         return response
 
     def process_view(self, request, view_func, view_args, view_kwargs):
@@ -3,14 +3,13 @@ from typing import Any, Callable, Tuple, List, Dict, Union, Iterable, Optional,
 import logging
 logger = logging.getLogger(__name__)
 
-from django.db import connection
 from django.db.models import Model
 from django.core.exceptions import ObjectDoesNotExist
 
 from specifyweb.specify import models as spmodels
 from specifyweb.specify.datamodel import Table
 
-from . import models
+from . import models, policy_cache
 
 Agent = getattr(spmodels, 'Agent')
 
@@ -125,47 +124,7 @@ def query_pt(collectionid: Optional[int], userid: int, target: PermissionTargetA
     return query(collectionid, userid, target.resource(), target.action())
 
 def query(collectionid: Optional[int], userid: int, resource: str, action: str) -> QueryResult:
-    cursor = connection.cursor()
-
-    cursor.execute("""
-    select collection_id, specifyuser_id, resource, action
-    from spuserpolicy
-    where (collection_id = %(collectionid)s or collection_id is null)
-    and (specifyuser_id = %(userid)s or specifyuser_id is null)
-    and %(resource)s like resource
-    and %(action)s like action
-    """, {
-        'collectionid': collectionid,
-        'userid': userid,
-        'resource': resource,
-        'action': action
-    })
-
-    ups = [
-        dict(zip(("collectionid", "userid", "resource", "action"), r))
-        for r in cursor.fetchall()
-    ]
-
-    cursor.execute("""
-    select r.id, r.name, resource, action
-    from spuserrole ur
-    join sprole r on r.id = ur.role_id
-    join sprolepolicy rp on rp.role_id = r.id
-    where ur.specifyuser_id = %(userid)s
-    and collection_id = %(collectionid)s
-    and %(resource)s like resource
-    and %(action)s like action
-    """, {
-        'collectionid': collectionid,
-        'userid': userid,
-        'resource': resource,
-        'action': action
-    })
-
-    rps = [
-        dict(zip(("roleid", "rolename", "resource", "action"), r))
-        for r in cursor.fetchall()
-    ]
+    ups, rps = policy_cache.get_policies(collectionid, userid).matching(resource, action)
 
     return QueryResult(
         allowed=bool(ups) or bool(rps),
@@ -0,0 +1,186 @@
+"""
+Cache of the permission policies in effect for each user.
+
+Instead of matching the resource and action of every permission check
+against the policies in the database, the policies applying to a user
+in a collection, directly or through their roles, are loaded once and
+the checks are answered in memory. The resource and action patterns of
+the policies, which the database would match with LIKE, are compiled to
+regular expressions.
+
+The loaded policies are kept, per process, until the policy, role or
+user role tables change. That is detected by a cheap query over their
+sizes and largest ids, which change with every insert and delete,
+the way the policies are edited. Within a permissions scope, which
+PermissionsMiddleware opens for each request, that query is only run
+once. Edits made through the ORM in this process drop the cache
+straight away.
+"""
+
+import logging
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, NamedTuple, Optional, Pattern, Tuple
+
+from django.db import connection
+from django.db.models import signals
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 1024
+
+POLICIES_VERSION_SQL = """
+select
+  (select count(*) from spuserpolicy), (select max(id) from spuserpolicy),
+  (select count(*) from sprolepolicy), (select max(id) from sprolepolicy),
+  (select count(*) from spuserrole), (select max(id) from spuserrole),
+  (select count(*) from sprole), (select max(id) from sprole)
+"""
+
+class CompiledPolicy(NamedTuple):
+    resource: Pattern
+    action: Pattern
+    # the policy as reported by permissions.query
+    info: Dict
+
+class Policies(NamedTuple):
+    user_policies: List[CompiledPolicy]
+    role_policies: List[CompiledPolicy]
+
+    def matching(self, resource: str, action: str) -> Tuple[List[Dict], List[Dict]]:
+        "The user and role policies matching resource and action."
+        return (
+            [p.info for p in self.user_policies if p.resource.fullmatch(resource) and p.action.fullmatch(action)],
+            [p.info for p in self.role_policies if p.resource.fullmatch(resource) and p.action.fullmatch(action)],
+        )
+
+def like_to_regex(pattern: str) -> Pattern:
+    "Compile the SQL LIKE pattern to the equivalent regular expression."
+    parts = []
+    chars = iter(pattern)
+    for c in chars:
+        if c == '\\':
+            parts.append(re.escape(next(chars, '\\')))
+        elif c == '%':
+            parts.append('.*')
+        elif c == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(c))
+    # the policy columns have a case insensitive collation
+    return re.compile(''.join(parts), re.IGNORECASE | re.DOTALL)
+
+def compile_policy(info: Dict) -> CompiledPolicy:
+    return CompiledPolicy(like_to_regex(info['resource']), like_to_regex(info['action']), info)
+
+def load_policies(collectionid: Optional[int], userid: int) -> Policies:
+    cursor = connection.cursor()
+
+    cursor.execute("""
+    select collection_id, specifyuser_id, resource, action
+    from spuserpolicy
+    where (collection_id = %(collectionid)s or collection_id is null)
+    and (specifyuser_id = %(userid)s or specifyuser_id is null)
+    """, {
+        'collectionid': collectionid,
+        'userid': userid,
+    })
+
+    ups = [
+        compile_policy(dict(zip(("collectionid", "userid", "resource", "action"), r)))
+        for r in cursor.fetchall()
+    ]
+
+    cursor.execute("""
+    select r.id, r.name, resource, action
+    from spuserrole ur
+    join sprole r on r.id = ur.role_id
+    join sprolepolicy rp on rp.role_id = r.id
+    where ur.specifyuser_id = %(userid)s
+    and collection_id = %(collectionid)s
+    """, {
+        'collectionid': collectionid,
+        'userid': userid,
+    })
+
+    rps = [
+        compile_policy(dict(zip(("roleid", "rolename", "resource", "action"), r)))
+        for r in cursor.fetchall()
+    ]
+
+    return Policies(ups, rps)
+
+def policies_version() -> Tuple:
+    cursor = connection.cursor()
+    cursor.execute(POLICIES_VERSION_SQL)
+    return tuple(cursor.fetchone())
+
+_lock = threading.Lock()
+_entries: "OrderedDict[Tuple[Optional[int], int], Policies]" = OrderedDict()
+_version: Optional[Tuple] = None
+
+# the policies version for the current permissions scope, if any
+_scope: ContextVar[Optional[Dict]] = ContextVar('permissions_scope', default=None)
+
+@contextmanager
+def permissions_scope() -> Iterator[None]:
+    """Within this context policy changes made by other processes are
+    only picked up at the first permission check.
+    """
+    token = _scope.set({})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+def current_version() -> Tuple:
+    scope = _scope.get()
+    if scope is None:
+        return policies_version()
+    if 'version' not in scope:
+        scope['version'] = policies_version()
+    return scope['version']
+
+def get_policies(collectionid: Optional[int], userid: int) -> Policies:
+    "The policies that apply to userid in collectionid."
+    global _version
+    key = (collectionid, userid)
+    version = current_version()
+    with _lock:
+        if version != _version:
+            _entries.clear()
+            _version = version
+        policies = _entries.get(key, None)
+        if policies is not None:
+            _entries.move_to_end(key)
+            return policies
+
+    policies = load_policies(collectionid, userid)
+
+    with _lock:
+        if version == _version:
+            _entries[key] = policies
+            while len(_entries) > CACHE_SIZE:
+                _entries.popitem(last=False)
+    return policies
+
+def clear() -> None:
+    global _version
+    with _lock:
+        _entries.clear()
+        _version = None
+    scope = _scope.get()
+    if scope is not None:
+        scope.pop('version', None)
+
+def policies_changed(sender, **kwargs) -> None:
+    clear()
+
+for model in (models.UserPolicy, models.RolePolicy, models.UserRole, models.Role):
+    signals.post_save.connect(policies_changed, sender=model, dispatch_uid=f'policy_cache_{model.__name__}_save')
+    signals.post_delete.connect(policies_changed, sender=model, dispatch_uid=f'policy_cache_{model.__name__}_delete')
@@ -4,7 +4,7 @@ from django.test import TestCase, Client
 
 from specifyweb.specify.api_tests import ApiTests
 from specifyweb.specify import models as spmodels
-from . import models, permissions, views, initialize
+from . import models, permissions, views, initialize, policy_cache
 
 class PermissionsApiTest(ApiTests):
     def setUp(self):
@@ -518,3 +518,53 @@ class PermissionsApiTest(ApiTests):
             content_type='application/json',
         )
         self.assertEqual(response.status_code, 204)
+
+class PolicyCacheTests(ApiTests):
+    def setUp(self):
+        super().setUp()
+        initialize.wipe_permissions()
+        policy_cache.clear()
+
+    def test_like_to_regex(self) -> None:
+        self.assertTrue(policy_cache.like_to_regex('%').fullmatch('/table/agent'))
+        self.assertTrue(policy_cache.like_to_regex('/table/%').fullmatch('/table/agent'))
+        self.assertFalse(policy_cache.like_to_regex('/table/%').fullmatch('/field/agent/lastname'))
+        self.assertTrue(policy_cache.like_to_regex('/table/agen_').fullmatch('/table/AGENT'))
+        self.assertFalse(policy_cache.like_to_regex('/table/a.ent').fullmatch('/table/agent'))
+        self.assertTrue(policy_cache.like_to_regex('100\\%').fullmatch('100%'))
+        self.assertFalse(policy_cache.like_to_regex('100\\%').fullmatch('1000'))
+
+    def test_policy_changes_seen(self) -> None:
+        def allowed() -> bool:
+            return permissions.query(self.collection.id, self.specifyuser.id, '/table/agent', 'read').allowed
+
+        self.assertFalse(allowed())
+
+        policy = models.UserPolicy.objects.create(
+            collection=self.collection,
+            specifyuser=self.specifyuser,
+            resource='/table/%',
+            action='read',
+        )
+        self.assertTrue(allowed())
+
+        policy.delete()
+        self.assertFalse(allowed())
+
+        role = models.Role.objects.create(collection=self.collection, name='test role')
+        role.policies.create(resource='/table/agent', action='%')
+        models.UserRole.objects.create(specifyuser=self.specifyuser, role=role)
+        result = permissions.query(self.collection.id, self.specifyuser.id, '/table/agent', 'read')
+        self.assertTrue(result.allowed)
+        self.assertEqual([role.id], [p['roleid'] for p in result.matching_role_policies])
+
+    def test_cached_within_scope(self) -> None:
+        models.UserPolicy.objects.create(
+            collection=None,
+            specifyuser=self.specifyuser,
+            resource='%',
+            action='%',
+        )
+        with policy_cache.permissions_scope():
+            policies = policy_cache.get_policies(self.collection.id, self.specifyuser.id)
+            self.assertIs(policies, policy_cache.get_policies(self.collection.id, self.specifyuser.id))
@@ -70,11 +70,42 @@ STATS_URL = "https://stats.specifycloud.org/capture"
 # Must exist and be writeable by the web server process.
 WB_UPLOAD_LOG_DIR = "/home/specify/wb_upload_logs"
 
+# Workbench validations of data sets with at least
+# WB_VALIDATION_SHARD_MIN_ROWS rows are split into this many
+# row ranges that are validated in parallel by the worker(s).
+# Each range is validated independently, so a record that would
+# only be created by a row in an earlier range is reported as a
+# new record instead of a match. A value of 1 disables sharding.
+WB_VALIDATION_SHARDS = 1
+WB_VALIDATION_SHARD_MIN_ROWS = 10000
+
 # Asynchronously generated exports are placed in
 # the following directory. This includes query result
 # exports and Darwin Core archives.
 DEPOSITORY_DIR = '/home/specify/specify_depository'
 
+# Number of rows fetched from the database at a time when writing
+# query results and Darwin Core archives to files. Larger values
+# trade memory for fewer round trips.
+EXPORT_FETCH_SIZE = 2000
+
+# Query and Darwin Core archive exports run as celery tasks. Each
+# user can have at most this many exports queued or running at once.
+EXPORT_MAX_CONCURRENT_PER_USER = 2
+
+# Number of built queries cached by each web server process
+# so that paging through query results does not build the same
+# query again. A value of 0 disables the cache.
+QUERY_BUILD_CACHE_SIZE = 256
+
+# The tables of an express search are searched concurrently by a pool
+# of this many threads per web server process, each holding a database
+# connection while searching. A table search still running after
+# EXPRESS_SEARCH_TABLE_TIMEOUT seconds is stopped and whatever it found
+# by then is returned, flagged as timed out.
+EXPRESS_SEARCH_MAX_WORKERS = 4
+EXPRESS_SEARCH_TABLE_TIMEOUT = 5
+
 # Old notifications are deleted after this many days.
 # If DEPOSITORY_DIR is being cleaned out with a
 # scheduled job, this interval should be shorter
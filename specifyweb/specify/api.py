@@ -15,6 +15,7 @@ logger = logging.getLogger(__name__)
 
 from django import forms
 from django.db import transaction
+from django.db.models import QuerySet, prefetch_related_objects
 from django.http import (HttpResponse, HttpResponseBadRequest,
                          Http404, HttpResponseNotAllowed, QueryDict)
 from django.core.exceptions import ObjectDoesNotExist, FieldError, FieldDoesNotExist
@@ -27,7 +28,7 @@ from .autonumbering import autonumber_and_save
 from .uiformatters import AutonumberOverflowException
 from .filter_by_col import filter_by_collection
 from .auditlog import auditlog
-from .calculated_fields import calculate_extra_fields
+from .calculated_fields import calculate_extra_fields, prefetch_extra_fields
 
 ReadPermChecker = Callable[[Any], None]
 
@@ -239,6 +240,7 @@ def get_resource(name, id, checker: ReadPermChecker, recordsetid=None) -> Dict:
     data about the resource's relationship to the given record set.
     """
     obj = get_object_or_404(name, id=int(id))
+    prefetch_for_serialization([obj])
     data = _obj_to_data(obj, checker)
     if recordsetid is not None:
         data['recordset_info'] = get_recordset_info(obj, recordsetid)
@@ -458,6 +460,14 @@ def is_dependent_field(obj, field_name: str) -> bool:
                 obj.discipline.paleocontextchildtable == "locality" and
                 obj.discipline.ispaleocontextembedded))))
 
+# The related records is_dependent_field reads to decide whether the
+# collectingevent or paleocontext of a record is embedded in it.
+EMBEDDING_SETTINGS = {
+    'Collectionobject': 'collection__discipline',
+    'Collectingevent': 'discipline',
+    'Locality': 'discipline',
+}
+
 def get_related_or_none(obj, field_name: str) -> Any:
     try:
         return getattr(obj, field_name)
@@ -702,6 +712,54 @@ def obj_to_data(obj) -> Dict[str, Any]:
     # read permisions enforcement.
     return _obj_to_data(obj, lambda o: None)
 
+def prefetch_for_serialization(objs: Iterable) -> None:
+    """Fetch in bulk the records _obj_to_data would fetch one at a time
+    to serialize the Django model instances 'objs': their dependent
+    records, those of the dependent records in turn, and the extra
+    fields of them all.
+
+    The number of queries is then bounded by the dependent relations
+    of the models involved, whatever the number of records.
+    """
+    by_model: Dict[Any, List] = {}
+    for obj in objs:
+        by_model.setdefault(obj.__class__, []).append(obj)
+
+    nested: List = []
+    for model, instances in by_model.items():
+        nested.extend(prefetch_dependents(model, instances))
+        prefetch_extra_fields(model, instances)
+
+    if nested:
+        prefetch_for_serialization(nested)
+
+def prefetch_dependents(model, objs: List) -> List:
+    "Fetch the dependent records of the instances of model 'objs' and return them."
+    settings = EMBEDDING_SETTINGS.get(model.__name__, None)
+    if settings is not None:
+        prefetch_related_objects(objs, settings)
+
+    dependents: List = []
+    for field in model._meta.get_fields():
+        if field.auto_created or not (field.many_to_one or field.one_to_one):
+            continue
+        owners = [obj for obj in objs if is_dependent_field(obj, field.name)]
+        if owners:
+            prefetch_related_objects(owners, field.name)
+            dependents.extend(related for related in (getattr(obj, field.name) for obj in owners)
+                              if related is not None)
+
+    for rel in model._meta.get_fields():
+        if not rel.one_to_many:
+            continue
+        field_name = rel.get_accessor_name()
+        field = model.specify_model.get_field(field_name)
+        if field is not None and field.dependent:
+            prefetch_related_objects(objs, field_name)
+            dependents.extend(related for obj in objs for related in getattr(obj, field_name).all())
+
+    return dependents
+
 def _obj_to_data(obj, perm_checker: ReadPermChecker) -> Dict[str, Any]:
     """Return a (potentially nested) dictionary of the fields of the
     Django model instance 'obj'.
@@ -832,6 +890,10 @@ def objs_to_data_(
     else:
         objs = objs[offset:offset + limit]
 
+    if isinstance(objs, QuerySet):
+        objs = list(objs)
+        prefetch_for_serialization(objs)
+
     return {'objects': [mapper(o) for o in objs],
             'meta': {'limit': limit,
                      'offset': offset,
@@ -6,8 +6,10 @@ from datetime import datetime
 import json
 from unittest import skip
 
+from django.db import connection
 from django.db.models import Max
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 
 from specifyweb.permissions.models import UserPolicy
 from specifyweb.specify import api, models, scoping
@@ -359,6 +361,48 @@ class InlineApiTests(ApiTests):
         self.assertTrue(isinstance(co['preparations'], list))
         self.assertEqual(co['preparations'][0]['preparationattachments'], [])
 
+    def test_collection_queries_dont_grow_with_inlines(self):
+        preptype = models.Preptype.objects.create(
+            collection=self.collection)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                api.get_collection(self.collection, 'collectionobject', skip_perms_check)
+            return len(queries)
+
+        self.collectionobjects[0].determinations.create(iscurrent=True)
+        self.collectionobjects[0].preparations.create(
+            collectionmemberid=self.collection.id,
+            preptype=preptype)
+        expected = count_queries()
+
+        for co in self.collectionobjects:
+            for i in range(3):
+                co.determinations.create(iscurrent=False, number1=i)
+                co.preparations.create(
+                    collectionmemberid=self.collection.id,
+                    preptype=preptype,
+                    countamt=i)
+        self.assertEqual(count_queries(), expected)
+
+    def test_prefetched_extra_fields(self):
+        preptype = models.Preptype.objects.create(
+            collection=self.collection)
+        for i in range(3):
+            self.collectionobjects[0].preparations.create(
+                collectionmemberid=self.collection.id,
+                preptype=preptype,
+                countamt=i)
+
+        co = models.Collectionobject.objects.get(id=self.collectionobjects[0].id)
+        data = api.get_resource('collectionobject', co.id, skip_perms_check)
+        self.assertEqual(data['totalCountAmt'], 3)
+        self.assertEqual(data['actualTotalCountAmt'], 3)
+        for prep in co.preparations.all():
+            prep_data = next(p for p in data['preparations'] if p['id'] == prep.id)
+            self.assertEqual(prep_data['actualCountAmt'], api.obj_to_data(prep)['actualCountAmt'])
+            self.assertEqual(prep_data['isonloan'], False)
+
     def test_get_resource_with_to_one_inlines(self):
         self.collectionobjects[0].collectionobjectattribute = \
             models.Collectionobjectattribute.objects.create(collectionmemberid=self.collection.id)
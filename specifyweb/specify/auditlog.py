@@ -83,6 +83,13 @@ class AuditLog(object):
         return log_obj
         
     def _log(self, action, obj, agent, parent_record):
+        log_obj = self.make_log(action, obj, agent, parent_record)
+        if log_obj is not None:
+            log_obj.save(force_insert=True)
+        return log_obj
+
+    def make_log(self, action, obj, agent, parent_record):
+        "Returns an unsaved audit log record for the action, or None if auditing is off."
         agent_id = agent if isinstance(agent, int) else (agent and agent.id)
         if self.isAuditing():
             logger.info("inserting into auditlog: %s", [action, obj, agent, parent_record])
@@ -101,7 +108,7 @@ class AuditLog(object):
                     parentId = scopeId
                     parentTbl = model.tableId
 
-            return Spauditlog.objects.create(
+            return Spauditlog(
                 action=action,
                 parentrecordid=parentId,
                 parenttablenum=parentTbl,
@@ -1,63 +1,152 @@
 import logging
 
-from typing import Dict, Any
+from typing import Dict, Any, List
 
-from django.db.models import Count, Sum
+from django.db.models import Count
 from django.db import connection
 
 from . import models
 
 logger = logging.getLogger(__name__)
 
+# The instance attribute holding the extra fields calculated for it
+# in bulk by prefetch_extra_fields.
+PREFETCHED_ATTR = '_prefetched_extra_fields'
+
 def get_model(name: str):
     """Fetch an ORM model from the module dynamically so that
     the typechecker doesn't complain.
     """
     return getattr(models, name.capitalize())
 
-def calculate_extra_fields(obj, data: Dict[str, Any]) -> Dict[str, Any]:
-    extra: Dict[str, Any] = {}
-    cursor = connection.cursor()
-
-    if isinstance(obj, get_model('Preparation')):
-        cursor.execute("""
-   select coalesce(
+# The count of a preparation not given away, exchanged or disposed of.
+AVAILABLE_COUNTAMT = """coalesce(
       p.countamt
       - (select coalesce(sum(gp.quantity), 0) from giftpreparation gp where gp.preparationid = p.preparationid and gp.quantity is not null)
       - (select coalesce(sum(ep.quantity), 0) from exchangeoutprep ep where ep.preparationid = p.preparationid and ep.quantity is not null)
       - (select coalesce(sum(dp.quantity), 0) from disposalpreparation dp where dp.preparationid = p.preparationid and dp.quantity is not null),
-      0) as ActualCountAmt
-   from preparation p
-   where preparationid = %s
-""", [obj.id])
-        actualCountAmt, = cursor.fetchone()
+      0)"""
 
-        extra['actualCountAmt'] = int(actualCountAmt)
-        extra['isonloan'] = obj.isonloan()
+def id_params(ids: List[int]) -> str:
+    return ', '.join(['%s'] * len(ids))
 
-    elif isinstance(obj, get_model('Specifyuser')):
-        extra['isadmin'] = obj.userpolicy_set.filter(collection=None, resource='%', action='%').exists()
+def preparation_fields(ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    cursor = connection.cursor()
+    cursor.execute(f"""
+   select p.preparationid, {AVAILABLE_COUNTAMT} as ActualCountAmt
+   from preparation p
+   where preparationid in ({id_params(ids)})
+""", ids)
+    actual = dict(cursor.fetchall())
+
+    # see Preparation.isonloan
+    cursor.execute("""
+   select PreparationID, coalesce(
+      sum({GREATEST}(0, coalesce(Quantity - QuantityResolved, 0))),
+      0)
+   from loanpreparation
+   where PreparationID in ({ids}) and not IsResolved
+   group by PreparationID
+""".format(GREATEST='MAX' if connection.vendor == 'sqlite' else 'GREATEST', ids=id_params(ids)), ids)
+    onloan = dict(cursor.fetchall())
+
+    return {id: {
+        'actualCountAmt': int(actual[id]),
+        'isonloan': onloan.get(id, 0) > 0,
+    } for id in ids if id in actual}
+
+def specifyuser_fields(ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    from specifyweb.permissions.models import UserPolicy
+    admins = set(UserPolicy.objects.filter(
+        specifyuser_id__in=ids, collection=None, resource='%', action='%'
+    ).values_list('specifyuser_id', flat=True))
+    return {id: {'isadmin': id in admins} for id in ids}
+
+def collectionobject_fields(ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    cursor = connection.cursor()
+    cursor.execute(f"""
+select collectionobjectid, coalesce(sum(countamt), 0) as TotalCountAmt, coalesce(sum(available), 0) as ActualTotalCountAmt from (
+   select
+   p.collectionobjectid,
+   coalesce(p.countamt, 0) as countamt, -- assume countamt >= 0
+   greatest(0, {AVAILABLE_COUNTAMT}) as available -- the greatest function ensures that if the available amount for some prep goes < 0 it doesn't count againts others
+   from preparation p
+   where collectionobjectid in ({id_params(ids)})
+) available_by_prep
+group by collectionobjectid
+""", ids)
+    totals = {id: (total, actual) for id, total, actual in cursor.fetchall()}
+
+    return {id: {
+        "actualTotalCountAmt": int(totals.get(id, (0, 0))[1]),
+        "totalCountAmt": int(totals.get(id, (0, 0))[0]),
+    } for id in ids}
 
-    elif isinstance(obj, get_model('Collectionobject')):
-        cursor.execute("""
-select coalesce(sum(countamt), 0) as TotalCountAmt, coalesce(sum(available), 0) as ActualTotalCountAmt from (
+def accession_fields(ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    cursor = connection.cursor()
+    cursor.execute(f"""
+select accessionid, count(id) as PreparationCount, coalesce(sum(countamt), 0) as TotalCountAmt, coalesce(sum(available), 0) as ActualTotalCountAmt from (
    select
+   collectionobject.accessionid,
+   p.preparationid as id,
    coalesce(p.countamt, 0) as countamt, -- assume countamt >= 0
-   greatest(0, coalesce(  -- the greatest function ensures that if the available amount for some prep goes < 0 it doesn't count againts others
-      p.countamt
-      - (select coalesce(sum(gp.quantity), 0) from giftpreparation gp where gp.preparationid = p.preparationid and gp.quantity is not null)
-      - (select coalesce(sum(ep.quantity), 0) from exchangeoutprep ep where ep.preparationid = p.preparationid and ep.quantity is not null)
-      - (select coalesce(sum(dp.quantity), 0) from disposalpreparation dp where dp.preparationid = p.preparationid and dp.quantity is not null),
-      0
-   )) as available
+   greatest(0, {AVAILABLE_COUNTAMT}) as available -- the greatest function ensures that if the available amount for some prep goes < 0 it doesn't count againts others
    from preparation p
-   where collectionobjectid = %s
+   join collectionobject using (collectionobjectid)
+   where accessionid in ({id_params(ids)})
 ) available_by_prep
-""", [obj.id])
-        totalCountAmt, actualTotalCountAmt = cursor.fetchone()
-        extra["actualTotalCountAmt"] = int(actualTotalCountAmt)
-        extra["totalCountAmt"] = int(totalCountAmt)
+group by accessionid
+""", ids)
+    totals = {id: (count, total, actual) for id, count, total, actual in cursor.fetchall()}
+
+    co_counts = dict(models.Collectionobject.objects.filter(accession_id__in=ids)
+                     .order_by().values_list('accession_id').annotate(Count('id')))
+
+    extra = {}
+    for id in ids:
+        preparationCount, totalCountAmt, actualTotalCountAmt = totals.get(id, (0, 0, 0))
+        extra[id] = {
+            "actualTotalCountAmt": int(actualTotalCountAmt),
+            "totalCountAmt": int(totalCountAmt),
+            "preparationCount": preparationCount,
+            "collectionObjectCount": co_counts.get(id, 0),
+        }
+    return extra
+
+# The extra fields that have to be queried for, by model, calculated
+# for a list of ids at a time.
+QUERIED_FIELDS = {
+    'Preparation': preparation_fields,
+    'Specifyuser': specifyuser_fields,
+    'Collectionobject': collectionobject_fields,
+    'Accession': accession_fields,
+}
+
+def query_extra_fields(model, ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    "The extra fields of the records of model with ids that come from the database."
+    calculate = QUERIED_FIELDS.get(model.__name__, None)
+    if calculate is None or not ids:
+        return {id: {} for id in ids}
+    return calculate(ids)
+
+def prefetch_extra_fields(model, objs) -> None:
+    """Calculate the extra fields of all the instances of model in objs
+    with a few queries, to be picked up by calculate_extra_fields.
+    """
+    extra = query_extra_fields(model, list(set(obj.id for obj in objs if obj.id is not None)))
+    for obj in objs:
+        if obj.id in extra:
+            setattr(obj, PREFETCHED_ATTR, extra[obj.id])
+
+def calculate_extra_fields(obj, data: Dict[str, Any]) -> Dict[str, Any]:
+    extra: Dict[str, Any] = {}
 
+    prefetched = getattr(obj, PREFETCHED_ATTR, None)
+    if prefetched is None:
+        prefetched = query_extra_fields(obj.__class__, [obj.id]).get(obj.id, {})
+    extra.update(prefetched)
+
+    if isinstance(obj, get_model('Collectionobject')):
         dets = data['determinations'] or []
         extra['currentdetermination'] = next((det['resource_uri'] for det in dets if det['iscurrent']), None)
 
@@ -82,31 +171,4 @@ select coalesce(sum(countamt), 0) as TotalCountAmt, coalesce(sum(available), 0)
         extra['resolvedPreps'] = items - unresolvedItems
         extra['resolvedItems'] = quantities - unresolvedQuantities
 
-    elif isinstance(obj, get_model('Accession')):
-        cursor.execute("""
-select count(id) as PreparationCount, coalesce(sum(countamt), 0) as TotalCountAmt, coalesce(sum(available), 0) as ActualTotalCountAmt from (
-   select
-   p.preparationid as id,
-   coalesce(p.countamt, 0) as countamt, -- assume countamt >= 0
-   greatest(0, coalesce(  -- the greatest function ensures that if the available amount for some prep goes < 0 it doesn't count againts others
-      p.countamt
-      - (select coalesce(sum(gp.quantity), 0) from giftpreparation gp where gp.preparationid = p.preparationid and gp.quantity is not null)
-      - (select coalesce(sum(ep.quantity), 0) from exchangeoutprep ep where ep.preparationid = p.preparationid and ep.quantity is not null)
-      - (select coalesce(sum(dp.quantity), 0) from disposalpreparation dp where dp.preparationid = p.preparationid and dp.quantity is not null),
-      0
-   )) as available
-   from preparation p
-   join collectionobject using (collectionobjectid)
-   where accessionid = %s
-) available_by_prep
-""", [obj.id])
-
-        preparationCount, totalCountAmt, actualTotalCountAmt = cursor.fetchone()
-        extra["actualTotalCountAmt"] = int(actualTotalCountAmt)
-        extra["totalCountAmt"] = int(totalCountAmt)
-        extra["preparationCount"] = preparationCount
-        extra.update(obj.collectionobjects.aggregate(collectionObjectCount=Count('id')))
-
     return extra
-
-
@@ -1,5 +1,5 @@
 
-from typing import List, Dict, Union, Optional, Iterable, TypeVar, Callable
+from typing import List, Dict, Union, Optional, TypeVar, Callable, Tuple, Any
 from xml.etree import ElementTree
 import os
 import warnings
@@ -22,9 +22,18 @@ class FieldDoesNotExistError(DoesNotExistError):
 T = TypeVar('T')
 U = TypeVar('U')
 
+_warned_deprecated = False
+
+def warn_deprecated() -> None:
+    "Warn about the use of the non-strict lookups, once per process."
+    global _warned_deprecated
+    if not _warned_deprecated:
+        _warned_deprecated = True
+        warnings.warn("deprecated. use strict version.", DeprecationWarning)
+
 def strict_to_optional(f: Callable[[U], T], lookup: U, strict: bool) -> Optional[T]:
     try:
-        warnings.warn("deprecated. use strict version.", DeprecationWarning)
+        warn_deprecated()
         return f(lookup)
     except DoesNotExistError:
         if not strict:
@@ -34,23 +43,43 @@ def strict_to_optional(f: Callable[[U], T], lookup: U, strict: bool) -> Optional
 class Datamodel(object):
     tables: List['Table']
 
+    # (tables list, its length, tables by lower cased name, tables by
+    # id), built on first lookup and again if tables is replaced, added
+    # to or removed from. A table replaced in place needs
+    # invalidate_table_index.
+    _table_index: Optional[Tuple[List['Table'], int, Dict[str, 'Table'], Dict[int, 'Table']]] = None
+
+    def _tables_index(self) -> Tuple[Dict[str, 'Table'], Dict[int, 'Table']]:
+        index = self._table_index
+        if index is None or index[0] is not self.tables or index[1] != len(self.tables):
+            # reversed so the first of any tables with the same name or id wins
+            index = (self.tables, len(self.tables),
+                     {table.name.lower(): table for table in reversed(self.tables)},
+                     {table.tableId: table for table in reversed(self.tables)})
+            self._table_index = index
+        return index[2], index[3]
+
+    def invalidate_table_index(self) -> None:
+        "Rebuild the table lookups on next use, after changing tables in place."
+        self._table_index = None
+
     def get_table(self, tablename: str, strict: bool=False) -> Optional['Table']:
         return strict_to_optional(self.get_table_strict, tablename, strict)
 
     def get_table_strict(self, tablename: str) -> 'Table':
         tablename = tablename.lower()
-        for table in self.tables:
-            if table.name.lower() == tablename:
-                return table
+        table = self._tables_index()[0].get(tablename, None)
+        if table is not None:
+            return table
         raise TableDoesNotExistError(_("No table with name: %(table_name)r") % {'table_name':tablename})
 
     def get_table_by_id(self, table_id: int, strict: bool=False) -> Optional['Table']:
         return strict_to_optional(self.get_table_by_id_strict, table_id, strict)
 
     def get_table_by_id_strict(self, table_id: int, strict: bool=False) -> 'Table':
-        for table in self.tables:
-            if table.tableId == table_id:
-                return table
+        table = self._tables_index()[1].get(table_id, None)
+        if table is not None:
+            return table
         raise TableDoesNotExistError(_("No table with id: %(table_id)d") % {'table_id':table_id})
 
     def reverse_relationship(self, relationship: 'Relationship') -> Optional['Relationship']:
@@ -81,16 +110,37 @@ class Table(object):
     def django_name(self) -> str:
         return self.name.capitalize()
 
+    # (fields, relationships and id field with the lengths of the
+    # lists, all_fields, all_fields by lower cased name), built on first
+    # use and again if fields or relationships is replaced, added to or
+    # removed from, or idField is replaced. A field replaced in place
+    # needs invalidate_field_index.
+    _field_index: Optional[Tuple[Tuple[Any, ...], List[Union['Field', 'Relationship']], Dict[str, Union['Field', 'Relationship']]]] = None
+
+    def _fields_index(self) -> Tuple[List[Union['Field', 'Relationship']], Dict[str, Union['Field', 'Relationship']]]:
+        index = self._field_index
+        if index is None or not self._field_index_current(index[0]):
+            all_fields: List[Union['Field', 'Relationship']] = [*self.fields, *self.relationships, self.idField]
+            # reversed so the first of any fields with the same name wins
+            index = ((self.fields, len(self.fields), self.relationships, len(self.relationships), self.idField),
+                     all_fields, {f.name.lower(): f for f in reversed(all_fields)})
+            self._field_index = index
+        return index[1], index[2]
+
+    def _field_index_current(self, source: Tuple[Any, ...]) -> bool:
+        fields, fields_len, relationships, relationships_len, id_field = source
+        return (fields is self.fields and fields_len == len(self.fields)
+                and relationships is self.relationships and relationships_len == len(self.relationships)
+                and id_field is self.idField)
+
+    def invalidate_field_index(self) -> None:
+        "Rebuild the field lookups on next use, after changing fields or relationships in place."
+        self._field_index = None
+
     @property
     def all_fields(self) -> List[Union['Field', 'Relationship']]:
-        def af() -> Iterable[Union['Field', 'Relationship']]:
-            for f in self.fields:
-                yield f
-            for r in self.relationships:
-                yield r
-            yield self.idField
-
-        return list(af())
+        "The fields, relationships and id field of the table. Not to be modified."
+        return self._fields_index()[0]
 
 
     def get_field(self, fieldname: str, strict: bool=False) -> Union['Field', 'Relationship', None]:
@@ -98,9 +148,9 @@ class Table(object):
 
     def get_field_strict(self, fieldname: str) -> Union['Field', 'Relationship']:
         fieldname = fieldname.lower()
-        for field in self.all_fields:
-            if field.name.lower() == fieldname:
-                return field
+        field = self._fields_index()[1].get(fieldname, None)
+        if field is not None:
+            return field
         raise FieldDoesNotExistError(_("Field %(field_name)s not in table %(table_name)s. ") % {'field_name':fieldname, 'table_name':self.name} +
                                      _("Fields: %(fields)s") % {'fields':[f.name for f in self.all_fields]})
 
@@ -1,8 +1,72 @@
 from django.test import TestCase
 from specifyweb.specify.models import datamodel
+from specifyweb.specify.load_datamodel import Datamodel, Table, Relationship, TableDoesNotExistError, FieldDoesNotExistError
 
 class DatamodelTests(TestCase):
-    pass
+    def test_table_lookups(self):
+        for table in datamodel.tables:
+            self.assertIs(datamodel.get_table_strict(table.name.upper()), table)
+            self.assertIs(datamodel.get_table_by_id_strict(table.tableId), table)
+
+        with self.assertRaises(TableDoesNotExistError):
+            datamodel.get_table_strict('nosuchtable')
+        with self.assertRaises(TableDoesNotExistError):
+            datamodel.get_table_by_id_strict(-1)
+        self.assertIsNone(datamodel.get_table('nosuchtable'))
+
+    def test_field_lookups(self):
+        table = datamodel.get_table_strict('Collectionobject')
+        self.assertIs(table.all_fields, table.all_fields)
+        for field in table.all_fields:
+            self.assertIs(table.get_field_strict(field.name.upper()), field)
+
+        with self.assertRaises(FieldDoesNotExistError):
+            table.get_field_strict('nosuchfield')
+        self.assertIsNone(table.get_field('nosuchfield'))
+
+    def test_field_index_follows_changes(self):
+        source = datamodel.get_table_strict('Collectionobject')
+        table = Table()
+        table.classname = source.classname
+        table.idField = source.idField
+        table.fields = list(source.fields)
+        table.relationships = list(source.relationships)
+        self.assertIsNone(table.get_field('newRelationship'))
+
+        rel = Relationship()
+        rel.name = 'newRelationship'
+        table.relationships.append(rel)
+        self.assertIs(table.get_field_strict('newrelationship'), rel)
+        self.assertIn(rel, table.all_fields)
+
+        table.relationships = list(table.relationships)
+        table.relationships.remove(rel)
+        table.relationships.append(Relationship())
+        table.relationships[-1].name = 'otherRelationship'
+        self.assertIsNone(table.get_field('newRelationship'))
+        self.assertIsNotNone(table.get_field('otherRelationship'))
+
+        replacement = Relationship()
+        replacement.name = 'replacedRelationship'
+        table.relationships[-1] = replacement
+        table.invalidate_field_index()
+        self.assertIs(table.get_field_strict('replacedrelationship'), replacement)
+        self.assertIsNone(table.get_field('otherRelationship'))
+
+    def test_table_index_follows_changes(self):
+        model = Datamodel()
+        model.tables = list(datamodel.tables)
+        source = model.get_table_strict('Collectionobject')
+
+        table = Table()
+        table.classname = 'edu.ku.brc.specify.datamodel.NewTable'
+        table.tableId = -1
+        model.tables.append(table)
+        self.assertIs(model.get_table_by_id_strict(-1), table)
+
+        model.tables[model.tables.index(source)] = table
+        model.invalidate_table_index()
+        self.assertIsNone(model.get_table('Collectionobject'))
 
 
 def make_attachments_field_dependent_test(table):
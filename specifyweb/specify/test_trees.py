@@ -1,4 +1,4 @@
-from specifyweb.specify import models
+from specifyweb.specify import models, tree_extras
 from specifyweb.specify.api_tests import ApiTests, get_table
 from specifyweb.specify.tree_stats import get_tree_stats
 from specifyweb.stored_queries.tests import SQLAlchemySetup
@@ -209,3 +209,47 @@ class TreeStatsTest(SqlTreeSetup):
         ]
 
 
+
+class NumberNewNodesTest(GeographyTree):
+
+    def test_new_nodes_numbered(self):
+        Geography = get_table('Geography')
+        county = get_table('Geographytreedefitem').objects.get(name="County")
+        city = get_table('Geographytreedefitem').objects.get(name="City")
+
+        new_nodes = []
+        for parent, name in [(self.kansas, "Johnson"), (self.ill, "Cook"), (self.mo, "Jackson")]:
+            node = Geography(name=name, definitionitem=county, definition=self.geographytreedef, rankid=county.rankid, parent=parent)
+            node.save(skip_tree_extras=True)
+            new_nodes.append(node)
+
+        for name in ["Chicago", "Evanston"]:
+            node = Geography(name=name, definitionitem=city, definition=self.geographytreedef, rankid=city.rankid, parent=new_nodes[1])
+            node.save(skip_tree_extras=True)
+            new_nodes.append(node)
+
+        tree_extras.number_new_nodes('geography', [n.id for n in new_nodes])
+        tree_extras.validate_tree_numbering('geography')
+
+        for node in Geography.objects.all():
+            descendants = Geography.objects.filter(
+                nodenumber__gt=node.nodenumber,
+                nodenumber__lte=node.highestchildnodenumber,
+            ).count()
+            self.assertEqual(self._count_descendants(node), descendants, node.name)
+
+    def _count_descendants(self, node):
+        return sum(1 + self._count_descendants(child) for child in node.children.all())
+
+    def test_fullnames_of_given_nodes(self):
+        Geography = get_table('Geography')
+        county = get_table('Geographytreedefitem').objects.get(name="County")
+        Geography.objects.filter(id=self.doug.id).update(fullname=None)
+        Geography.objects.filter(id=self.greene.id).update(fullname=None)
+        self.geographytreedef.treedefitems.filter(rankid__lt=county.rankid).update(isinfullname=False)
+        self.geographytreedef.treedefitems.filter(rankid__gte=county.rankid).update(isinfullname=True)
+
+        tree_extras.set_fullnames(self.geographytreedef, null_only=True, node_ids=[self.doug.id])
+
+        self.assertEqual("Douglas", Geography.objects.get(id=self.doug.id).fullname)
+        self.assertIsNone(Geography.objects.get(id=self.greene.id).fullname)
@@ -5,7 +5,7 @@ logger = logging.getLogger(__name__)
 
 
 from django.db import models, connection
-from django.db.models import F, Q, ProtectedError
+from django.db.models import Case, F, Q, ProtectedError, Value, When
 from django.conf import settings
 
 from specifyweb.businessrules.exceptions import TreeBusinessRuleException
@@ -470,7 +470,12 @@ def definition_joins(table, depth):
         for j in range(depth)
     ])
 
-def set_fullnames(treedef, null_only=False, node_number_range=None):
+def set_fullnames(treedef, null_only=False, node_number_range=None, node_ids=None):
+    """Recompute the fullnames of the nodes of treedef, optionally only
+    those without one, within a node number range, or with the given
+    ids. Given ids are updated a batch of nodes of the same rank at a
+    time, joining only as many ancestors as nodes of that rank can have.
+    """
     table = treedef.treeentries.model._meta.db_table
     depth = treedef.treedefitems.count()
     reverse = treedef.fullnamedirection == -1
@@ -478,6 +483,33 @@ def set_fullnames(treedef, null_only=False, node_number_range=None):
     logger.info('set_fullnames: %s', (table, treedefid, depth, reverse))
     if depth < 1:
         return
+
+    conditions = []
+    if null_only:
+        conditions.append("and t0.fullname is null")
+    if node_number_range is not None:
+        conditions.append("and t0.nodenumber between {} and {}".format(node_number_range[0], node_number_range[1]))
+
+    if node_ids is None:
+        return _update_fullnames(table, treedefid, depth, reverse, conditions)
+
+    model = treedef.treeentries.model
+    rankids = sorted(treedef.treedefitems.values_list('rankid', flat=True))
+    by_rank = {}
+    for ids in _batches(sorted(set(node_ids))):
+        for node_id, rankid in model.objects.filter(id__in=ids, definition_id=treedefid).values_list('id', 'rankid'):
+            by_rank.setdefault(rankid, []).append(node_id)
+
+    for rankid, ids in sorted(by_rank.items()):
+        # a node can have at most one ancestor per higher rank
+        rank_depth = max(1, sum(1 for r in rankids if r <= rankid))
+        for batch in _batches(ids):
+            _update_fullnames(table, treedefid, rank_depth, reverse, [
+                *conditions,
+                "and t0.{table}id in ({ids})".format(table=table, ids=','.join(str(int(id)) for id in batch)),
+            ])
+
+def _update_fullnames(table, treedefid, depth, reverse, conditions):
     cursor = connection.cursor()
     sql = (
         "update {table} t0\n"
@@ -487,8 +519,7 @@ def set_fullnames(treedef, null_only=False, node_number_range=None):
         "where t{root}.parentid is null\n"
         "and t0.{table}treedefid = {treedefid}\n"
         "and t0.acceptedid is null\n"
-        "{null_only}\n"
-        "{node_number_range}\n"
+        "{conditions}\n"
     ).format(
         root=depth-1,
         table=table,
@@ -496,8 +527,7 @@ def set_fullnames(treedef, null_only=False, node_number_range=None):
         set_expr="t0.fullname = {}".format(fullname_expr(depth, reverse)),
         parent_joins=parent_joins(table, depth),
         definition_joins=definition_joins(table, depth),
-        null_only="and t0.fullname is null" if null_only else "",
-        node_number_range="and t0.nodenumber between {} and {}".format(node_number_range[0], node_number_range[1]) if not (node_number_range is None) else ''
+        conditions="\n".join(conditions),
     )
 
     logger.debug('fullname update sql:\n%s', sql)
@@ -659,4 +689,97 @@ def renumber_tree(table):
     from .models import datamodel, Sptasksemaphore
     tree_model = datamodel.get_table(table)
     tasknames = [name.format(tree_model.name) for name in ("UpdateNodes{}", "BadNodes{}")]
-    Sptasksemaphore.objects.filter(taskname__in=tasknames).update(islocked=False)
\ No newline at end of file
+    Sptasksemaphore.objects.filter(taskname__in=tasknames).update(islocked=False)
+
+# Number of parents whose gaps are opened, or nodes numbered, per UPDATE
+# by number_new_nodes.
+NUMBERING_BATCH_SIZE = 500
+
+def number_new_nodes(table, node_ids):
+    """Assign node numbers to nodes that were saved with skip_tree_extras,
+    as the workbench does, without renumbering the whole tree.
+
+    The new nodes are grouped by the existing nodes they were added
+    under. A gap for all of the new nodes under each such parent is
+    opened directly after the parent's node number, as open_interval
+    does, but for many parents per UPDATE. The new subtrees are then
+    numbered into the gaps. Falls back on renumber_tree when any other
+    node of the tree is unnumbered or a new node has no parent.
+    """
+    from . import models
+    model = getattr(models, table.capitalize())
+
+    parent_of = {}
+    for ids in _batches(sorted(set(node_ids))):
+        parent_of.update(model.objects.filter(id__in=ids, nodenumber=None).values_list('id', 'parent_id'))
+
+    if not parent_of:
+        return
+
+    if None in parent_of.values() or model.objects.filter(nodenumber=None).count() != len(parent_of):
+        logger.info('falling back on full renumbering of %s tree', table)
+        renumber_tree(table)
+        return
+
+    children = {}
+    for node_id, parent_id in sorted(parent_of.items()):
+        children.setdefault(parent_id, []).append(node_id)
+
+    def subtree_size(node_id):
+        return 1 + sum(subtree_size(child) for child in children.get(node_id, []))
+
+    attach_points = [parent_id for parent_id in children if parent_id not in parent_of]
+    parent_numbers = dict(model.objects.filter(id__in=attach_points).values_list('id', 'nodenumber'))
+    gaps = sorted(
+        (parent_numbers[parent_id], parent_id, sum(subtree_size(child) for child in children[parent_id]))
+        for parent_id in attach_points
+    )
+
+    logger.info('opening %d gaps for %d new %s nodes', len(gaps), len(parent_of), table)
+
+    # Open the gaps starting from the right so that the node numbers of
+    # the parents yet to be processed are not shifted.
+    for batch in reversed(list(_batches(gaps))):
+        shifts = []
+        total = 0
+        for node_number, _, size in batch:
+            total += size
+            shifts.append((node_number, total))
+
+        model.objects.filter(highestchildnodenumber__gte=batch[0][0]).update(
+            nodenumber=F('nodenumber') + Case(
+                *[When(nodenumber__gt=nn, then=Value(shift)) for nn, shift in reversed(shifts)],
+                default=Value(0),
+            ),
+            highestchildnodenumber=F('highestchildnodenumber') + Case(
+                *[When(highestchildnodenumber__gte=nn, then=Value(shift)) for nn, shift in reversed(shifts)],
+                default=Value(0),
+            ),
+        )
+
+    numbers = {}
+    def number_subtree(node_id, next_number):
+        node_number = next_number
+        next_number += 1
+        for child in children.get(node_id, []):
+            next_number = number_subtree(child, next_number)
+        numbers[node_id] = (node_number, next_number - 1)
+        return next_number
+
+    shift = 0
+    for node_number, parent_id, size in gaps:
+        next_number = node_number + shift + 1
+        for child in children[parent_id]:
+            next_number = number_subtree(child, next_number)
+        shift += size
+
+    for batch in _batches(sorted(numbers.items())):
+        model.objects.filter(id__in=[node_id for node_id, _ in batch]).update(
+            nodenumber=Case(*[When(id=node_id, then=Value(nn)) for node_id, (nn, _) in batch]),
+            highestchildnodenumber=Case(*[When(id=node_id, then=Value(hcnn)) for node_id, (_, hcnn) in batch]),
+        )
+
+def _batches(items, size=NUMBERING_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,92 @@
+"""
+Cache of the queries built by execution.build_query.
+
+Building a query parses the object formatters, looks up the schema
+configuration and constructs the joins for every field, which takes
+longer than running it when paging through the results. The built
+sqlalchemy queries are kept, per process, keyed by the query
+definition, filter values included, and the collection and user they
+were built for. A cached query is rebound to the session it is used
+in, so the offset, limit and any other clauses added by the caller
+are not part of the key.
+
+The entries are dropped when the app resources (which include the
+formatters and preferences) or the schema configuration change, as
+detected by a cheap query over the modification timestamps of those
+tables, so changes made by other processes are picked up as well.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, List, NamedTuple, Optional, Set, Tuple
+
+from django.conf import settings
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+class DeferredAggregation(NamedTuple):
+    # the column of the query holding the ids of the records to aggregate the related records of
+    column: int
+    aggregation: Any
+
+class CachedQuery(NamedTuple):
+    query: Any
+    order_by_exprs: List[Any]
+    tables_to_read: Set[Any]
+    deferred: List[DeferredAggregation] = []
+
+FORMATTER_VERSION_SQL = text("""
+select
+  (select max(TimestampModified) from spappresourcedata),
+  (select count(*) from spappresourcedata),
+  (select max(TimestampModified) from splocalecontainer),
+  (select max(TimestampModified) from splocalecontaineritem),
+  (select count(*) from splocalecontaineritem)
+""")
+
+_lock = threading.Lock()
+_entries: "OrderedDict[Hashable, CachedQuery]" = OrderedDict()
+_version: Optional[Tuple] = None
+
+def formatter_version(session) -> Tuple:
+    "A value that changes whenever anything the formatting of query results depends on changes."
+    return tuple(session.execute(FORMATTER_VERSION_SQL).first())
+
+def lookup(session, key: Hashable) -> Tuple[Optional[CachedQuery], Optional[Tuple]]:
+    """Returns the query cached under key, if any, and the current
+    formatter version to store a newly built query with.
+    """
+    global _version
+    if settings.QUERY_BUILD_CACHE_SIZE <= 0:
+        return None, None
+
+    version = formatter_version(session)
+    with _lock:
+        if version != _version:
+            if _entries:
+                logger.debug("app resources or schema config changed, clearing query build cache")
+            _entries.clear()
+            _version = version
+            return None, version
+
+        entry = _entries.get(key, None)
+        if entry is not None:
+            _entries.move_to_end(key)
+        return entry, version
+
+def store(key: Hashable, entry: CachedQuery, version: Optional[Tuple]) -> None:
+    "Cache entry under key unless things changed since version was obtained from lookup."
+    with _lock:
+        if version is None or version != _version:
+            return
+        _entries[key] = entry
+        while len(_entries) > settings.QUERY_BUILD_CACHE_SIZE:
+            _entries.popitem(last=False)
+
+def clear() -> None:
+    global _version
+    with _lock:
+        _entries.clear()
+        _version = None
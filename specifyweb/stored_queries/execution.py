@@ -2,8 +2,7 @@ import csv
 import json
 import logging
 import os
-import re
-import xml.dom.minidom
+from xml.etree import ElementTree
 from collections import namedtuple, defaultdict
 from datetime import datetime, timedelta
 from functools import reduce
@@ -13,7 +12,7 @@ from django.db import transaction
 from sqlalchemy import sql, orm
 from sqlalchemy.sql.expression import asc, desc, insert, literal
 
-from . import models
+from . import build_cache, keyset, models
 from .format import ObjectFormatter
 from .query_construct import QueryConstruct
 from .queryfield import QueryField
@@ -133,7 +132,7 @@ def field_specs_from_json(json_fields):
 
     return field_specs
 
-def do_export(spquery, collection, user, filename, exporttype, host):
+def do_export(spquery, collection, user, filename, exporttype, host, progress=None):
     """Executes the given deserialized query definition, sending the
     to a file, and creates "export completed" message when finished.
 
@@ -153,10 +152,11 @@ def do_export(spquery, collection, user, filename, exporttype, host):
             query_to_csv(session, collection, user, tableid, field_specs, path,
                          recordsetid=recordsetid, 
                          captions=spquery['captions'], strip_id=True,
-                         distinct=spquery['selectdistinct'], delimiter=spquery['delimiter'],)
+                         distinct=spquery['selectdistinct'], delimiter=spquery['delimiter'],
+                         progress=progress)
         elif exporttype == 'kml':
             query_to_kml(session, collection, user, tableid, field_specs, path, spquery['captions'], host,
-                         recordsetid=recordsetid, strip_id=False)
+                         recordsetid=recordsetid, strip_id=False, progress=progress)
             message_type = 'query-export-to-kml-complete'
 
     Message.objects.create(user=user, content=json.dumps({
@@ -181,15 +181,26 @@ def stored_query_to_csv(query_id, collection, user, path):
 
 def query_to_csv(session, collection, user, tableid, field_specs, path,
                  recordsetid=None, captions=False, strip_id=False, row_filter=None,
-                 distinct=False, delimiter=','):
+                 distinct=False, delimiter=',', fetch_size=None, progress=None, query_filter=None):
     """Build a sqlalchemy query using the QueryField objects given by
     field_specs and send the results to a CSV file at the given
     file path.
 
+    If given, query_filter is applied to the built query before it is
+    run, e.g. to add filters, and row_filter selects the rows written.
+
+    Rows are fetched from the server side cursor and written fetch_size
+    rows at a time, defaulting to settings.EXPORT_FETCH_SIZE. See
+    fetch_batches for the progress callback, which is given the
+    estimate_count of the query as the total.
+
     See build_query for details of the other accepted arguments.
     """
     set_group_concat_max_len(session)
     query, __ = build_query(session, collection, user, tableid, field_specs, recordsetid, replace_nulls=True, distinct=distinct)
+    if query_filter is not None:
+        query = query_filter(query)
+    fetch_size = fetch_size or settings.EXPORT_FETCH_SIZE
 
     logger.debug('query_to_csv starting')
 
@@ -201,16 +212,80 @@ def query_to_csv(session, collection, user, tableid, field_specs, path,
                 header = ['id'] + header
             csv_writer.writerow(header)
 
-        for row in query.yield_per(1):
-            if row_filter is not None and not row_filter(row): continue
-            encoded = [
-                re.sub('\r|\n', ' ', str(f))
-                for f in (row[1:] if strip_id and not distinct else row)
-            ]
-            csv_writer.writerow(encoded)
+        skip = 1 if strip_id and not distinct else 0
+        total = estimate_count(session, query) if progress is not None else None
+        for batch in fetch_batches(query, fetch_size, progress, total):
+            csv_writer.writerows(
+                [str(f).translate(NEWLINES_TO_SPACES) for f in row[skip:]]
+                for row in batch
+                if row_filter is None or row_filter(row)
+            )
 
     logger.debug('query_to_csv finished')
 
+# Line breaks are not allowed within exported CSV values.
+NEWLINES_TO_SPACES = str.maketrans({'\r': ' ', '\n': ' '})
+
+def fetch_batches(query, fetch_size, progress=None, total=None):
+    """Yield the rows of query in lists of up to fetch_size rows,
+    fetching that many rows at a time from the cursor.
+
+    If given, progress is called with the number of rows fetched so far
+    and the estimated total after each batch. Counting the rows would
+    take another pass over the whole query, so the total is an
+    estimate, e.g. from estimate_count, or None if there is none. It is
+    raised to the rows fetched if they come to more.
+    """
+    fetched = 0
+    batch = []
+
+    def report() -> None:
+        if progress is not None:
+            progress(fetched, None if total is None else max(total, fetched))
+
+    for row in query.yield_per(fetch_size):
+        batch.append(row)
+        if len(batch) == fetch_size:
+            yield batch
+            fetched += len(batch)
+            report()
+            batch = []
+    if batch:
+        yield batch
+        fetched += len(batch)
+        report()
+
+def estimate_count(session, query):
+    """The optimizer's estimate of the number of rows query returns,
+    from its EXPLAIN, or None if there is none. Unlike counting the
+    rows this does not run the query.
+    """
+    dialect = session.bind.dialect
+    if dialect.name != 'mysql':
+        return None
+    compiled = query.statement.compile(dialect=dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute('explain ' + str(compiled), params)
+        columns = [d[0].lower() for d in cursor.description]
+        plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except dialect.dbapi.Error as e:
+        logger.warning("could not estimate the size of the query: %s", e)
+        return None
+    finally:
+        cursor.close()
+
+    # the rows of the outermost select come out of the join of its
+    # tables, each contributing rows * filtered% per row of the ones
+    # before it
+    outer = [step for step in plan if step['id'] == plan[0]['id']] if plan else []
+    if not outer or any(step['rows'] is None for step in outer):
+        return None
+    return int(reduce(
+        lambda estimate, step: estimate * step['rows'] * float(step.get('filtered') or 100) / 100,
+        outer, 1.0))
+
 def row_has_geocoords(coord_cols, row):
     """Assuming single point
     """
@@ -218,26 +293,22 @@ def row_has_geocoords(coord_cols, row):
 
 
 def query_to_kml(session, collection, user, tableid, field_specs, path, captions, host,
-                 recordsetid=None, strip_id=False):
+                 recordsetid=None, strip_id=False, fetch_size=None, progress=None):
     """Build a sqlalchemy query using the QueryField objects given by
     field_specs and send the results to a kml file at the given
     file path.
 
+    Placemarks are written to the file as the rows are fetched, so the
+    document is never held in memory as a whole.
+
     See build_query for details of the other accepted arguments.
     """
     set_group_concat_max_len(session)
     query, __ = build_query(session, collection, user, tableid, field_specs, recordsetid, replace_nulls=True)
+    fetch_size = fetch_size or settings.EXPORT_FETCH_SIZE
 
     logger.debug('query_to_kml starting')
 
-    kmlDoc = xml.dom.minidom.Document()
-
-    kmlElement = kmlDoc.createElementNS('http://earth.google.com/kml/2.2', 'kml')
-    kmlElement.setAttribute('xmlns','http://earth.google.com/kml/2.2')
-    kmlElement = kmlDoc.appendChild(kmlElement)
-    documentElement = kmlDoc.createElement('Document')
-    documentElement = kmlElement.appendChild(documentElement)
-
     if not strip_id:
         model = models.models_by_tableid[tableid]
         table = str(getattr(model, model._id)).split('.')[0].lower() #wtfiw
@@ -246,13 +317,17 @@ def query_to_kml(session, collection, user, tableid, field_specs, path, captions
 
     coord_cols = getCoordinateColumns(field_specs, table != None)
 
-    for row in query.yield_per(1):
-        if row_has_geocoords(coord_cols, row):
-            placemarkElement = createPlacemark(kmlDoc, row, coord_cols, table, captions, host)
-            documentElement.appendChild(placemarkElement)
-
-    with open(path, 'wb') as kmlFile:
-        kmlFile.write(kmlDoc.toprettyxml('  ', newl = '\n', encoding = 'utf-8'))
+    with open(path, 'w', encoding='utf-8') as kmlFile:
+        kmlFile.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        kmlFile.write('<kml xmlns="http://earth.google.com/kml/2.2">\n<Document>\n')
+        total = estimate_count(session, query) if progress is not None else None
+        for batch in fetch_batches(query, fetch_size, progress, total):
+            kmlFile.write(''.join(
+                ElementTree.tostring(createPlacemark(row, coord_cols, table, captions, host), encoding='unicode') + '\n'
+                for row in batch
+                if row_has_geocoords(coord_cols, row)
+            ))
+        kmlFile.write('</Document>\n</kml>\n')
 
     logger.debug('query_to_kml finished')
 
@@ -285,53 +360,38 @@ def getCoordinateColumns(field_specs, hasId):
 
     return result
 
-def createPlacemark(kmlDoc, row, coord_cols, table, captions, host):
-  # This creates a  element for a row of data.
-    #print row
-    placemarkElement = kmlDoc.createElement('Placemark')
-    extElement = kmlDoc.createElement('ExtendedData')
-    placemarkElement.appendChild(extElement)
+def _text_element(parent, tag, text):
+    element = ElementTree.SubElement(parent, tag)
+    element.text = str(text)
+    return element
+
+def _data_element(parent, name, value):
+    dataElement = ElementTree.SubElement(parent, 'Data', name=name)
+    _text_element(dataElement, 'value', value)
+
+def createPlacemark(row, coord_cols, table, captions, host):
+    # This creates a Placemark element for a row of data.
+    placemarkElement = ElementTree.Element('Placemark')
+    extElement = ElementTree.SubElement(placemarkElement, 'ExtendedData')
 
-    # Loop through the columns and create a  element for every field that has a value.
+    # Loop through the columns and create a Data element for every field.
     adj = 0 if table == None else 1
-    nameElement = kmlDoc.createElement('name')
-    nameText = kmlDoc.createTextNode(row[adj])
-    nameElement.appendChild(nameText)
-    placemarkElement.appendChild(nameElement)
+    _text_element(placemarkElement, 'name', row[adj])
     for f in range(adj, len(row)):
         if f not in coord_cols:
-            dataElement = kmlDoc.createElement('Data')
-            dataElement.setAttribute('name', captions[f-adj])
-            valueElement = kmlDoc.createElement('value')
-            dataElement.appendChild(valueElement)
-            valueText = kmlDoc.createTextNode(row[f])
-            valueElement.appendChild(valueText)
-            extElement.appendChild(dataElement)
-
-
+            _data_element(extElement, captions[f-adj], row[f])
 
     #display coords
-    crdElement = kmlDoc.createElement('Data')
-    crdElement.setAttribute('name', 'coordinates')
-    crdValue = kmlDoc.createElement('value')
-    crdElement.appendChild(crdValue)
     crdStr = row[coord_cols[1]] + ', ' + row[coord_cols[0]]
     if len(coord_cols) >= 4:
         crdStr += ' : ' + row[coord_cols[3]] + ', ' + row[coord_cols[2]]
     if len(coord_cols) == 5:
         crdStr += ' (' + row[coord_cols[4]] + ')'
-    crdValue.appendChild(kmlDoc.createTextNode(crdStr))
-    extElement.appendChild(crdElement)
+    _data_element(extElement, 'coordinates', crdStr)
 
     #add the url
     if table != None:
-        urlElement = kmlDoc.createElement('Data')
-        urlElement.setAttribute('name', 'go to')
-        urlValue = kmlDoc.createElement('value')
-        urlElement.appendChild(urlValue)
-        urlText = kmlDoc.createTextNode(host + '/specify/view/' + table + '/' + str(row[0]) + '/')
-        urlValue.appendChild(urlText)
-        extElement.appendChild(urlElement)
+        _data_element(extElement, 'go to', host + '/specify/view/' + table + '/' + str(row[0]) + '/')
 
     #add coords
     if len(coord_cols) == 5:
@@ -341,44 +401,28 @@ def createPlacemark(kmlDoc, row, coord_cols, table, captions, host):
     else:
         coord_type = 'point'
 
-
-    pointElement = kmlDoc.createElement('Point')
-    coordinates = row[coord_cols[0]] + ',' + row[coord_cols[1]]
-    coorElement = kmlDoc.createElement('coordinates')
-    coorElement.appendChild(kmlDoc.createTextNode(coordinates))
-    pointElement.appendChild(coorElement)
+    pointElement = ElementTree.Element('Point')
+    _text_element(pointElement, 'coordinates', row[coord_cols[0]] + ',' + row[coord_cols[1]])
 
     if coord_type == 'point':
-        placemarkElement.appendChild(pointElement)
+        placemarkElement.append(pointElement)
     else:
-        multiElement = kmlDoc.createElement('MultiGeometry')
-        multiElement.appendChild(pointElement)
+        multiElement = ElementTree.SubElement(placemarkElement, 'MultiGeometry')
+        multiElement.append(pointElement)
         if coord_type == 'line':
-            lineElement = kmlDoc.createElement('LineString')
-            tessElement = kmlDoc.createElement('tessellate')
-            tessElement.appendChild(kmlDoc.createTextNode('1'))
-            lineElement.appendChild(tessElement)
+            lineElement = ElementTree.SubElement(multiElement, 'LineString')
+            _text_element(lineElement, 'tessellate', '1')
             coordinates =  row[coord_cols[0]] + ',' + row[coord_cols[1]] + ' ' +  row[coord_cols[2]] + ',' + row[coord_cols[3]]
-            coorElement = kmlDoc.createElement('coordinates')
-            coorElement.appendChild(kmlDoc.createTextNode(coordinates))
-            lineElement.appendChild(coorElement)
-            multiElement.appendChild(lineElement)
+            _text_element(lineElement, 'coordinates', coordinates)
         else:
-            ringElement = kmlDoc.createElement('LinearRing')
-            tessElement = kmlDoc.createElement('tessellate')
-            tessElement.appendChild(kmlDoc.createTextNode('1'))
-            ringElement.appendChild(tessElement)
+            ringElement = ElementTree.SubElement(multiElement, 'LinearRing')
+            _text_element(ringElement, 'tessellate', '1')
             coordinates = row[coord_cols[0]] + ',' + row[coord_cols[1]]
             coordinates += ' ' + row[coord_cols[2]] + ',' + row[coord_cols[1]]
             coordinates += ' ' + row[coord_cols[2]] + ',' + row[coord_cols[3]]
             coordinates += ' ' + row[coord_cols[0]] + ',' + row[coord_cols[3]]
             coordinates += ' ' + row[coord_cols[0]] + ',' + row[coord_cols[1]]
-            coorElement = kmlDoc.createElement('coordinates')
-            coorElement.appendChild(kmlDoc.createTextNode(coordinates))
-            ringElement.appendChild(coorElement)
-            multiElement.appendChild(ringElement)
-
-        placemarkElement.appendChild(multiElement)
+            _text_element(ringElement, 'coordinates', coordinates)
 
     return placemarkElement
 
@@ -403,7 +447,9 @@ def run_ephemeral_query(collection, user, spquery):
     with models.session_context() as session:
         field_specs = field_specs_from_json(spquery['fields'])
         return execute(session, collection, user, tableid, distinct, count_only,
-                       field_specs, limit, offset, recordsetid, formatauditobjs=format_audits)
+                       field_specs, limit, offset, recordsetid, formatauditobjs=format_audits,
+                       keyset_paging='cursor' in spquery, cursor=spquery.get('cursor') or None,
+                       count_limit=spquery.get('countlimit', None))
 
 def augment_field_specs(field_specs, formatauditobjs=False):
     print("augment_field_specs ######################################")
@@ -533,21 +579,71 @@ def return_loan_preps(collection, user, agent, data):
                 ])
         return to_return
 
-def execute(session, collection, user, tableid, distinct, count_only, field_specs, limit, offset, recordsetid=None, formatauditobjs=False):
-    "Build and execute a query, returning the results as a data structure for json serialization"
+def execute(session, collection, user, tableid, distinct, count_only, field_specs, limit, offset, recordsetid=None, formatauditobjs=False,
+            keyset_paging=False, cursor=None, count_limit=None):
+    """Build and execute a query, returning the results as a data structure for json serialization
+
+    If keyset_paging is set, offset is ignored and the page starts after
+    the position given by cursor, the first page if None. The cursor for
+    the next page is returned with the results, or None after the last
+    page. See keyset.py.
+
+    If count_limit is given, counting stops after count_limit rows, the
+    result telling whether the count is exact.
+    """
 
     set_group_concat_max_len(session)
-    query, order_by_exprs = build_query(session, collection, user, tableid, field_specs, recordsetid=recordsetid, formatauditobjs=formatauditobjs, distinct=distinct)
+    # the aggregations of a page of records are faster to compute
+    # separately. distinct rows depend on the aggregated values, though.
+    built = build_cached_query(session, collection, user, tableid, field_specs, recordsetid=recordsetid, formatauditobjs=formatauditobjs, distinct=distinct,
+                               defer_aggregations=not (count_only or distinct))
+    query, order_by_exprs = built.query, built.order_by_exprs
 
     if count_only:
-        return {'count': query.count()}
+        if count_limit is None:
+            return {'count': query.count()}
+        count = query.limit(count_limit + 1).count()
+        return {'count': min(count, count_limit), 'exact': count <= count_limit}
+    elif keyset_paging:
+        page = keyset_page(query, order_by_exprs, distinct, limit, cursor)
+        return {**page, 'results': fill_aggregations(session, page['results'], built.deferred)}
     else:
         logger.debug("order by: %s", order_by_exprs)
         query = query.order_by(*order_by_exprs).offset(offset)
         if limit:
             query = query.limit(limit)
 
-        return {'results': list(query)}
+        return {'results': fill_aggregations(session, list(query), built.deferred)}
+
+def keyset_page(query, order_by_exprs, distinct, limit, cursor):
+    if distinct:
+        # distinct rows have no record id to break ties between equal
+        # sort keys, so these are paged by offset.
+        __, offset = keyset.cursor_position(cursor, None)
+        query = query.order_by(*order_by_exprs).offset(offset)
+        if limit:
+            query = query.limit(limit)
+        results = list(query)
+        more = bool(limit) and len(results) == limit
+        return {'results': results, 'cursor': keyset.offset_cursor(offset + len(results)) if more else None}
+
+    keys = keyset.sort_keys(order_by_exprs, query.column_descriptions[0]['expr'])
+    after, __ = keyset.cursor_position(cursor, len(keys))
+    ncols = len(query.column_descriptions)
+
+    query = query.add_columns(*(expr for expr, __ in keys))
+    if after is not None:
+        query = query.filter(keyset.after_predicate(keys, after))
+    query = query.order_by(*(desc(expr) if descending else asc(expr) for expr, descending in keys))
+    if limit:
+        query = query.limit(limit)
+
+    rows = list(query)
+    more = bool(limit) and len(rows) == limit
+    return {
+        'results': [tuple(row[:ncols]) for row in rows],
+        'cursor': keyset.keys_cursor(rows[-1][ncols:]) if more else None,
+    }
 
 def build_query(session, collection, user, tableid, field_specs,
                 recordsetid=None, replace_nulls=False, formatauditobjs=False, distinct=False, implicit_or=True):
@@ -575,13 +671,58 @@ def build_query(session, collection, user, tableid, field_specs,
     replace_nulls = if True, replace null values with ""
 
     distinct = if True, do not return record IDs and query distinct rows
-    """
-    model = models.models_by_tableid[tableid]
-    id_field = getattr(model, model._id)
 
+    The built queries are cached, see build_cache.
+    """
+    built = build_cached_query(session, collection, user, tableid, field_specs,
+                               recordsetid, replace_nulls, formatauditobjs, distinct, implicit_or)
+    return built.query, built.order_by_exprs
+
+def build_cached_query(session, collection, user, tableid, field_specs,
+                       recordsetid=None, replace_nulls=False, formatauditobjs=False, distinct=False, implicit_or=True,
+                       defer_aggregations=False) -> build_cache.CachedQuery:
+    """Like build_query, returning the cached query bound to session.
+
+    If defer_aggregations is set, the displayed aggregations of to-many
+    relationships are not evaluated for every row by the query.
+    Instead, the column holds the id of the record whose related records
+    are aggregated, to be replaced by fill_aggregations.
+    """
     field_specs = [apply_absolute_date(field_spec) for field_spec in field_specs]
     field_specs = [apply_specify_user_name(field_spec, user) for field_spec in field_specs]
 
+    key = (
+        tableid, tuple(field_specs), recordsetid, replace_nulls, formatauditobjs, distinct, implicit_or,
+        defer_aggregations, collection.id, collection.timestampmodified, user.id,
+    )
+    try:
+        hash(key)
+    except TypeError:
+        # filter values that can't be cached
+        cached, version = None, None
+    else:
+        cached, version = build_cache.lookup(session, key)
+
+    if cached is None:
+        cached = _build_query(session, collection, user, tableid, field_specs,
+                              recordsetid, replace_nulls, formatauditobjs, distinct, implicit_or,
+                              defer_aggregations)
+        if version is not None:
+            build_cache.store(key, cached, version)
+    else:
+        logger.debug("using cached query")
+
+    # permissions may have changed since the query was cached
+    for table in cached.tables_to_read:
+        check_table_permissions(collection, user, table, "read")
+
+    return cached._replace(query=cached.query.with_session(session))
+
+def _build_query(session, collection, user, tableid, field_specs,
+                 recordsetid, replace_nulls, formatauditobjs, distinct, implicit_or,
+                 defer_aggregations):
+    model = models.models_by_tableid[tableid]
+    id_field = getattr(model, model._id)
 
     query = QueryConstruct(
         collection=collection,
@@ -595,9 +736,6 @@ def build_query(session, collection, user, tableid, field_specs,
         for table in query.tables_in_path(fs.fieldspec.root_table, fs.fieldspec.join_path)
     ])
 
-    for table in tables_to_read:
-        check_table_permissions(collection, user, table, "read")
-
     query = filter_by_collection(model, query, collection)
 
     if recordsetid is not None:
@@ -613,13 +751,21 @@ def build_query(session, collection, user, tableid, field_specs,
 
     order_by_exprs = []
     predicates_by_field = defaultdict(list)
+    deferred = []
+    column = 0 if distinct else 1
     #augment_field_specs(field_specs, formatauditobjs)
     for fs in field_specs:
         sort_type = SORT_TYPES[fs.sort_type]
 
         query, field, predicate = fs.add_to_query(query, formatauditobjs=formatauditobjs)
         if fs.display:
-            query = query.add_columns(query.objectformatter.fieldformat(fs, field))
+            aggregation = query.objectformatter.aggregations.get(id(field), None) if defer_aggregations else None
+            if aggregation is not None and aggregation.result is field:
+                query = query.add_columns(aggregation.rel_id)
+                deferred.append(build_cache.DeferredAggregation(column, aggregation))
+            else:
+                query = query.add_columns(query.objectformatter.fieldformat(fs, field))
+            column += 1
 
         if sort_type is not None:
             order_by_exprs.append(sort_type(field))
@@ -642,4 +788,22 @@ def build_query(session, collection, user, tableid, field_specs,
         query = query.filter(where)
 
     logger.debug("query: %s", query.query)
-    return query.query, order_by_exprs
+    return build_cache.CachedQuery(query.query, order_by_exprs, tables_to_read, deferred)
+
+def fill_aggregations(session, rows, deferred, batch_size=1000):
+    """Replace the record ids in the deferred aggregation columns of rows
+    by the aggregated values, running one grouped query per column.
+    """
+    if not deferred:
+        return rows
+
+    rows = [list(row) for row in rows]
+    for column, aggregation in deferred:
+        rel_ids = sorted({row[column] for row in rows if row[column] is not None})
+        values = {}
+        for start in range(0, len(rel_ids), batch_size):
+            values.update(aggregation.grouped(session, rel_ids[start:start + batch_size]))
+        for row in rows:
+            # no related records aggregate to a blank
+            row[column] = values.get(row[column], '')
+    return [tuple(row) for row in rows]
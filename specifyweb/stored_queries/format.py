@@ -14,7 +14,7 @@ from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.sql.elements import Extract
 from sqlalchemy import types
 
-from typing import Tuple, Optional, Union, Any
+from typing import Tuple, Optional, Union, Any, NamedTuple
 
 from specifyweb.context.app_resource import get_app_resource
 from specifyweb.context.remote_prefs import get_remote_prefs
@@ -38,6 +38,26 @@ Agent_model = datamodel.get_table('Agent')
 Spauditlog_model = datamodel.get_table('SpAuditLog')
 
 
+class Aggregation(NamedTuple):
+    """An aggregation of the records of orm_table related to the record
+    rel_id, where join_column references it. query selects from
+    orm_table with the joins aggregated depends on. result is the
+    correlated subquery aggregate() returned for it.
+    """
+    query: orm.Query
+    join_column: Any
+    rel_id: Any
+    aggregated: Any
+    result: Any
+
+    def grouped(self, session, rel_ids) -> orm.Query:
+        "A query of the aggregated values for each of rel_ids."
+        return self.query.with_session(session) \
+            .add_columns(self.join_column, self.aggregated) \
+            .filter(self.join_column.in_(rel_ids)) \
+            .group_by(self.join_column)
+
+
 class ObjectFormatter(object):
     def __init__(self, collection, user, replace_nulls):
 
@@ -49,6 +69,12 @@ class ObjectFormatter(object):
         self.collection = collection
         self.replace_nulls = replace_nulls
 
+        # the aggregations made by aggregate() by the id of the
+        # returned subqueries, so they can be run separately instead.
+        # The aggregations hold on to the subqueries, so the ids are
+        # not reused while they are in here.
+        self.aggregations = {}
+
     def getFormatterDef(self, specify_model: Table, formatter_name) -> Optional[
         Element]:
         def lookup(attr: str, val: str) -> Optional[Element]:
@@ -216,12 +242,11 @@ class ObjectFormatter(object):
 
         join_column = list(inspect(
             getattr(orm_table, field.otherSideName)).property.local_columns)[0]
+        rel_id = getattr(rel_table, rel_table._id)
         subquery = QueryConstruct(
             collection=query.collection,
             objectformatter=self,
-            query=orm.Query([]).select_from(orm_table) \
-                .filter(join_column == getattr(rel_table, rel_table._id)) \
-                .correlate(rel_table)
+            query=orm.Query([]).select_from(orm_table)
         )
 
         subquery, formatted = self.objformat(subquery, orm_table,
@@ -235,8 +260,13 @@ class ObjectFormatter(object):
 
         aggregated = blank_nulls(group_concat(formatted, separator, *order_by_expr))
 
+        result = subquery.query \
+            .filter(join_column == rel_id) \
+            .correlate(rel_table) \
+            .add_column(aggregated).limit(limit).as_scalar()
 
-        return subquery.query.add_column(aggregated).limit(limit).as_scalar()
+        self.aggregations[id(result)] = Aggregation(subquery.query, join_column, rel_id, aggregated, result)
+        return result
 
     def fieldformat(self, query_field: QueryField,
                     field: blank_nulls) -> blank_nulls:
@@ -0,0 +1,123 @@
+"""
+Keyset pagination of query results.
+
+Instead of skipping the rows of the previous pages with OFFSET, which
+MySQL has to produce and throw away, a page starts after the last row
+of the previous one, identified by its values of the sort keys with the
+record id appended as a tie breaker. Those values are handed to the
+client as an opaque cursor.
+
+Queries of distinct rows have no record id, so their cursors just hold
+the offset of the next page.
+"""
+
+import base64
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import sql
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import Label
+
+# (expression, descending) pairs
+SortKeys = List[Tuple[Any, bool]]
+
+class InvalidCursor(ValueError):
+    pass
+
+def sort_keys(order_by_exprs, id_field) -> SortKeys:
+    "The sort keys of a query ordered by order_by_exprs, ending with id_field."
+    keys = [(expr.element, expr.modifier is operators.desc_op) for expr in order_by_exprs]
+    # labels would be referred to by name in the ORDER BY clause, which
+    # is ambiguous once the keys are selected as well
+    return [
+        (expr.element if isinstance(expr, Label) else expr, descending)
+        for expr, descending in keys + [(id_field, False)]
+    ]
+
+def after_predicate(keys: SortKeys, values: Sequence[Any]):
+    """The condition for rows coming after the row with the given values
+    of keys in MySQL's ordering, where NULL sorts before anything else.
+    """
+    clauses = []
+    for i, ((expr, descending), value) in enumerate(zip(keys, values)):
+        equal = [
+            e.is_(None) if v is None else e == v
+            for (e, __), v in zip(keys[:i], values[:i])
+        ]
+        if value is None:
+            if descending:
+                continue
+            after = expr.isnot(None)
+        else:
+            after = sql.or_(expr < value, expr.is_(None)) if descending else expr > value
+        clauses.append(sql.and_(*equal, after))
+    return sql.or_(*clauses) if clauses else sql.false()
+
+def encode_cursor(position: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(_encode(position)).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> Any:
+    try:
+        return _decode(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii'))))
+    except (ValueError, TypeError, ArithmeticError) as e:
+        raise InvalidCursor(f"invalid cursor: {cursor!r}") from e
+
+def keys_cursor(values: Sequence[Any]) -> str:
+    return encode_cursor({'keys': list(values)})
+
+def offset_cursor(offset: int) -> str:
+    return encode_cursor({'offset': offset})
+
+def cursor_position(cursor: Optional[str], nkeys: Optional[int]) -> Tuple[Optional[List[Any]], int]:
+    """Decode cursor, returning the sort key values the page starts after
+    and the offset of the page. nkeys is the number of sort keys or None
+    for queries paged by offset.
+    """
+    if cursor is None:
+        return None, 0
+    position = decode_cursor(cursor)
+    if not isinstance(position, dict):
+        raise InvalidCursor(f"invalid cursor: {cursor!r}")
+    if nkeys is None:
+        offset = position.get('offset', None)
+        if not isinstance(offset, int) or offset < 0:
+            raise InvalidCursor("cursor does not belong to this query")
+        return None, offset
+    keys = position.get('keys', None)
+    if not isinstance(keys, list) or len(keys) != nkeys:
+        raise InvalidCursor("cursor does not belong to this query")
+    return keys, 0
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(v) for v in value]
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, time):
+        return {'$time': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'$bytes': base64.b64encode(value).decode('ascii')}
+    return value
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            (tag, v), = value.items()
+            if tag == '$decimal': return Decimal(v)
+            if tag == '$datetime': return datetime.fromisoformat(v)
+            if tag == '$date': return date.fromisoformat(v)
+            if tag == '$time': return time.fromisoformat(v)
+            if tag == '$bytes': return base64.b64decode(v)
+        return {k: _decode(v) for k, v in value.items()}
+    return value
@@ -0,0 +1,27 @@
+from typing import Any, Dict, Optional
+
+from celery.utils.log import get_task_logger # type: ignore
+
+from specifyweb.celery_tasks import LogErrorsTask, app
+from specifyweb.notifications.exports import run_export
+from specifyweb.specify import models
+
+from .execution import do_export
+
+Collection = getattr(models, 'Collection')
+Specifyuser = getattr(models, 'Specifyuser')
+
+logger = get_task_logger(__name__)
+
+@app.task(base=LogErrorsTask, bind=True)
+def query_export(self, export_id: int, spquery: Dict[str, Any], collection_id: int, user_id: int, filename: str, exporttype: str, host: Optional[str]) -> None:
+
+    def progress(current: int, total: Optional[int]) -> None:
+        if not self.request.called_directly:
+            self.update_state(state='PROGRESS', meta={'current': current, 'total': total})
+
+    collection = Collection.objects.get(id=collection_id)
+    user = Specifyuser.objects.get(id=user_id)
+
+    logger.info('exporting query to %s: %s', exporttype, filename)
+    run_export(export_id, lambda: do_export(spquery, collection, user, filename, exporttype, host, progress))
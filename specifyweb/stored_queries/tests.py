@@ -13,7 +13,7 @@ import sqlalchemy
 from sqlalchemy.dialects import mysql
 from django.db import connection
 from sqlalchemy import event
-from . import models
+from . import build_cache, execution, keyset, models
 from xml.etree import ElementTree
 from datetime import datetime
 # Used for pretty-formatting sql code for testing
@@ -787,6 +787,116 @@ def test_sqlalchemy_model(datamodel_table):
 
     return {key: value for key, value in table_errors.items() if len(value) > 0}
 
+class ExportWriterTests(TestCase):
+    def test_fetch_batches(self) -> None:
+        class FakeQuery:
+            def yield_per(self, n):
+                self.fetch_size = n
+                return iter(range(5))
+
+        query = FakeQuery()
+        self.assertEqual([[0, 1], [2, 3], [4]], list(execution.fetch_batches(query, 2)))
+        self.assertEqual(2, query.fetch_size)
+
+        calls = []
+        list(execution.fetch_batches(query, 2, lambda current, total: calls.append((current, total))))
+        self.assertEqual([(2, None), (4, None), (5, None)], calls)
+
+        calls = []
+        list(execution.fetch_batches(query, 2, lambda current, total: calls.append((current, total)), total=4))
+        self.assertEqual([(2, 4), (4, 4), (5, 5)], calls)
+
+    def test_placemark(self) -> None:
+        row = (7, 'Kansas <river>', '-95.2', '38.9')
+        placemark = execution.createPlacemark(row, [2, 3], 'locality', ['Name', 'Longitude', 'Latitude'], 'http://host')
+        xml = ElementTree.tostring(placemark, encoding='unicode')
+        self.assertIn('<name>Kansas &lt;river&gt;</name>', xml)
+        self.assertIn('<Data name="coordinates"><value>38.9, -95.2</value></Data>', xml)
+        self.assertIn('<value>http://host/specify/view/locality/7/</value>', xml)
+        self.assertIn('<Point><coordinates>-95.2,38.9</coordinates></Point>', xml)
+
+class BuildCacheTests(TestCase):
+    class FakeSession:
+        version = (datetime(2023, 1, 1), 1, None, None, 0)
+        def execute(self, statement):
+            return self
+        def first(self):
+            return self.version
+
+    def setUp(self) -> None:
+        build_cache.clear()
+        self.addCleanup(build_cache.clear)
+
+    def test_cached_until_resources_change(self) -> None:
+        session = self.FakeSession()
+        entry = build_cache.CachedQuery('query', [], set())
+
+        self.assertEqual((None, session.version), build_cache.lookup(session, 'key'))
+        build_cache.store('key', entry, session.version)
+        self.assertEqual((entry, session.version), build_cache.lookup(session, 'key'))
+
+        session.version = (datetime(2023, 1, 2), 1, None, None, 0)
+        self.assertEqual((None, session.version), build_cache.lookup(session, 'key'))
+
+    def test_stale_entries_not_stored(self) -> None:
+        session = self.FakeSession()
+        _, version = build_cache.lookup(session, 'key')
+        session.version = (datetime(2023, 1, 2), 2, None, None, 0)
+        build_cache.lookup(session, 'other')
+        build_cache.store('key', build_cache.CachedQuery('query', [], set()), version)
+        self.assertEqual(None, build_cache.lookup(session, 'key')[0])
+
+class KeysetTests(TestCase):
+    def test_cursor_roundtrip(self) -> None:
+        from decimal import Decimal
+        values = ['a', None, 3, Decimal('1.50'), datetime(2023, 5, 1, 12, 30)]
+        self.assertEqual((values, 0), keyset.cursor_position(keyset.keys_cursor(values), len(values)))
+        self.assertEqual((None, 40), keyset.cursor_position(keyset.offset_cursor(40), None))
+
+    def test_bad_cursors(self) -> None:
+        for cursor, nkeys in [('not a cursor', 1), (keyset.keys_cursor([1, 2]), 3), (keyset.keys_cursor([1]), None)]:
+            with self.assertRaises(keyset.InvalidCursor):
+                keyset.cursor_position(cursor, nkeys)
+
+    def test_after_predicate(self) -> None:
+        name, number, id = sqlalchemy.column('name'), sqlalchemy.column('number'), sqlalchemy.column('id')
+        keys = [(name, False), (number, True), (id, False)]
+
+        def compiled(values):
+            return str(keyset.after_predicate(keys, values).compile(
+                dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+
+        self.assertEqual(
+            "name > 'x' OR name = 'x' AND (number < 5 OR number IS NULL) OR name = 'x' AND number = 5 AND id > 7",
+            compiled(['x', 5, 7]),
+        )
+        self.assertEqual(
+            "name IS NOT NULL OR name IS NULL AND number IS NULL AND id > 7",
+            compiled([None, None, 7]),
+        )
+
+class FillAggregationsTests(TestCase):
+    def test_aggregations_filled(self) -> None:
+        class FakeAggregation:
+            def __init__(self):
+                self.batches = []
+            def grouped(self, session, rel_ids):
+                self.batches.append(rel_ids)
+                return [(rel_id, f'agents of {rel_id}') for rel_id in rel_ids if rel_id != 3]
+
+        aggregation = FakeAggregation()
+        rows = [(1, 'a', 2), (2, 'b', None), (3, 'c', 3), (4, 'd', 2), (5, 'e', 1)]
+        filled = execution.fill_aggregations(None, rows, [build_cache.DeferredAggregation(2, aggregation)], batch_size=2)
+
+        self.assertEqual([
+            (1, 'a', 'agents of 2'),
+            (2, 'b', ''),
+            (3, 'c', ''),
+            (4, 'd', 'agents of 2'),
+            (5, 'e', 'agents of 1'),
+        ], filled)
+        self.assertEqual([[1, 2], [3]], aggregation.batches)
+
 class SQLAlchemyModelTest(TestCase):
     def test_sqlalchemy_model_errors(self):
         for table in spmodels.datamodel.tables:
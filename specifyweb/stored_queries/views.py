@@ -2,7 +2,6 @@ import json
 import logging
 from collections import defaultdict
 from datetime import datetime
-from threading import Thread
 
 from django.http import HttpResponse, HttpResponseBadRequest, \
     HttpResponseRedirect, JsonResponse
@@ -10,9 +9,12 @@ from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_GET, require_POST
 
 from . import models
-from .execution import execute, run_ephemeral_query, do_export, recordset, \
+from .execution import execute, run_ephemeral_query, recordset, \
     return_loan_preps as rlp
+from .keyset import InvalidCursor
 from .queryfield import QueryField
+from .tasks import query_export
+from ..notifications.exports import ExportLimitExceeded, start_export
 from ..permissions.permissions import PermissionTarget, PermissionTargetAction, \
     check_permission_targets, check_table_permissions
 from ..specify.api import toJson, uri_for_model
@@ -69,11 +71,19 @@ def format_export_file_name(spquery, file_extension = ''):
 @never_cache
 def query(request, id):
     """Executes and returns the results of query with id <id>.
-    'limit' and 'offset' may be provided as GET parameters.
+    'limit' and 'offset' may be provided as GET parameters. Given a
+    'cursor' parameter, empty for the first page, the results are paged
+    by the sort keys instead of the offset and the cursor for the next
+    page is returned with them. 'countlimit' limits the rows counted
+    by count only queries.
     """
     check_permission_targets(request.specify_collection.id, request.specify_user.id, [QueryBuilderPt.execute])
     limit = int(request.GET.get('limit', 20))
     offset = int(request.GET.get('offset', 0))
+    try:
+        count_limit = int(request.GET['countlimit']) if 'countlimit' in request.GET else None
+    except ValueError:
+        return HttpResponseBadRequest("countlimit must be an integer")
 
     with models.session_context() as session:
         sp_query = session.query(models.SpQuery).get(int(id))
@@ -84,8 +94,13 @@ def query(request, id):
         field_specs = [QueryField.from_spqueryfield(field, value_from_request(field, request.GET))
                        for field in sorted(sp_query.fields, key=lambda field: field.position)]
 
-        data = execute(session, request.specify_collection, request.specify_user,
-                       tableid, distinct, count_only, field_specs, limit, offset)
+        try:
+            data = execute(session, request.specify_collection, request.specify_user,
+                           tableid, distinct, count_only, field_specs, limit, offset,
+                           keyset_paging='cursor' in request.GET, cursor=request.GET.get('cursor') or None,
+                           count_limit=count_limit)
+        except InvalidCursor as e:
+            return HttpResponseBadRequest(e)
 
     return HttpResponse(toJson(data), content_type='application/json')
 
@@ -108,7 +123,10 @@ def ephemeral(request):
         collection = request.specify_collection
 
     check_permission_targets(collection.id, request.specify_user.id, [QueryBuilderPt.execute])
-    data = run_ephemeral_query(collection, request.specify_user, spquery)
+    try:
+        data = run_ephemeral_query(collection, request.specify_user, spquery)
+    except InvalidCursor as e:
+        return HttpResponseBadRequest(e)
     return HttpResponse(toJson(data), content_type='application/json')
 
 
@@ -134,9 +152,11 @@ def export_csv(request):
     
     file_name = format_export_file_name(spquery, "csv")
 
-    thread = Thread(target=do_export, args=(spquery, collection, request.specify_user, file_name, 'csv', None))
-    thread.daemon = True
-    thread.start()
+    try:
+        start_export(query_export, [spquery, collection.id, request.specify_user.id, file_name, 'csv', None],
+                     request.specify_user, collection, 'csv', file_name, 'query-export-starting')
+    except ExportLimitExceeded as e:
+        return HttpResponse(str(e), status=429, content_type='text/plain')
     return HttpResponse('OK', content_type='text/plain')
 
 @require_POST
@@ -164,9 +184,11 @@ def export_kml(request):
 
     file_name = format_export_file_name(spquery, "kml")
 
-    thread = Thread(target=do_export, args=(spquery, collection, request.specify_user, file_name, 'kml', the_host))
-    thread.daemon = True
-    thread.start()
+    try:
+        start_export(query_export, [spquery, collection.id, request.specify_user.id, file_name, 'kml', the_host],
+                     request.specify_user, collection, 'kml', file_name, 'query-export-starting')
+    except ExportLimitExceeded as e:
+        return HttpResponse(str(e), status=429, content_type='text/plain')
     return HttpResponse('OK', content_type='text/plain')
 
 @require_POST
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-16 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0005_auto_20210428_1634'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spdataset',
+            name='validationcache',
+            field=models.JSONField(null=True),
+        ),
+    ]
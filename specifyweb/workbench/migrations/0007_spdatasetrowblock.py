@@ -0,0 +1,67 @@
+# Generated by Django 3.2.15 on 2026-10-16 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from specifyweb.workbench.rowstore import decode_block, encode_block, split_blocks
+
+
+def move_rows_to_blocks(apps, schema_editor):
+    Spdataset = apps.get_model('workbench', 'Spdataset')
+    Spdatasetrowblock = apps.get_model('workbench', 'Spdatasetrowblock')
+
+    for ds_id in Spdataset.objects.values_list('id', flat=True):
+        ds = Spdataset.objects.get(id=ds_id)
+        blocks = []
+        for n, block in enumerate(split_blocks(ds.data)):
+            cells, extra = encode_block(block)
+            blocks.append(Spdatasetrowblock(spdataset=ds, blocknumber=n, rowcount=len(block), cells=cells, extra=extra))
+        Spdatasetrowblock.objects.bulk_create(blocks)
+        ds.rowcount = len(ds.data)
+        ds.data = []
+        ds.save(update_fields=['rowcount', 'data'])
+
+
+def move_rows_from_blocks(apps, schema_editor):
+    Spdataset = apps.get_model('workbench', 'Spdataset')
+    Spdatasetrowblock = apps.get_model('workbench', 'Spdatasetrowblock')
+
+    for ds_id in Spdataset.objects.values_list('id', flat=True):
+        ds = Spdataset.objects.get(id=ds_id)
+        ds.data = [
+            row
+            for block in Spdatasetrowblock.objects.filter(spdataset_id=ds_id).order_by('blocknumber')
+            for row in decode_block(block.cells, block.extra, block.rowcount)
+        ]
+        ds.save(update_fields=['data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workbench', '0006_spdataset_validationcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spdataset',
+            name='rowcount',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='Spdatasetrowblock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blocknumber', models.IntegerField()),
+                ('rowcount', models.IntegerField()),
+                ('cells', models.BinaryField()),
+                ('extra', models.JSONField(null=True)),
+                ('spdataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rowblocks', to='workbench.spdataset')),
+            ],
+            options={
+                'db_table': 'spdatasetrowblock',
+                'unique_together': {('spdataset', 'blocknumber')},
+            },
+        ),
+        migrations.RunPython(move_rows_to_blocks, move_rows_from_blocks),
+    ]
@@ -1,4 +1,5 @@
 import json
+from typing import Callable, Dict, Iterator, List, Optional
 
 from django import http
 from django.core.exceptions import ObjectDoesNotExist
@@ -8,6 +9,7 @@ from django.utils import timezone
 
 from specifyweb.specify import models as spmodels
 from specifyweb.specify.api import uri_for_model
+from .rowstore import ROW_BLOCK_SIZE, decode_rows, encode_block, split_blocks
 
 Collection = getattr(spmodels, 'Collection')
 Specifyuser = getattr(spmodels, 'Specifyuser')
@@ -96,6 +98,15 @@ class Spdataset(Dataset):
     visualorder = models.JSONField(null=True)
     rowresults = models.TextField(null=True)
 
+    # Row hashes and upload digests of the last validation run, used to
+    # revalidate only the rows affected by later edits. See
+    # workbench.upload.revalidation.
+    validationcache = models.JSONField(null=True)
+
+    # The rows are kept in Spdatasetrowblock records rather than the
+    # data field, which is left empty.
+    rowcount = models.IntegerField(default=0)
+
 
     class Meta:
         db_table = 'spdataset'
@@ -103,6 +114,7 @@ class Spdataset(Dataset):
     def get_dataset_as_dict(self):
         ds_dict = super().get_dataset_as_dict()
         ds_dict.update({
+            "rows": self.get_rows(),
             "columns": self.columns,
             "visualorder": self.visualorder,
             "rowresults": self.rowresults and json.loads(self.rowresults)
@@ -111,3 +123,73 @@ class Spdataset(Dataset):
 
     def was_uploaded(self) -> bool:
         return self.uploadresult and self.uploadresult['success']
+
+    def get_rows(self, start: int=0, end: Optional[int]=None) -> List[List[str]]:
+        "The rows [start, end) of the dataset, each with the metadata cell last."
+        return list(self.iter_rows(start, end))
+
+    def iter_rows(self, start: int=0, end: Optional[int]=None) -> Iterator[List[str]]:
+        """Like get_rows, but only decompresses one block of rows at a
+        time. The blocks are read when this is called, so the rows are
+        those of the dataset at that point even if they are consumed
+        later on, say after the transaction has ended.
+        """
+        end = self.rowcount if end is None else min(end, self.rowcount)
+        if start >= end:
+            return iter(())
+
+        blocks = list(self.rowblocks.filter(
+            blocknumber__gte=start // ROW_BLOCK_SIZE,
+            blocknumber__lte=(end - 1) // ROW_BLOCK_SIZE,
+        ).order_by('blocknumber'))
+        return decode_rows(blocks, start, end)
+
+    def save_rows(self, rows: List[List[str]]) -> None:
+        "Store rows as the data of the dataset, which must already be saved."
+        self.rowblocks.all().delete()
+        Spdatasetrowblock.objects.bulk_create(
+            Spdatasetrowblock(spdataset=self, blocknumber=n, rowcount=len(block), cells=cells, extra=extra)
+            for n, block in enumerate(split_blocks(rows))
+            for cells, extra in [encode_block(block)]
+        )
+        self.rowcount = len(rows)
+        self.save(update_fields=['rowcount'])
+
+    def set_rows(self, rows: List[List[str]]) -> None:
+        """Replace the row data. The results of the last validation are
+        kept in the validation cache so that the next validation only
+        has to process the rows affected by the change.
+        """
+        if self.rowresults is not None and self.validationcache is not None:
+            self.validationcache = {**self.validationcache, 'rowresults': self.rowresults}
+        self.save_rows(rows)
+        self.rowresults = None
+        self.uploadresult = None
+
+    def update_row_metadata(self, update: Callable[[Optional[Dict]], Optional[Dict]]) -> None:
+        """Replace the metadata of every row with update(metadata),
+        without touching the cells.
+        """
+        for block in self.rowblocks.only('id', 'extra', 'rowcount').iterator():
+            extra = block.extra or {}
+            new_extra = {}
+            for offset in range(block.rowcount):
+                metadata = update(extra.get(str(offset), None))
+                if metadata:
+                    new_extra[str(offset)] = metadata
+            Spdatasetrowblock.objects.filter(id=block.id).update(extra=new_extra or None)
+
+
+class Spdatasetrowblock(models.Model):
+    """A block of ROW_BLOCK_SIZE consecutive rows of a dataset, stored
+    compressed column by column. See workbench.rowstore.
+    """
+    spdataset = models.ForeignKey(Spdataset, on_delete=models.CASCADE, related_name='rowblocks')
+    blocknumber = models.IntegerField()
+    rowcount = models.IntegerField()
+    cells = models.BinaryField()
+    extra = models.JSONField(null=True)
+
+    class Meta:
+        db_table = 'spdatasetrowblock'
+        unique_together = (('spdataset', 'blocknumber'),)
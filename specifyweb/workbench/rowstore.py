@@ -0,0 +1,62 @@
+"""
+Encoding of workbench data set rows for block storage.
+
+The rows of a data set are stored in blocks of ROW_BLOCK_SIZE rows (see
+models.Spdatasetrowblock). Within a block the cells are kept column by
+column, which compresses much better than row by row as values tend to
+repeat down a column. The hidden last cell of every row, holding the
+disambiguation and other row metadata as a JSON string, is kept apart
+as a mapping from row offset to the decoded object for just the rows
+that have any.
+
+These functions only depend on the row data so they can be used from
+migrations as well.
+"""
+
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+ROW_BLOCK_SIZE = 1000
+
+def encode_block(rows: List[List[str]]) -> Tuple[bytes, Optional[Dict[str, Any]]]:
+    """Encode rows, each with the metadata cell last, into compressed
+    columnar cells and the metadata mapping.
+    """
+    columns = [list(column) for column in zip(*(row[:-1] for row in rows))]
+    extra = {
+        str(offset): json.loads(row[-1])
+        for offset, row in enumerate(rows)
+        if row and row[-1]
+    }
+    cells = zlib.compress(json.dumps(columns, separators=(',', ':')).encode('utf-8'))
+    return cells, extra or None
+
+def decode_block(cells: bytes, extra: Optional[Dict[str, Any]], rowcount: int) -> List[List[str]]:
+    "The inverse of encode_block."
+    columns = json.loads(zlib.decompress(bytes(cells)).decode('utf-8'))
+    extra = extra or {}
+    rows = [list(row) for row in zip(*columns)] if columns else [[] for _ in range(rowcount)]
+    for offset, row in enumerate(rows):
+        metadata = extra.get(str(offset), None)
+        row.append(json.dumps(metadata) if metadata else "")
+    return rows
+
+def decode_rows(blocks: Iterable[Any], start: int, end: int) -> Iterator[List[str]]:
+    """The rows [start, end) of the dataset from its row blocks covering
+    them, in order, decoding one block at a time.
+    """
+    for block in blocks:
+        first = block.blocknumber * ROW_BLOCK_SIZE
+        rows = decode_block(block.cells, block.extra, block.rowcount)
+        yield from rows[max(start - first, 0):end - first]
+
+def split_blocks(rows: Iterable[List[str]], size: int=ROW_BLOCK_SIZE) -> Iterator[List[List[str]]]:
+    block: List[List[str]] = []
+    for row in rows:
+        block.append(row)
+        if len(block) == size:
+            yield block
+            block = []
+    if block:
+        yield block
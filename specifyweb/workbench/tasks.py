@@ -1,8 +1,11 @@
-from typing import Optional, Any
+import json
+from typing import Optional, Any, Dict, List, Tuple
+from uuid import uuid4
 
-from celery import shared_task # type: ignore
+from celery import shared_task, chord # type: ignore
 from celery.utils.log import get_task_logger # type: ignore
 
+from django.conf import settings
 from django.db import connection, transaction
 
 from specifyweb.specify import models
@@ -13,7 +16,8 @@ from .models import Spdataset
 Workbench = getattr(models, 'Workbench')
 Collection = getattr(models, 'Collection')
 
-from .upload.upload import do_upload_dataset, unupload_dataset
+from .upload.upload import do_upload_dataset, unupload_dataset, \
+    validate_dataset_shard, shard_ranges
 
 logger = get_task_logger(__name__)
 
@@ -43,11 +47,107 @@ def upload(self, collection_id: int, uploading_agent_id: int, ds_id: int, no_com
              "expectedUploadStatus" : 'validating , uploading',
              "localizationKey" : "invalidUploadStatus"})
 
+        # datasets validated before are revalidated incrementally instead
+        if no_commit and ds.validationcache is None \
+           and settings.WB_VALIDATION_SHARDS > 1 and ds.rowcount >= settings.WB_VALIDATION_SHARD_MIN_ROWS:
+            start_sharded_validation(self.request.id, collection_id, uploading_agent_id, ds)
+            return
+
         do_upload_dataset(collection, uploading_agent_id, ds, no_commit, allow_partial, progress)
 
         ds.uploaderstatus = None
         ds.save(update_fields=['uploaderstatus'])
 
+def start_sharded_validation(taskid: str, collection_id: int, uploading_agent_id: int, ds: Spdataset) -> None:
+    """Split the validation of ds into row ranges validated in parallel
+    by validate_shard tasks. The dataset stays assigned to the upload
+    task <taskid> until merge_validation stores the combined results.
+    """
+    if ds.was_uploaded(): raise AssertionError("Dataset already uploaded", {"localizationKey" : "datasetAlreadyUploaded"})
+
+    shards = [
+        {'taskid': str(uuid4()), 'start': start, 'end': end}
+        for start, end in shard_ranges(ds.rowcount, settings.WB_VALIDATION_SHARDS)
+    ]
+    logger.info(f"validating dataset {ds.id} in {len(shards)} shards")
+
+    ds.rowresults = None
+    ds.uploadresult = None
+    ds.uploaderstatus = {**ds.uploaderstatus, 'shards': shards}
+    ds.save(update_fields=['rowresults', 'uploadresult', 'uploaderstatus'])
+
+    header = [
+        validate_shard.s(collection_id, uploading_agent_id, ds.id, taskid, shard['start'], shard['end']).set(task_id=shard['taskid'])
+        for shard in shards
+    ]
+    body = merge_validation.s(ds.id, taskid).on_error(sharded_validation_failed.s(ds.id, taskid))
+
+    # the shards must not start before the dataset status is committed
+    transaction.on_commit(lambda: chord(header)(body))
+
+@app.task(base=LogErrorsTask, bind=True)
+def validate_shard(self, collection_id: int, uploading_agent_id: int, ds_id: int, taskid: str, start: int, end: int) -> List[Dict]:
+
+    def progress(current: int, total: Optional[int]) -> None:
+        if not self.request.called_directly:
+            self.update_state(state='PROGRESS', meta={'current': current, 'total': total})
+
+    ds = Spdataset.objects.get(id=ds_id)
+    collection = Collection.objects.get(id=collection_id)
+
+    if ds.uploaderstatus is None or ds.uploaderstatus['taskid'] != taskid:
+        logger.info("dataset is not assigned to this validation")
+        return []
+
+    with transaction.atomic():
+        results = validate_dataset_shard(collection, uploading_agent_id, ds, start, end, progress)
+
+    return [r.to_json() for r in results]
+
+@app.task(base=LogErrorsTask, bind=True)
+def merge_validation(self, shard_results: List[List[Dict]], ds_id: int, taskid: str) -> None:
+    with transaction.atomic():
+        ds = Spdataset.objects.select_for_update().get(id=ds_id)
+
+        if ds.uploaderstatus is None or ds.uploaderstatus['taskid'] != taskid:
+            logger.info("dataset is not assigned to this validation")
+            return
+
+        ds.rowresults = json.dumps([r for results in shard_results for r in results])
+        ds.uploaderstatus = None
+        ds.save(update_fields=['rowresults', 'uploaderstatus'])
+
+@app.task(base=LogErrorsTask)
+def sharded_validation_failed(request, exc, traceback, ds_id: int, taskid: str) -> None:
+    logger.error(f"validation shard {request.id} of dataset {ds_id} failed: {exc!r}")
+    with transaction.atomic():
+        ds = Spdataset.objects.select_for_update().get(id=ds_id)
+        if ds.uploaderstatus is not None and ds.uploaderstatus['taskid'] == taskid:
+            for shard in ds.uploaderstatus['shards']:
+                validate_shard.AsyncResult(shard['taskid']).revoke(terminate=True)
+            ds.uploaderstatus = None
+            ds.save(update_fields=['uploaderstatus'])
+
+def sharded_validation_status(uploaderstatus: Dict) -> Tuple[str, Dict]:
+    "Combine the states of the shards of a sharded validation into one task status."
+    current = 0
+    total = 0
+    states = set()
+    for shard in uploaderstatus['shards']:
+        result = validate_shard.AsyncResult(shard['taskid'])
+        size = shard['end'] - shard['start']
+        total += size
+        states.add(result.state)
+        if result.state == 'SUCCESS':
+            current += size
+        elif result.state == 'PROGRESS' and isinstance(result.info, dict):
+            current += result.info['current']
+
+    state = 'FAILURE' if 'FAILURE' in states else \
+        'PENDING' if states == {'PENDING'} else \
+        'PROGRESS'
+    return state, {'current': current, 'total': total}
+
 @app.task(base=LogErrorsTask, bind=True)
 def unupload(self, ds_id: int, agent_id: int) -> None:
 
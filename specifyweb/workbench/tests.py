@@ -84,3 +84,70 @@ class DataSetTests(ApiTests):
 
         rs = getattr(spmodels, 'Recordset').objects.get(id=recordset_id)
         self.assertEqual(rs.recordsetitems.count(), 3)
+
+class RowStorageTests(ApiTests):
+
+    def test_rows_round_trip(self) -> None:
+        rows = [[str(i), f"name {i}", json.dumps({'disambiguation': {'': i}}) if i % 7 == 0 else ""] for i in range(2500)]
+        ds = models.Spdataset.objects.create(
+            specifyuser=self.specifyuser,
+            collection=self.collection,
+            name="Test data set",
+            columns=["catno", "name"],
+            importedfilename="foobar",
+        )
+        ds.save_rows(rows)
+        ds = models.Spdataset.objects.get(id=ds.id)
+
+        self.assertEqual(3, ds.rowblocks.count())
+        self.assertEqual(2500, ds.rowcount)
+        self.assertEqual(rows, ds.get_rows())
+        self.assertEqual(rows[990:1010], ds.get_rows(990, 1010))
+        self.assertEqual(rows[2400:], ds.get_rows(2400, 3000))
+
+        uploader.clear_disambiguation(ds)
+        self.assertEqual(
+            [json.dumps({'disambiguation': {}}) if i % 7 == 0 else "" for i in range(2500)],
+            [row[-1] for row in ds.get_rows()]
+        )
+
+    def test_iter_rows_reads_blocks_up_front(self) -> None:
+        rows = [[str(i), f"name {i}", ""] for i in range(1500)]
+        ds = models.Spdataset.objects.create(
+            specifyuser=self.specifyuser,
+            collection=self.collection,
+            name="Test data set",
+            columns=["catno", "name"],
+            importedfilename="foobar",
+        )
+        ds.save_rows(rows)
+
+        snapshot = ds.iter_rows(500, 1500)
+        ds.save_rows([[str(i), "changed", ""] for i in range(1500)])
+        self.assertEqual(rows[500:1500], list(snapshot))
+
+    def test_paged_rows(self) -> None:
+        c = Client()
+        c.force_login(self.specifyuser)
+        rows = [[str(i), f"name {i}"] for i in range(1200)]
+        response = c.post(
+            '/api/workbench/dataset/',
+            data={'name': "Test data set", 'columns': ["catno", "name"], 'rows': rows, 'importedfilename': "foobar"},
+            content_type='application/json',
+        )
+        datasetid = json.loads(response.content)['id']
+
+        response = c.get(f'/api/workbench/rows/{datasetid}/?offset=995&limit=10&columns=1,0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual('1200', response['X-Total-Count'])
+        self.assertEqual(
+            [[f"name {i}", str(i)] for i in range(995, 1005)],
+            json.loads(b"".join(response.streaming_content))
+        )
+
+        response = c.get(f'/api/workbench/rows/{datasetid}/?offset=1198&format=ndjson')
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([["1198", "name 1198", ""], ["1199", "name 1199", ""]], [json.loads(l) for l in lines])
+
+        response = c.get(f'/api/workbench/rows/{datasetid}/?columns=5')
+        self.assertEqual(response.status_code, 400)
@@ -1,28 +1,71 @@
 import logging
-from typing import Any, NamedTuple, Optional, Union
+from typing import Any, List, NamedTuple, Optional, Set, Tuple, Union
 
 from specifyweb.specify.auditlog import AuditLog
 from specifyweb.permissions.permissions import check_table_permissions
-from specifyweb.specify import models
+from specifyweb.specify import auditcodes, models
 
 Agent = getattr(models, 'Agent')
+Spauditlog = getattr(models, 'Spauditlog')
 
 logger = logging.getLogger(__name__)
 
+class AuditBatch(object):
+    """Collects the audit log records and permission checks of the
+    inserts made during an upload so they can be written with a single
+    bulk insert per chunk of rows instead of one query per record.
+    """
+
+    def __init__(self) -> None:
+        self.pending: List[Any] = []
+        self.permitted: Set[Tuple[str, int]] = set()
+
+    def mark(self) -> int:
+        return len(self.pending)
+
+    def rollback_to(self, mark: int) -> None:
+        "Discard the records collected since mark, e.g. for a rolled back row."
+        del self.pending[mark:]
+
+    def flush(self) -> None:
+        if self.pending:
+            logger.info(f"writing {len(self.pending)} audit log records")
+            # bulk_create bypasses the pre_save business rules, none
+            # of which apply to the audit log.
+            Spauditlog.objects.bulk_create(self.pending)
+        self.pending = []
+
 class Auditor(NamedTuple):
     collection: Any
     audit_log: Optional[AuditLog]
     skip_create_permission_check: bool = False
+    batch: Optional[AuditBatch] = None
+    # the upload_table.DeferredInserts of the chunk being uploaded
+    inserts: Optional[Any] = None
+
     def insert(self, inserted_obj: Any, agent: Union[int, Any], parent_record: Optional[Any]) -> None:
 
         if agent is None:
             logger.warn('WB inserting %s with no createdbyagent. Skipping permissions check.', inserted_obj)
         elif not self.skip_create_permission_check:
-            if isinstance(agent, int):
-                # TODO: Optimize this potential w/ just memoization
-                agent_obj = Agent.objects.get(id=agent)
-
-            check_table_permissions(self.collection, agent_obj, inserted_obj, "create")
+            self._check_create_permission(inserted_obj, agent)
 
         if self.audit_log is not None:
-            self.audit_log.insert(inserted_obj, agent, parent_record)
+            if self.batch is None:
+                self.audit_log.insert(inserted_obj, agent, parent_record)
+            else:
+                log_obj = self.audit_log.make_log(auditcodes.INSERT, inserted_obj, agent, parent_record)
+                if log_obj is not None:
+                    self.batch.pending.append(log_obj)
+
+    def _check_create_permission(self, inserted_obj: Any, agent: Union[int, Any]) -> None:
+        agent_id = agent if isinstance(agent, int) else agent.id
+        key = (inserted_obj.specify_model.name, agent_id)
+        if self.batch is not None and key in self.batch.permitted:
+            return
+
+        agent_obj = Agent.objects.get(id=agent) if isinstance(agent, int) else agent
+        check_table_permissions(self.collection, agent_obj, inserted_obj, "create")
+
+        if self.batch is not None:
+            self.batch.permitted.add(key)
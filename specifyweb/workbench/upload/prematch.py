@@ -0,0 +1,183 @@
+"""
+Set-based matching of workbench rows.
+
+Instead of every bound row issuing its own match query for each upload
+table it contains, a chunk of bound rows is walked before processing.
+The match predicates are grouped per table and resolved with a single
+multi-row query per group. Resulting matches are stored in the upload
+cache under the keys BoundUploadTable._match uses, so processing the
+rows afterwards only queries the database for records that do not
+already exist.
+
+Tables are resolved bottom up: a table whose to-one records have all
+been resolved (matched uniquely or blank) becomes resolvable in the
+next round. Tables with to-many records, disambiguated tables and
+tables depending on tree records are left to the regular per row
+matching.
+"""
+
+import logging
+import unicodedata
+from functools import reduce
+from operator import or_
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+
+from django.db.models import Q
+
+from specifyweb.specify import models
+from .upload_table import BoundUploadTable
+from .uploadable import BoundUploadable, FilterPack
+
+logger = logging.getLogger(__name__)
+
+# The maximum number of ids recorded per match. Mirrors the limit used
+# by BoundUploadTable._match.
+MAX_MATCHES = 10
+
+class Unresolved(object):
+    "Marks a record whose match can not be determined without the database."
+    pass
+
+UNRESOLVED = Unresolved()
+
+class PendingMatch(NamedTuple):
+    model: Any
+    cache_key: Tuple
+    filters: Dict[str, Any]
+    static: Dict[str, Any]
+
+Prediction = Union[int, None, Unresolved]
+
+def prematch_rows(bound_rows: List[BoundUploadable], cache: Dict) -> None:
+    """Resolve, as far as possible, the matches of the upload tables
+    in bound_rows with batched queries, recording them in cache.
+    """
+    nodes = [node for row in bound_rows for node in _upload_tables(row)]
+    attempted: Set[Tuple] = set()
+
+    while True:
+        pending: Dict[Tuple, PendingMatch] = {}
+        for node in nodes:
+            match = _pending_match(node, cache)
+            if isinstance(match, PendingMatch) \
+               and match.cache_key not in cache \
+               and match.cache_key not in attempted:
+                pending[match.cache_key] = match
+
+        if not pending:
+            break
+
+        attempted |= pending.keys()
+
+        groups: Dict[Tuple, List[PendingMatch]] = {}
+        for match in pending.values():
+            group_key = (match.model.__name__, tuple(sorted(match.filters.keys())), tuple(sorted(match.static.items())))
+            groups.setdefault(group_key, []).append(match)
+
+        for group in groups.values():
+            _resolve_group(group, cache)
+
+def _upload_tables(uploadable: BoundUploadable):
+    if isinstance(uploadable, BoundUploadTable):
+        for to_one in uploadable.toOne.values():
+            yield from _upload_tables(to_one)
+        yield uploadable
+
+def _pending_match(node: BoundUploadTable, cache: Dict) -> Union[PendingMatch, Prediction]:
+    """Mirror BoundUploadTable._handle_row far enough to determine what
+    would be matched on, without touching the database. Returns None
+    for a blank record, UNRESOLVED when the outcome depends on
+    something that isn't known yet, and otherwise the pending match.
+    """
+    if node.disambiguation is not None or any(records for records in node.toMany.values()):
+        return UNRESOLVED
+
+    toOneIds: Dict[str, Optional[int]] = {}
+    for fieldname, to_one in node.toOne.items():
+        predicted = _predict_id(to_one, cache)
+        if isinstance(predicted, Unresolved):
+            return UNRESOLVED
+        toOneIds[fieldname] = predicted
+
+    model = getattr(models, node.name.capitalize())
+
+    attrs = {
+        fieldname_: value
+        for parsedField in node.parsedFields
+        for fieldname_, value in parsedField.upload.items()
+    }
+    if all(v is None for v in attrs.values()) and all(id is None for id in toOneIds.values()):
+        return None
+
+    filters = node.match_filters(model, toOneIds)
+    return PendingMatch(
+        model=model,
+        cache_key=node.match_cache_key(filters, FilterPack([], [])),
+        filters=filters,
+        static={**node.scopingAttrs, **node.static},
+    )
+
+def _predict_id(uploadable: BoundUploadable, cache: Dict) -> Prediction:
+    if not isinstance(uploadable, BoundUploadTable):
+        return UNRESOLVED
+
+    match = _pending_match(uploadable, cache)
+    if not isinstance(match, PendingMatch):
+        return match
+
+    ids = cache.get(match.cache_key, None)
+    return ids[0] if ids is not None and len(ids) == 1 else UNRESOLVED
+
+def _resolve_group(group: List[PendingMatch], cache: Dict) -> None:
+    """Run one query for a group of pending matches on the same table
+    and fields, and assign the returned records back to the matches.
+
+    The database may compare values more loosely than Python does
+    (e.g. case insensitive collations). Matches are only cached when
+    the assignment is unambiguous: every returned record must equal
+    the filter values of some match exactly, and no two matches may
+    differ only in ways the database might ignore. Anything else is
+    left to the regular per row matching.
+    """
+    model = group[0].model
+    fields = sorted(group[0].filters.keys())
+
+    exact = set(tuple(match.filters[f] for f in fields) for match in group)
+
+    by_loose_key: Dict[Tuple, Set[Tuple]] = {}
+    for values in exact:
+        by_loose_key.setdefault(loose_key(values), set()).add(values)
+
+    ambiguous = set(
+        values
+        for variants in by_loose_key.values() if len(variants) > 1
+        for values in variants
+    )
+
+    found: Dict[Tuple, List[int]] = {}
+    qs = model.objects.filter(
+        reduce(or_, (Q(**match.filters) for match in group)),
+        **group[0].static,
+    ).values_list('id', *fields)
+
+    for id, *values in qs.iterator():
+        key = tuple(values)
+        if key not in exact:
+            logger.debug(f"unable to assign prematched {model.__name__} {id}, falling back to row matching")
+            return
+        found.setdefault(key, []).append(id)
+
+    for match in group:
+        values = tuple(match.filters[f] for f in fields)
+        if values in found and values not in ambiguous:
+            cache[match.cache_key] = sorted(found[values])[:MAX_MATCHES]
+
+def loose_key(values: Tuple) -> Tuple:
+    "A key under which values the database might consider equal are likely to coincide."
+    return tuple(_loose_value(v) for v in values)
+
+def _loose_value(value: Any) -> Any:
+    if isinstance(value, str):
+        decomposed = unicodedata.normalize('NFKD', value)
+        return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().rstrip()
+    return value
@@ -0,0 +1,196 @@
+"""
+Incremental re-validation of workbench data sets.
+
+After a validation run, the content hash of every row is stored with the
+data set together with digests of the values the row uploaded records
+for. When the data set is validated again, the rows are aligned with
+the previous run by hash and only the rows that could come out
+differently are processed:
+
+- rows that are new or whose content changed;
+- rows sharing a value, for the same table, with an earlier row that is
+  reprocessed or was removed, as that row may have uploaded (or stopped
+  uploading) a record they would match or conflict with;
+- earlier unchanged rows that uploaded a record sharing a value with a
+  reprocessed row, so that the record exists when the latter is
+  processed again.
+
+The results of the remaining rows are carried over from the previous
+run. Changes made to the database by other means since the previous
+run are not detected. The cache is dropped whenever the upload plan
+changes or the data set is uploaded.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from decimal import Decimal, InvalidOperation
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+from .prematch import _loose_value
+from .upload_result import Uploaded, UploadResult
+
+logger = logging.getLogger(__name__)
+
+ColumnTables = Dict[str, Set[str]]
+
+DIGITS_RE = re.compile(r'\d+')
+# values made of numbers and separators only, such as numeric dates
+NUMERIC_PARTS_RE = re.compile(r'^[\d\s./:-]+$')
+
+class RevalidationPlan(NamedTuple):
+    # for each current row, the index of the unchanged row of the
+    # previous run it corresponds to, if any.
+    previous_index: List[Optional[int]]
+
+    # indexes of the current rows that have to be processed, in order.
+    to_process: List[int]
+
+def row_hash(row: List) -> str:
+    "The content hash of a data set row, including its disambiguation cell."
+    return hashlib.blake2b(json.dumps(row).encode('utf-8'), digest_size=8).hexdigest()
+
+def column_tables(uploadable: Any) -> ColumnTables:
+    "Map every column of the upload plan to the tables it supplies values for."
+    result: ColumnTables = {}
+    _add_column_tables(uploadable, result)
+    return result
+
+def _add_column_tables(uploadable: Any, result: ColumnTables) -> None:
+    table = uploadable.name.lower()
+    if hasattr(uploadable, 'ranks'):
+        columns = [col for cols in uploadable.ranks.values() for col in cols.values()]
+    else:
+        columns = list(uploadable.wbcols.values())
+
+    for col in columns:
+        result.setdefault(col.column, set()).add(table)
+
+    for to_one in getattr(uploadable, 'toOne', {}).values():
+        _add_column_tables(to_one, result)
+
+    for records in getattr(uploadable, 'toMany', {}).values():
+        for record in records:
+            _add_column_tables(record, result)
+
+def row_tokens(tables_by_column: ColumnTables, row: Dict[str, str], tables: Optional[Set[str]]=None) -> Set[str]:
+    """Digests of the (table, value) pairs of the non-blank cells in row,
+    optionally restricted to the given tables. Rows can only match or
+    conflict with records uploaded by each other if they share a token.
+    """
+    tokens = set()
+    for column, value in row.items():
+        value = token_value(value) if isinstance(value, str) else value
+        if not value:
+            continue
+        for table in tables_by_column.get(column, ()):
+            if tables is None or table in tables:
+                tokens.add(_digest(f"{table}\0{value}"))
+    return tokens
+
+def token_value(value: str) -> str:
+    """Normalize the cell value so that cells the database collation or
+    the field parsers could take to be equal get the same token. The
+    normalization is coarser than either: different values sharing a
+    token only cause extra rows to be processed.
+
+    Accents and case are dropped as prematch does, numbers are compared
+    by value ('05', '5' and '5.0' are the same) and values made only of
+    numbers and separators, such as dates, by the set of their numbers
+    ('2020-01-05' and '05/01/2020' are the same).
+    """
+    value = ' '.join(_loose_value(value).split())
+    if not value:
+        return value
+
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        pass
+    else:
+        if number.is_finite():
+            return format(number.normalize(), 'f')
+
+    if NUMERIC_PARTS_RE.match(value):
+        return ' '.join(sorted(str(int(d)) for d in DIGITS_RE.findall(value)))
+
+    return DIGITS_RE.sub(lambda m: str(int(m.group())), value)
+
+def _digest(token: str) -> str:
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=6).hexdigest()
+
+def uploaded_tables(result: UploadResult) -> Set[str]:
+    "The tables for which records were uploaded in result."
+    tables = set()
+    if isinstance(result.record_result, Uploaded):
+        tables.add(result.record_result.info.tableName.lower())
+    for to_one in result.toOne.values():
+        tables |= uploaded_tables(to_one)
+    for records in result.toMany.values():
+        for record in records:
+            tables |= uploaded_tables(record)
+    return tables
+
+def upload_tokens(tables_by_column: ColumnTables, row: Dict[str, str], result: UploadResult) -> Set[str]:
+    "The tokens of the records row uploaded. Failed rows are rolled back, so upload nothing."
+    if result.contains_failure():
+        return set()
+    return row_tokens(tables_by_column, row, uploaded_tables(result))
+
+def plan_revalidation(
+        previous_hashes: List[str],
+        previous_tokens: List[List[str]],
+        hashes: List[str],
+        tokens: List[Set[str]],
+) -> RevalidationPlan:
+    """Determine which of the current rows, with the given hashes and
+    tokens, have to be processed again given the hashes and upload
+    tokens of the previous validation run.
+    """
+    nrows = len(hashes)
+    previous_index: List[Optional[int]] = [None] * nrows
+
+    # upload tokens of removed or changed rows of the previous run, by
+    # the position in the current rows from which on they apply.
+    removed: Dict[int, Set[str]] = {}
+
+    matcher = SequenceMatcher(None, previous_hashes, hashes, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for offset in range(i2 - i1):
+                previous_index[j1 + offset] = i1 + offset
+        else:
+            removed_tokens = removed.setdefault(j1, set())
+            for i in range(i1, i2):
+                removed_tokens.update(previous_tokens[i])
+
+    old_tokens = [
+        set(previous_tokens[i]) if i is not None else set()
+        for i in previous_index
+    ]
+
+    process = [i is None for i in previous_index]
+
+    # rows affected by the records reprocessed or removed rows before
+    # them may or may not upload.
+    tainted: Set[str] = set()
+    for j in range(nrows):
+        tainted |= removed.get(j, set())
+        if not process[j] and tokens[j] & tainted:
+            process[j] = True
+        if process[j]:
+            tainted |= tokens[j] | old_tokens[j]
+
+    # rows that uploaded records a reprocessed row after them depends on.
+    needed: Set[str] = set()
+    for j in reversed(range(nrows)):
+        if not process[j] and old_tokens[j] & needed:
+            process[j] = True
+        if process[j]:
+            needed |= tokens[j]
+
+    to_process = [j for j in range(nrows) if process[j]]
+    logger.info(f"revalidating {len(to_process)} of {nrows} rows")
+    return RevalidationPlan(previous_index, to_process)
@@ -0,0 +1,110 @@
+import unittest
+
+from specifyweb.specify.api_tests import get_table
+from .base import UploadTestsBase
+from ..upload import do_upload, shard_ranges, JournaledCache
+from ..upload_plan_schema import parse_plan
+from ..upload_result import Uploaded, ParseFailures, FailedBusinessRule
+
+class JournaledCacheTests(unittest.TestCase):
+    def test_rollback_restores_entries(self) -> None:
+        cache = JournaledCache()
+        cache['a'] = [1]
+        mark = cache.mark()
+        cache['a'] = [2]
+        cache['b'] = [3]
+        del cache['a']
+        self.assertEqual({'b': [3]}, dict(cache))
+
+        cache.rollback_to(mark)
+        self.assertEqual({'a': [1]}, dict(cache))
+
+    def test_nested_marks(self) -> None:
+        cache = JournaledCache()
+        outer = cache.mark()
+        cache['a'] = [1]
+        inner = cache.mark()
+        cache['b'] = [2]
+        cache.rollback_to(inner)
+        self.assertEqual({'a': [1]}, dict(cache))
+        cache.rollback_to(outer)
+        self.assertEqual({}, dict(cache))
+
+    def test_commit_keeps_entries(self) -> None:
+        cache = JournaledCache()
+        cache['a'] = [1]
+        cache.commit()
+        self.assertEqual(0, cache.mark())
+        cache.rollback_to(0)
+        self.assertEqual({'a': [1]}, dict(cache))
+
+class ChunkedSavepointTests(UploadTestsBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.plan = parse_plan(self.collection, dict(
+            baseTableName = 'Collectionobject',
+            uploadable = { 'uploadTable': dict(
+                wbcols = {'catalognumber' : "catno", 'countamt': "count"},
+                static = {},
+                toMany = {},
+                toOne = {},
+            )}
+        )).apply_scoping(self.collection)
+
+    def test_failing_rows_isolated(self) -> None:
+        data = [
+            dict(catno=str(i), count='x' if i in (3, 4, 9) else '1')
+            for i in range(1, 13)
+        ]
+        co_count = get_table('Collectionobject').objects.count()
+
+        for chunk_size in (1, 4, 64):
+            results = do_upload(self.collection, data, self.plan, self.agent.id, savepoint_chunk_size=chunk_size)
+            self.assertEqual(len(data), len(results))
+            for i, r in enumerate(results, 1):
+                if i in (3, 4, 9):
+                    self.assertIsInstance(r.record_result, ParseFailures)
+                else:
+                    self.assertIsInstance(r.record_result, Uploaded)
+                    self.assertTrue(get_table('Collectionobject').objects.filter(id=r.get_id()).exists())
+
+            get_table('Collectionobject').objects.filter(id__in=[r.get_id() for r in results if isinstance(r.record_result, Uploaded)]).delete()
+            self.assertEqual(co_count, get_table('Collectionobject').objects.count())
+
+    def test_failed_row_refers_to_redone_records(self) -> None:
+        plan = parse_plan(self.collection, dict(
+            baseTableName = 'Collectionobject',
+            uploadable = { 'uploadTable': dict(
+                wbcols = {'catalognumber' : "catno"},
+                static = {},
+                toMany = {},
+                toOne = {
+                    'cataloger': { 'uploadTable': dict(
+                        wbcols = {'lastname': 'lastname'},
+                        static = {},
+                        toOne = {},
+                        toMany = {},
+                    )}
+                }
+            )}
+        )).apply_scoping(self.collection)
+
+        # the second row matches the agent uploaded by the first and
+        # then fails on the duplicate catalog number
+        data = [
+            dict(catno='100', lastname='Chunked'),
+            dict(catno='100', lastname='Chunked'),
+        ]
+        results = do_upload(self.collection, data, plan, self.agent.id, savepoint_chunk_size=4)
+
+        self.assertIsInstance(results[0].record_result, Uploaded)
+        self.assertIsInstance(results[1].record_result, FailedBusinessRule)
+        agent_id = results[0].toOne['cataloger'].get_id()
+        self.assertTrue(get_table('Agent').objects.filter(id=agent_id).exists())
+        self.assertEqual(agent_id, results[1].toOne['cataloger'].get_id())
+
+class ShardRangesTests(unittest.TestCase):
+    def test_ranges_cover_rows(self) -> None:
+        self.assertEqual([(0, 4), (4, 7), (7, 10)], shard_ranges(10, 3))
+        self.assertEqual([(0, 1), (1, 2)], shard_ranges(2, 5))
+        self.assertEqual([(0, 0)], shard_ranges(0, 4))
@@ -0,0 +1,62 @@
+from specifyweb.specify.api_tests import get_table
+from .base import UploadTestsBase
+from ..prematch import prematch_rows
+from ..upload import do_upload
+from ..upload_plan_schema import parse_plan
+from ..upload_result import Uploaded, Matched, MatchedMultiple
+from ..uploadable import Auditor
+
+class PrematchTests(UploadTestsBase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.plan = parse_plan(self.collection, dict(
+            baseTableName = 'Collectionobject',
+            uploadable = { 'uploadTable': dict(
+                wbcols = {'catalognumber' : "catno"},
+                static = {},
+                toMany = {},
+                toOne = {
+                    'cataloger': { 'uploadTable': dict(
+                        wbcols = {'lastname': 'lastname'},
+                        static = {},
+                        toOne = {},
+                        toMany = {},
+                    )}
+                }
+            )}
+        )).apply_scoping(self.collection)
+
+        for lastname in ['Doe', 'Smith', 'Smith']:
+            get_table('Agent').objects.create(lastname=lastname, agenttype=1, division=self.division)
+
+    def test_prematch_populates_cache(self) -> None:
+        data = [
+            dict(catno='1', lastname='Doe'),
+            dict(catno='2', lastname='Smith'),
+            dict(catno='3', lastname='Nobody'),
+        ]
+        cache: dict = {}
+        auditor = Auditor(self.collection, None)
+        bound = [self.plan.bind(self.collection, row, self.agent.id, auditor, cache, i) for i, row in enumerate(data)]
+        prematch_rows(bound, cache)
+
+        doe = get_table('Agent').objects.get(lastname='Doe')
+        smiths = sorted(a.id for a in get_table('Agent').objects.filter(lastname='Smith'))
+        self.assertIn([doe.id], cache.values())
+        self.assertIn(smiths, cache.values())
+        self.assertEqual(2, len(cache), "only existing records are cached")
+
+    def test_prematch_same_results(self) -> None:
+        data = [
+            dict(catno='1', lastname='Doe'),
+            dict(catno='2', lastname='Smith'),
+            dict(catno='3', lastname='Nobody'),
+            dict(catno='4', lastname='Nobody'),
+        ]
+        results = do_upload(self.collection, data, self.plan, self.agent.id, no_commit=True)
+        unbatched = do_upload(self.collection, data, self.plan, self.agent.id, no_commit=True, prematch_batch_size=1)
+
+        for r, u, expected in zip(results, unbatched, [Matched, MatchedMultiple, Uploaded, Matched]):
+            self.assertIsInstance(r.toOne['cataloger'].record_result, expected)
+            self.assertIsInstance(u.toOne['cataloger'].record_result, expected)
@@ -0,0 +1,97 @@
+import unittest
+
+from .base import UploadTestsBase
+from ..revalidation import plan_revalidation, row_hash, column_tables, row_tokens
+from ..upload import do_revalidation
+from ..upload_plan_schema import parse_plan
+from ..upload_result import Uploaded, Matched
+from ...views import apply_row_changes
+
+class PlanRevalidationTests(unittest.TestCase):
+    def test_unchanged_rows_reused(self) -> None:
+        hashes = ['a', 'b', 'c']
+        plan = plan_revalidation(hashes, [[], [], []], hashes, [set(), set(), set()])
+        self.assertEqual([0, 1, 2], plan.previous_index)
+        self.assertEqual([], plan.to_process)
+
+    def test_changed_row_taints_later_rows(self) -> None:
+        plan = plan_revalidation(
+            ['a', 'b', 'c', 'd'], [['x'], [], [], []],
+            ['a2', 'b', 'c', 'd'], [{'x'}, set(), {'x'}, {'y'}],
+        )
+        self.assertEqual([None, 1, 2, 3], plan.previous_index)
+        self.assertEqual([0, 2], plan.to_process)
+
+    def test_earlier_uploads_reprocessed(self) -> None:
+        plan = plan_revalidation(
+            ['a', 'b', 'c'], [['x'], ['y'], []],
+            ['a', 'b', 'c2'], [{'x'}, {'y'}, {'x'}],
+        )
+        self.assertEqual([0, 2], plan.to_process)
+
+    def test_removed_rows_taint_later_rows(self) -> None:
+        plan = plan_revalidation(
+            ['a', 'b', 'c'], [[], ['x'], []],
+            ['a', 'c'], [set(), {'x'}],
+        )
+        self.assertEqual([0, 2], plan.previous_index)
+        self.assertEqual([1], plan.to_process)
+
+class ApplyRowChangesTests(unittest.TestCase):
+    def test_changes(self) -> None:
+        rows = [['1', ''], ['2', ''], ['3', '']]
+        changes = {'update': [[0, ['one']], [1, ['']]], 'delete': [2], 'append': [['4']]}
+        self.assertEqual([['one', ''], ['4', '']], apply_row_changes(1, rows, changes))
+
+    def test_bad_index(self) -> None:
+        with self.assertRaises(ValueError):
+            apply_row_changes(1, [['1', '']], {'delete': [1]})
+
+class RevalidationTests(UploadTestsBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.plan = parse_plan(self.collection, dict(
+            baseTableName = 'Collectionobject',
+            uploadable = { 'uploadTable': dict(
+                wbcols = {'catalognumber' : "catno"},
+                static = {},
+                toMany = {},
+                toOne = {
+                    'cataloger': { 'uploadTable': dict(
+                        wbcols = {'lastname': 'lastname'},
+                        static = {},
+                        toOne = {},
+                        toMany = {},
+                    )}
+                }
+            )}
+        )).apply_scoping(self.collection)
+
+    def validate(self, data, previous):
+        rows = [dict(catno=catno, lastname=lastname) for catno, lastname, _ in data]
+        return do_revalidation(self.collection, rows, data, self.plan, self.agent.id, [None] * len(data), previous)
+
+    def test_same_as_full_validation(self) -> None:
+        data = [['1', 'Nobody', ''], ['2', 'Somebody', ''], ['3', 'Nobody', ''], ['4', 'Else', '']]
+        results, cache = self.validate(data, None)
+        self.assertEqual([row_hash(row) for row in data], cache['hashes'])
+
+        edited = [['1', 'Somebody', ''], ['2', 'Somebody', ''], ['3', 'Nobody', ''], ['4', 'Else', '']]
+        incremental, _ = self.validate(edited, (cache, [r.to_json() for r in results]))
+        full, _ = self.validate(edited, None)
+
+        for i, r, f in zip(range(4), incremental, full):
+            self.assertEqual(type(f.toOne['cataloger'].record_result), type(r.toOne['cataloger'].record_result), i)
+
+        self.assertIsInstance(incremental[1].toOne['cataloger'].record_result, Matched)
+        self.assertIsInstance(incremental[2].toOne['cataloger'].record_result, Uploaded)
+
+    def test_row_tokens(self) -> None:
+        tables = column_tables(self.plan)
+        self.assertEqual({'catno': {'collectionobject'}, 'lastname': {'agent'}}, tables)
+        self.assertEqual(row_tokens(tables, {'lastname': 'Doe '}), row_tokens(tables, {'lastname': 'doe'}))
+        self.assertEqual(set(), row_tokens(tables, {'catno': '1'}, {'agent'}))
+        self.assertEqual(row_tokens(tables, {'lastname': 'Ménard'}), row_tokens(tables, {'lastname': 'menard'}))
+        self.assertEqual(row_tokens(tables, {'catno': '05'}), row_tokens(tables, {'catno': '5'}))
+        self.assertEqual(row_tokens(tables, {'catno': '2020-01-05'}), row_tokens(tables, {'catno': '05/01/2020'}))
+        self.assertNotEqual(row_tokens(tables, {'catno': '5'}), row_tokens(tables, {'catno': '6'}))
@@ -0,0 +1,57 @@
+from jsonschema import validate  # type: ignore
+
+from specifyweb.specify.test_trees import TestTree
+from .base import UploadTestsBase
+from ..upload import do_upload
+from ..upload_plan_schema import schema, parse_plan
+from ..upload_result import Uploaded, Matched, MatchedMultiple
+from ..uploadable import Auditor
+
+class TreeIndexTests(TestTree, UploadTestsBase):
+    def setUp(self) -> None:
+        super().setUp()
+        plan_json = dict(
+            baseTableName = 'Geography',
+            uploadable = { 'treeRecord': dict(
+                ranks = {
+                    'State': 'State',
+                    'County': 'County',
+                    'City': 'City',
+                }
+            )}
+        )
+        validate(plan_json, schema)
+        self.plan = parse_plan(self.collection, plan_json).apply_scoping(self.collection)
+
+    def test_children_indexed(self) -> None:
+        cache: dict = {}
+        row = {'State': 'Missouri', 'County': 'Greene', 'City': 'Springfield'}
+        result = self.plan.bind(self.collection, row, self.agent.id, Auditor(self.collection, None), cache).process_row()
+        assert isinstance(result.record_result, Matched)
+        self.assertEqual(self.springmo.id, result.record_result.id)
+
+        index = cache[('Geography', 'children', self.greene.id, self.springmo.definitionitem_id, ('name',))]
+        self.assertEqual([self.springmo.id], [info['id'] for infos in index.values() for info, _ in infos])
+
+    def test_inserted_nodes_matched(self) -> None:
+        data = [
+            {'State': 'Kansas', 'County': 'Johnson', 'City': 'Olathe'},
+            {'State': 'Kansas', 'County': 'Johnson', 'City': 'Lenexa'},
+            {'State': 'Kansas', 'County': 'Johnson', 'City': 'Olathe'},
+            {'State': 'missouri', 'County': 'greene', 'City': 'springfield'},
+            {'State': '', 'County': 'Greene', 'City': ''},
+        ]
+        results = do_upload(self.collection, data, self.plan, self.agent.id)
+
+        self.assertIsInstance(results[0].record_result, Uploaded)
+        self.assertIsInstance(results[1].record_result, Uploaded)
+        self.assertIsInstance(results[1].toOne['parent'].record_result, Matched)
+        self.assertEqual(results[0].toOne['parent'].get_id(), results[1].toOne['parent'].get_id())
+        self.assertIsInstance(results[2].record_result, Matched)
+        self.assertEqual(results[0].get_id(), results[2].get_id())
+
+        # matched by the database collation rather than the index
+        assert isinstance(results[3].record_result, Matched)
+        self.assertEqual(self.springmo.id, results[3].record_result.id)
+
+        self.assertIsInstance(results[4].record_result, MatchedMultiple)
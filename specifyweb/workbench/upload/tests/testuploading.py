@@ -2,11 +2,12 @@ import csv
 import io
 from datetime import datetime
 from decimal import Decimal
-from unittest import skip
+from unittest import mock, skip
 from uuid import uuid4
 
 from jsonschema import validate  # type: ignore
 
+from specifyweb.businessrules.orm_signal_handler import insert_batch
 from specifyweb.specify import auditcodes
 from specifyweb.specify.auditlog import auditlog
 from specifyweb.specify.test_trees import TestTree
@@ -591,6 +592,87 @@ class UploadTests(UploadTestsBase):
         dets = [get_table('Collectionobject').objects.get(id=r.get_id()).determinations.get() for r in results]
         self.assertFalse(any(d.iscurrent for d in dets), "created determinations have iscurrent = false by override")
 
+    def test_to_many_records_saved_together(self) -> None:
+        plan_json = {
+            "baseTableName": "collectionobject",
+            "uploadable": {
+                "uploadTable": {
+                    "wbcols": {
+                        "catalognumber": "Catno",
+                    },
+                    "static": {},
+                    "toOne": {},
+                    "toMany": {
+                        "determinations": [
+                            {
+                                "wbcols": {"remarks": f"Remarks {i}"},
+                                "static": {},
+                                "toOne": {},
+                            }
+                            for i in (1, 2)
+                        ],
+                    }
+                }
+            }
+        }
+
+        validate(plan_json, schema)
+        scoped_plan = parse_plan(self.collection, plan_json).apply_scoping(self.collection)
+        data = [
+            {'Catno': '1', 'Remarks 1': 'first', 'Remarks 2': 'second'},
+            {'Catno': '2', 'Remarks 1': 'third', 'Remarks 2': 'fourth'},
+            {'Catno': '3', 'Remarks 1': 'fifth', 'Remarks 2': ''},
+        ]
+        with mock.patch('specifyweb.workbench.upload.upload_table.insert_batch', wraps=insert_batch) as batch:
+            results = do_upload(self.collection, data, scoped_plan, self.agent.id)
+        self.assertEqual(1, batch.call_count, "the determinations of the chunk are inserted together")
+        self.assertEqual(5, len(batch.call_args[0][0]))
+
+        det_results = [r for result in results for r in result.toMany['determinations']]
+        self.assertTrue(all(isinstance(r.record_result, Uploaded) for r in det_results[:5]))
+        dets = [get_table('Determination').objects.get(id=r.get_id()) for r in det_results[:5]]
+        self.assertEqual(['first', 'second', 'third', 'fourth', 'fifth'], [d.remarks for d in dets])
+        self.assertEqual(
+            [results[0].get_id()] * 2 + [results[1].get_id()] * 2 + [results[2].get_id()],
+            [d.collectionobject_id for d in dets])
+        self.assertEqual([False, True, False, True, True], [d.iscurrent for d in dets], "the last determination stays current")
+
+    def test_deferred_to_many_records_fall_back_to_row_by_row(self) -> None:
+        from specifyweb.businessrules.exceptions import BusinessRuleException
+        plan_json = {
+            "baseTableName": "collectionobject",
+            "uploadable": {
+                "uploadTable": {
+                    "wbcols": {"catalognumber": "Catno"},
+                    "static": {},
+                    "toOne": {},
+                    "toMany": {
+                        "determinations": [{"wbcols": {"remarks": "Remarks"}, "static": {}, "toOne": {}}],
+                    }
+                }
+            }
+        }
+        scoped_plan = parse_plan(self.collection, plan_json).apply_scoping(self.collection)
+        data = [
+            {'Catno': '1', 'Remarks': 'first'},
+            {'Catno': '2', 'Remarks': 'second'},
+            {'Catno': '3', 'Remarks': 'third'},
+        ]
+
+        def reject_batches(dets):
+            if len(dets) > 1:
+                raise BusinessRuleException("rejected batch")
+
+        with mock.patch.dict('specifyweb.businessrules.orm_signal_handler.batch_rules',
+                             {('pre_save', 'Determination'): [(None, reject_batches)]}):
+            results = do_upload(self.collection, data, scoped_plan, self.agent.id)
+
+        self.assertTrue(all(isinstance(r.record_result, Uploaded) for r in results))
+        det_results = [result.toMany['determinations'][0] for result in results]
+        self.assertTrue(all(isinstance(r.record_result, Uploaded) for r in det_results))
+        self.assertEqual(['first', 'second', 'third'], [
+            get_table('Determination').objects.get(id=r.get_id()).remarks for r in det_results])
+
     def test_ordernumber(self) -> None:
         plan = UploadTable(
             name='Referencework',
@@ -15,10 +15,15 @@ from .parsing import ParseResult, ParseFailure, parse_many, filter_and_upload
 from .upload_result import UploadResult, NullRecord, NoMatch, Matched, \
     MatchedMultiple, Uploaded, ParseFailures, FailedBusinessRule, ReportInfo, \
     TreeInfo
+from .prematch import loose_key
 from .uploadable import Row, FilterPack, Disambiguation as DA, Auditor
 
 logger = logging.getLogger(__name__)
 
+# Parents with more children than this at a rank are not indexed in
+# the upload cache and are matched against with a query per row.
+CHILD_INDEX_LIMIT = 2000
+
 
 class TreeRecord(NamedTuple):
     name: str
@@ -234,6 +239,16 @@ class BoundTreeRecord(NamedTuple):
         model = getattr(models, self.name)
 
         for d in range(steps):
+            if d == 0:
+                indexed = self._match_child(parent, to_match, filters)
+                if indexed is not None:
+                    matches = indexed
+                    if matches:
+                        if self.cache is not None:
+                            self.cache[cache_key] = matches
+                        break
+                    continue
+
             matches = list(model.objects.filter(
                 definitionitem_id=to_match.treedefitem.id,
                 **filters,
@@ -246,6 +261,85 @@ class BoundTreeRecord(NamedTuple):
 
         return matches
 
+    def _match_child(self, parent: Optional[MatchInfo], to_match: TreeDefItemWithParseResults, filters: Dict[str, Any]) -> Optional[List[MatchInfo]]:
+        """Match to_match among the direct children of parent (or the
+        nodes of its rank if there is no parent) using the index of
+        those children kept in the upload cache. Returns None when the
+        index can't tell, in which case the database is queried.
+
+        The database compares values more loosely than Python does.
+        Matches are only taken from the index when they equal the
+        filters exactly, and a missing match is only trusted for plain
+        ASCII values, where the loose key agrees with the collation.
+        """
+        if self.cache is None:
+            return None
+
+        fields = tuple(sorted(filters.keys()))
+        values = tuple(filters[f] for f in fields)
+        if not all(v is None or (isinstance(v, str) and v.isascii()) for v in values):
+            return None
+
+        parent_id = parent and parent['id']
+        index = self._children_index(parent_id, to_match.treedefitem.id, fields)
+        if index is None:
+            return None
+
+        key = loose_key(values)
+        candidates = index.get(key, []) + self.cache.get(self._inserted_key(parent_id, to_match.treedefitem.id, fields, key), [])
+        if any(found_values != values for _, found_values in candidates):
+            return None
+
+        matches: Dict[int, MatchInfo] = {info['id']: info for info, _ in candidates}
+        return sorted(matches.values(), key=lambda info: info['id'])[:10]
+
+    def _children_index(self, parent_id: Optional[int], treedefitem_id: int, fields: Tuple[str, ...]) -> Optional[Dict[Tuple, List[Tuple[MatchInfo, Tuple]]]]:
+        "Load the children of parent_id at treedefitem_id into the cache, keyed by the loose key of fields."
+        assert self.cache is not None
+        cache_key = (self.name, 'children', parent_id, treedefitem_id, fields)
+        if cache_key in self.cache:
+            return self.cache[cache_key]
+
+        model = getattr(models, self.name)
+        info_fields = ['id', 'name', 'definitionitem__name', 'definitionitem__rankid']
+        children = list(model.objects.filter(
+            definitionitem_id=treedefitem_id,
+            **({'parent_id': parent_id} if parent_id is not None else {}),
+        ).values(*info_fields, *(f for f in fields if f not in info_fields))[:CHILD_INDEX_LIMIT + 1])
+
+        index: Optional[Dict[Tuple, List[Tuple[MatchInfo, Tuple]]]] = None
+        if len(children) <= CHILD_INDEX_LIMIT:
+            index = {}
+            for child in children:
+                child_values = tuple(child[f] for f in fields)
+                info: MatchInfo = {f: child[f] for f in info_fields} # type: ignore
+                index.setdefault(loose_key(child_values), []).append((info, child_values))
+
+        self.cache[cache_key] = index
+        return index
+
+    def _inserted_key(self, parent_id: Optional[int], treedefitem_id: int, fields: Tuple[str, ...], key: Tuple) -> Tuple:
+        return (self.name, 'inserted', parent_id, treedefitem_id, fields, key)
+
+    def _record_insert(self, obj, tdiwpr: TreeDefItemWithParseResults) -> None:
+        """Add a newly inserted node to the children index so that rows
+        that follow find it without a query. Being kept in the upload
+        cache, the entry is discarded along with the insert if the row
+        is rolled back.
+        """
+        if self.cache is None:
+            return
+        filters = {field: value for r in tdiwpr.results for field, value in r.filter_on.items()}
+        fields = tuple(sorted(filters.keys()))
+        values = tuple(filters[f] for f in fields)
+        info: MatchInfo = {'id': obj.id, 'name': obj.name, 'definitionitem__name': tdiwpr.treedefitem.name, 'definitionitem__rankid': tdiwpr.treedefitem.rankid}
+
+        # the node is among the children of its parent as well as the
+        # nodes of its rank matched against when there is no parent.
+        for parent_id in {obj.parent_id, None}:
+            inserted_key = self._inserted_key(parent_id, tdiwpr.treedefitem.id, fields, loose_key(values))
+            self.cache[inserted_key] = self.cache.get(inserted_key, []) + [(info, values)]
+
     def _upload(self, to_upload: List[TreeDefItemWithParseResults], matched: Union[Matched, NoMatch]) -> UploadResult:
         assert to_upload, f"Invalid Error: {to_upload}, can not upload matched resluts: {matched}"
         model = getattr(models, self.name)
@@ -335,6 +429,7 @@ class BoundTreeRecord(NamedTuple):
                     return UploadResult(FailedBusinessRule(str(e), {}, info), parent_result, {})
 
             self.auditor.insert(obj, self.uploadingAgentId, None)
+            self._record_insert(obj, tdiwpr)
             result = UploadResult(Uploaded(obj.id, info, []), parent_result, {})
 
             parent_info = {'id': obj.id, 'definitionitem__rankid': obj.definitionitem.rankid}
@@ -4,28 +4,46 @@ import logging
 import time
 from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import List, Dict, Union, Callable, Optional, Sized, Tuple, Any
+from itertools import islice
+from typing import List, Dict, Union, Callable, Optional, Sized, Tuple, Any, Iterable, Iterator, TypeVar
 
 from django.db import transaction
 from django.db.utils import OperationalError, IntegrityError
 from jsonschema import validate  # type: ignore
 
+from specifyweb.businessrules.exceptions import BusinessRuleException
 from specifyweb.specify import models
 from specifyweb.specify.datamodel import datamodel
 from specifyweb.specify.auditlog import auditlog
 from specifyweb.specify.datamodel import Table
-from specifyweb.specify.tree_extras import renumber_tree, set_fullnames
-from specifyweb.workbench.upload.upload_table import DeferredScopeUploadTable, ScopedUploadTable
+from specifyweb.specify.tree_extras import number_new_nodes, set_fullnames
+from specifyweb.workbench.upload.upload_table import DeferredScopeUploadTable, ScopedUploadTable, DeferredInserts
 
 from . import disambiguation
+from .prematch import prematch_rows
+from .revalidation import column_tables, plan_revalidation, row_hash, row_tokens, upload_tokens
 from .upload_plan_schema import schema, parse_plan_with_basetable
 from .upload_result import Uploaded, UploadResult, ParseFailures, \
     json_to_UploadResult
-from .uploadable import ScopedUploadable, Row, Disambiguation, Auditor
+from .auditor import AuditBatch
+from .uploadable import ScopedUploadable, BoundUploadable, Row, Disambiguation, Auditor
 from ..models import Spdataset
 
 Rows = Union[List[Row], csv.DictReader]
 Progress = Callable[[int, Optional[int]], None]
+T = TypeVar('T')
+
+# Number of rows bound and matched together by prematch_rows before
+# being processed one at a time. A value of 1 disables prematching.
+PREMATCH_BATCH_SIZE = 500
+
+# Maximum number of rows uploaded under a single save point when
+# partial uploads are allowed. A chunk containing a failing row is split
+# at that row: the rows before it are redone, the failing row is retried
+# alone and the rest are tried again. A value of 1 gives a save point
+# per row. The to-many records of the rows of a chunk are inserted
+# together at its end, see DeferredInserts.
+SAVEPOINT_CHUNK_SIZE = 64
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +70,41 @@ def savepoint(description: str):
 def no_savepoint():
     yield
 
+class JournaledCache(dict):
+    """The upload match cache. Writes made after mark() can be undone
+    with rollback_to() so that a rolled back chunk of rows only loses
+    its own cache entries, without copying the whole cache up front.
+    """
+
+    _UNSET = object()
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._journal: List[Tuple[Any, Any]] = []
+
+    def __setitem__(self, key, value) -> None:
+        self._journal.append((key, self.get(key, self._UNSET)))
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key) -> None:
+        self._journal.append((key, self[key]))
+        super().__delitem__(key)
+
+    def mark(self) -> int:
+        return len(self._journal)
+
+    def rollback_to(self, mark: int) -> None:
+        while len(self._journal) > mark:
+            key, previous = self._journal.pop()
+            if previous is self._UNSET:
+                super().pop(key, None)
+            else:
+                super().__setitem__(key, previous)
+
+    def commit(self) -> None:
+        "Forget the journal. Earlier marks can no longer be rolled back to."
+        self._journal = []
+
 def unupload_dataset(ds: Spdataset, agent, progress: Optional[Progress]=None) -> None:
     if ds.rowresults is None:
         return
@@ -116,16 +169,24 @@ def do_upload_dataset(
         progress: Optional[Progress]=None
 ) -> List[UploadResult]:
     if ds.was_uploaded(): raise AssertionError("Dataset already uploaded", {"localizationKey" : "datasetAlreadyUploaded"})
+    previous = previous_validation(ds) if no_commit else None
     ds.rowresults = None
     ds.uploadresult = None
-    ds.save(update_fields=['rowresults', 'uploadresult'])
+    ds.validationcache = None
+    ds.save(update_fields=['rowresults', 'uploadresult', 'validationcache'])
 
     ncols = len(ds.columns)
-    rows = [dict(zip(ds.columns, row)) for row in ds.data]
-    disambiguation = [get_disambiguation_from_row(ncols, row) for row in ds.data]
+    data = ds.get_rows()
+    rows = [dict(zip(ds.columns, row)) for row in data]
+    disambiguation = [get_disambiguation_from_row(ncols, row) for row in data]
     base_table, upload_plan = get_ds_upload_plan(collection, ds)
 
-    results = do_upload(collection, rows, upload_plan, uploading_agent_id, disambiguation, no_commit, allow_partial, progress)
+    if no_commit:
+        results, ds.validationcache = do_revalidation(
+            collection, rows, data, upload_plan, uploading_agent_id, disambiguation, previous, progress)
+    else:
+        results = do_upload(collection, rows, upload_plan, uploading_agent_id, disambiguation, no_commit, allow_partial, progress)
+
     success = not any(r.contains_failure() for r in results)
     if not no_commit:
         ds.uploadresult = {
@@ -135,9 +196,108 @@ def do_upload_dataset(
             'uploadingAgentId': uploading_agent_id,
         }
     ds.rowresults = json.dumps([r.to_json() for r in results])
-    ds.save(update_fields=['rowresults', 'uploadresult'])
+    ds.save(update_fields=['rowresults', 'uploadresult', 'validationcache'])
     return results
 
+def previous_validation(ds: Spdataset) -> Optional[Tuple[Dict, List[Dict]]]:
+    """The validation cache of ds and the row results it belongs to, if
+    the data set was validated since the upload plan was last changed.
+    """
+    cache = ds.validationcache
+    if cache is None:
+        return None
+    rowresults = ds.rowresults if ds.rowresults is not None else cache.get('rowresults', None)
+    if rowresults is None:
+        return None
+    return cache, json.loads(rowresults)
+
+def do_revalidation(
+        collection,
+        rows: List[Row],
+        data: List[List],
+        upload_plan: ScopedUploadable,
+        uploading_agent_id: int,
+        disambiguations: List[Disambiguation],
+        previous: Optional[Tuple[Dict, List[Dict]]],
+        progress: Optional[Progress]=None,
+) -> Tuple[List[UploadResult], Dict]:
+    """Validate rows, reusing the results of the previous validation run
+    for the rows that can not have been affected by the changes made
+    since. See workbench.upload.revalidation. Returns the results and
+    the validation cache to store with the data set.
+    """
+    tables_by_column = column_tables(upload_plan)
+    hashes = [row_hash(row) for row in data]
+    tokens = [row_tokens(tables_by_column, row) for row in rows]
+
+    if previous is None:
+        to_process = list(range(len(rows)))
+        previous_index: List[Optional[int]] = [None] * len(rows)
+        previous_results: List[Dict] = []
+        previous_tokens: List[List[str]] = []
+    else:
+        cache, previous_results = previous
+        previous_tokens = cache['tokens']
+        previous_index, to_process = plan_revalidation(cache['hashes'], previous_tokens, hashes, tokens)
+
+    processed = do_upload(
+        collection,
+        [rows[i] for i in to_process],
+        upload_plan,
+        uploading_agent_id,
+        [disambiguations[i] for i in to_process],
+        no_commit=True,
+        allow_partial=True,
+        progress=progress,
+    )
+    new_results = dict(zip(to_process, processed))
+
+    results: List[UploadResult] = []
+    row_upload_tokens: List[List[str]] = []
+    for i, row in enumerate(rows):
+        if i in new_results:
+            result = new_results[i]
+            row_upload_tokens.append(sorted(upload_tokens(tables_by_column, row, result)))
+        else:
+            j = previous_index[i]
+            assert j is not None, "unprocessed row has no previous result"
+            result = json_to_UploadResult(previous_results[j])
+            row_upload_tokens.append(previous_tokens[j])
+        results.append(result)
+
+    return results, {'hashes': hashes, 'tokens': row_upload_tokens, 'rowresults': None}
+
+def validate_dataset_shard(
+        collection,
+        uploading_agent_id: int,
+        ds: Spdataset,
+        start: int,
+        end: int,
+        progress: Optional[Progress]=None
+) -> List[UploadResult]:
+    """Validate rows [start, end) of the dataset on their own. Used for
+    validating large datasets in parallel, see workbench.tasks.
+    """
+    ncols = len(ds.columns)
+    data = ds.get_rows(start, end)
+    rows = [dict(zip(ds.columns, row)) for row in data]
+    disambiguation = [get_disambiguation_from_row(ncols, row) for row in data]
+    base_table, upload_plan = get_ds_upload_plan(collection, ds)
+
+    return do_upload(collection, rows, upload_plan, uploading_agent_id, disambiguation, no_commit=True, allow_partial=True, progress=progress)
+
+def shard_ranges(nrows: int, nshards: int) -> List[Tuple[int, int]]:
+    "Split nrows rows into at most nshards contiguous ranges of nearly equal size."
+    nshards = max(1, min(nshards, nrows))
+    size, extra = divmod(nrows, nshards)
+    ranges = []
+    start = 0
+    for i in range(nshards):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
 def clear_disambiguation(ds: Spdataset) -> None:
     with transaction.atomic():
         if ds.was_uploaded(): raise AssertionError("Dataset already uploaded!", {"localizationKey" : "datasetAlreadyUploaded"})
@@ -145,13 +305,12 @@ def clear_disambiguation(ds: Spdataset) -> None:
         ds.uploadresult = None
         ds.save(update_fields=['rowresults', 'uploadresult'])
 
-        ncols = len(ds.columns)
-        for row in ds.data:
-            extra = json.loads(row[ncols]) if row[ncols] else None
+        def clear(extra: Optional[Dict]) -> Optional[Dict]:
             if extra:
                 extra['disambiguation'] = {}
-            row[ncols] = extra and json.dumps(extra)
-        ds.save(update_fields=['data'])
+            return extra
+
+        ds.update_row_metadata(clear)
 
 def create_recordset(ds: Spdataset, name: str):
     table, upload_plan = get_ds_upload_plan(ds.collection, ds)
@@ -231,31 +390,133 @@ def do_upload(
         disambiguations: Optional[List[Disambiguation]]=None,
         no_commit: bool=False,
         allow_partial: bool=True,
-        progress: Optional[Progress]=None
+        progress: Optional[Progress]=None,
+        prematch_batch_size: int=PREMATCH_BATCH_SIZE,
+        savepoint_chunk_size: int=SAVEPOINT_CHUNK_SIZE,
 ) -> List[UploadResult]:
-    cache: Dict = {}
+    cache = JournaledCache()
+    audit_batch = AuditBatch()
+    inserts = DeferredInserts()
     _auditor = Auditor(collection=collection, audit_log=None if no_commit else auditlog,
                        # Done to allow checking skipping write permission check
                        # during validation
-                       skip_create_permission_check=no_commit)
+                       skip_create_permission_check=no_commit,
+                       batch=audit_batch,
+                       inserts=inserts)
     total = len(rows) if isinstance(rows, Sized) else None
     deffered_upload_plan = apply_deferred_scopes(upload_plan, rows)
+
+    def process_row(bind_result: Union[BoundUploadable, ParseFailures]) -> UploadResult:
+        return UploadResult(bind_result, {}, {}) if isinstance(bind_result, ParseFailures) else bind_result.process_row()
+
+    def try_chunk(chunk: List[Union[BoundUploadable, ParseFailures]], defer_inserts: bool=True) -> Tuple[List[UploadResult], Optional[int]]:
+        """Upload the bound rows in chunk under one save point, stopping
+        and rolling back at the first failing row. Returns the results
+        so far and the position of the failing row, if any.
+
+        With defer_inserts the to-many records of the rows are inserted
+        together at the end. If that fails, the chunk is uploaded again
+        inserting them row by row, to find the row at fault.
+        """
+        cache_mark = cache.mark()
+        audit_mark = audit_batch.mark()
+        attempt: List[UploadResult] = []
+        inserts.reset()
+        inserts.enabled = defer_inserts
+        try:
+            with savepoint("chunk upload"):
+                for bind_result in chunk:
+                    result = process_row(bind_result)
+                    attempt.append(result)
+                    if result.contains_failure():
+                        # the report of the failed row shows its
+                        # records as inserted, as it would without
+                        # deferring them
+                        inserts.flush()
+                        attempt[-1] = inserts.resolve(result)
+                        cache.rollback_to(cache_mark)
+                        audit_batch.rollback_to(audit_mark)
+                        raise Rollback("failed row")
+                inserts.flush()
+                return [inserts.resolve(result) for result in attempt], None
+        except (BusinessRuleException, IntegrityError):
+            if not defer_inserts:
+                raise
+            cache.rollback_to(cache_mark)
+            audit_batch.rollback_to(audit_mark)
+            logger.info("deferred inserts failed, uploading the chunk again without deferring them")
+            return try_chunk(chunk, defer_inserts=False)
+        finally:
+            inserts.reset()
+            inserts.enabled = False
+        return attempt, len(attempt) - 1
+
+    def upload_chunk(chunk: List[Union[BoundUploadable, ParseFailures]]) -> Tuple[List[UploadResult], bool]:
+        """Upload the bound rows in chunk. When a row fails, the rows
+        before it are redone under their own save point, the failing
+        row is retried on its own, and the rest of the chunk is tried
+        again. Returns the results and whether the chunk went through
+        without any failures.
+        """
+        chunk_results: List[UploadResult] = []
+        clean = True
+        while chunk:
+            attempt, failed_at = try_chunk(chunk)
+            if failed_at is None:
+                chunk_results += attempt
+                break
+
+            clean = False
+            if failed_at > 0:
+                redone, _ = upload_chunk(chunk[:failed_at])
+                chunk_results += redone
+                # the rolled back attempt can refer to records of the
+                # rows before it, which were redone with new ids
+                retried, _ = try_chunk(chunk[failed_at:failed_at + 1])
+                chunk_results += retried
+            else:
+                chunk_results.append(attempt[failed_at])
+            chunk = chunk[failed_at + 1:]
+
+        return chunk_results, clean
+
     with savepoint("main upload"):
         tic = time.perf_counter()
         results: List[UploadResult] = []
-        for i, row in enumerate(rows):
-            _cache = cache.copy() if cache is not None and allow_partial else cache
-            da = disambiguations[i] if disambiguations else None
-            with savepoint("row upload") if allow_partial else no_savepoint():
-                bind_result = deffered_upload_plan.disambiguate(da).bind(collection, row, uploading_agent_id, _auditor, cache, i)
-                result = UploadResult(bind_result, {}, {}) if isinstance(bind_result, ParseFailures) else bind_result.process_row()
-                results.append(result)
-                if progress is not None:
-                    progress(len(results), total)
-                logger.info(f"finished row {len(results)}, cache size: {cache and len(cache)}")
-                if result.contains_failure():
-                    cache = _cache
-                    raise Rollback("failed row")
+        chunk_size = max(savepoint_chunk_size, 1)
+        for batch in chunked(enumerate(rows), max(prematch_batch_size, 1)):
+            bind_results = [
+                deffered_upload_plan.disambiguate(disambiguations[i] if disambiguations else None)
+                .bind(collection, row, uploading_agent_id, _auditor, cache, i)
+                for i, row in batch
+            ]
+
+            if prematch_batch_size > 1:
+                prematch_rows([b for b in bind_results if not isinstance(b, ParseFailures)], cache)
+
+            if not allow_partial:
+                for bind_result in bind_results:
+                    result = process_row(bind_result)
+                    results.append(result)
+                    if progress is not None:
+                        progress(len(results), total)
+                    if result.contains_failure():
+                        raise Rollback("failed row")
+            else:
+                position = 0
+                while position < len(bind_results):
+                    chunk = bind_results[position:position + chunk_size]
+                    chunk_results, clean = upload_chunk(chunk)
+                    results += chunk_results
+                    position += len(chunk)
+                    # shrink the chunks while rows are failing, grow them back when they aren't
+                    chunk_size = min(chunk_size * 2, max(savepoint_chunk_size, 1)) if clean else max(chunk_size // 2, 1)
+                    if progress is not None:
+                        progress(len(results), total)
+                    logger.info(f"finished row {len(results)}, cache size: {len(cache)}")
+
+            cache.commit()
+            audit_batch.flush()
 
         toc = time.perf_counter()
         logger.info(f"finished upload of {len(results)} rows in {toc-tic}s")
@@ -267,6 +528,14 @@ def do_upload(
 
     return results
 
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 do_upload_csv = do_upload
 
 def validate_row(collection, upload_plan: ScopedUploadable, uploading_agent_id: int, row: Row, da: Disambiguation) -> UploadResult:
@@ -297,18 +566,30 @@ def fixup_trees(upload_plan: ScopedUploadable, results: List[UploadResult]) -> N
     ]
 
     for tree in to_fix:
+        new_ids = [id for r in results for id in uploaded_ids(tree, r)]
+
         tic = time.perf_counter()
-        renumber_tree(tree)
+        number_new_nodes(tree, new_ids)
         toc = time.perf_counter()
-        logger.info(f"finished renumber of {tree} tree in {toc-tic}s")
+        logger.info(f"finished numbering new nodes of {tree} tree in {toc-tic}s")
 
         for treedef in treedefs:
             if treedef.specify_model.name.lower().startswith(tree):
                 tic = time.perf_counter()
-                set_fullnames(treedef, null_only=True)
+                set_fullnames(treedef, null_only=True, node_ids=new_ids)
                 toc = time.perf_counter()
                 logger.info(f"finished reset fullnames of {tree} tree in {toc-tic}s")
 
+def uploaded_ids(tree: str, result: UploadResult) -> Iterator[int]:
+    "The ids of the nodes of tree uploaded in result."
+    if isinstance(result.record_result, Uploaded) and result.record_result.info.tableName.lower() == tree:
+        yield result.record_result.id
+    for toOne in result.toOne.values():
+        yield from uploaded_ids(tree, toOne)
+    for toMany in result.toMany.values():
+        for r in toMany:
+            yield from uploaded_ids(tree, r)
+
 def changed_tree(tree: str, result: UploadResult) -> bool:
     return (isinstance(result.record_result, Uploaded) and result.record_result.info.tableName.lower() == tree) \
         or any(changed_tree(tree, toOne) for toOne in result.toOne.values()) \
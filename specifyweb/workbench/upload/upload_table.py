@@ -1,11 +1,12 @@
 
 import logging
 from functools import reduce
-from typing import List, Dict, Any, NamedTuple, Union, Optional, Set, Callable, Literal, cast
+from typing import List, Dict, Any, NamedTuple, Union, Optional, Set, Callable, Literal, Tuple, cast
 
 from django.db import transaction, IntegrityError
 
 from specifyweb.businessrules.exceptions import BusinessRuleException
+from specifyweb.businessrules.orm_signal_handler import insert_batch
 from specifyweb.specify import models
 from .column_options import ColumnOptions, ExtendedColumnOptions
 from .parsing import parse_many, ParseResult, ParseFailure
@@ -306,6 +307,13 @@ class ScopedMustMatchTable(ScopedUploadTable):
         return BoundMustMatchTable(*b) if isinstance(b, BoundUploadTable) else b
 
 
+class PendingUpload(NamedTuple):
+    "A record ready to be inserted, see BoundUploadTable._prepare_row."
+    model: Any
+    attrs: Dict[str, Any]
+    toOneResults: Dict[str, UploadResult]
+    info: ReportInfo
+
 class BoundUploadTable(NamedTuple):
     name: str
     static: Dict[str, Any]
@@ -360,6 +368,13 @@ class BoundUploadTable(NamedTuple):
         return BoundMustMatchTable(*self).process_row()
 
     def _handle_row(self, force_upload: bool) -> UploadResult:
+        prepared = self._prepare_row(force_upload)
+        return prepared if isinstance(prepared, UploadResult) else self._do_upload(prepared)
+
+    def _prepare_row(self, force_upload: bool) -> Union[UploadResult, PendingUpload]:
+        """Match the row or get it ready to be inserted by _do_upload,
+        uploading its to-one records.
+        """
         model = getattr(models, self.name.capitalize())
         if self.disambiguation is not None:
             if model.objects.filter(id=self.disambiguation).exists():
@@ -412,7 +427,7 @@ class BoundUploadTable(NamedTuple):
             if match:
                 return UploadResult(match, toOneResults, {})
 
-        return self._do_upload(model, toOneResults, info)
+        return self._prepare_upload(model, toOneResults, info)
 
     def _process_to_ones(self) -> Dict[str, UploadResult]:
         return {
@@ -421,16 +436,18 @@ class BoundUploadTable(NamedTuple):
             sorted(self.toOne.items(), key=lambda kv: kv[0]) # make the upload order deterministic
         }
 
-    def _match(self, model, toOneResults: Dict[str, UploadResult], toManyFilters: FilterPack, info: ReportInfo) -> Union[Matched, MatchedMultiple, None]:
+    def match_filters(self, model, toOneIds: Dict[str, Any]) -> Dict[str, Any]:
         filters = {
             fieldname_: value
             for parsedField in self.parsedFields
             for fieldname_, value in parsedField.filter_on.items()
         }
 
-        filters.update({ model._meta.get_field(fieldname).attname: r.get_id() for fieldname, r in toOneResults.items() })
+        filters.update({ model._meta.get_field(fieldname).attname: id for fieldname, id in toOneIds.items() })
+        return filters
 
-        cache_key = (
+    def match_cache_key(self, filters: Dict[str, Any], toManyFilters: FilterPack) -> Tuple:
+        return (
             self.name,
             tuple(sorted(filters.items())),
             toManyFilters.match_key(),
@@ -438,12 +455,20 @@ class BoundUploadTable(NamedTuple):
             tuple(sorted(self.static.items())),
         )
 
+    def _match(self, model, toOneResults: Dict[str, UploadResult], toManyFilters: FilterPack, info: ReportInfo) -> Union[Matched, MatchedMultiple, None]:
+        filters = self.match_filters(model, {fieldname: r.get_id() for fieldname, r in toOneResults.items()})
+        cache_key = self.match_cache_key(filters, toManyFilters)
+
         cache_hit: Optional[List[int]] = self.cache.get(cache_key, None) if self.cache is not None else None
         if cache_hit is not None:
             ids = cache_hit
         else:
             to_many_filters, to_many_excludes = toManyFilters
 
+            if (to_many_filters or to_many_excludes) and self.auditor.inserts is not None:
+                # the to-many records the query looks at can be pending
+                self.auditor.inserts.flush_for(model, model.objects.filter(**filters, **self.scopingAttrs, **self.static))
+
             qs = reduce(lambda q, e: q.exclude(**{e.lookup: getattr(models, e.table).objects.filter(**e.filter)}),
                         to_many_excludes,
                         reduce(lambda q, f: q.filter(**f),
@@ -463,7 +488,7 @@ class BoundUploadTable(NamedTuple):
         else:
             return None
 
-    def _do_upload(self, model, toOneResults: Dict[str, UploadResult], info: ReportInfo) -> UploadResult:
+    def _prepare_upload(self, model, toOneResults: Dict[str, UploadResult], info: ReportInfo) -> Union[UploadResult, PendingUpload]:
         missing_requireds = [
             # TODO: there should probably be a different structure for
             # missing required fields than ParseFailure
@@ -501,27 +526,33 @@ class BoundUploadTable(NamedTuple):
                 return UploadResult(PropagatedFailure(), toOneResults, {})
             toOneIds[field] = id
 
+        return PendingUpload(model, {
+            **({'createdbyagent_id': self.uploadingAgentId} if model.specify_model.get_field('createdbyagent') else {}),
+            **attrs,
+            **self.scopingAttrs,
+            **self.static,
+            **{ model._meta.get_field(fieldname).attname: id for fieldname, id in toOneIds.items() },
+        }, toOneResults, info)
+
+    def _do_upload(self, pending: PendingUpload) -> UploadResult:
         with transaction.atomic():
             try:
-                uploaded = self._do_insert(model, **{
-                    **({'createdbyagent_id': self.uploadingAgentId} if model.specify_model.get_field('createdbyagent') else {}),
-                    **attrs,
-                    **self.scopingAttrs,
-                    **self.static,
-                    **{ model._meta.get_field(fieldname).attname: id for fieldname, id in toOneIds.items() },
-                })
+                uploaded = self._do_insert(pending.model, **pending.attrs)
                 picklist_additions = self._do_picklist_additions()
             except (BusinessRuleException, IntegrityError) as e:
-                return UploadResult(FailedBusinessRule(str(e), {}, info), toOneResults, {})
+                return UploadResult(FailedBusinessRule(str(e), {}, pending.info), pending.toOneResults, {})
 
+        return self._finish_upload(pending, uploaded, picklist_additions)
+
+    def _finish_upload(self, pending: PendingUpload, uploaded, picklist_additions: List[PicklistAddition]) -> UploadResult:
         self.auditor.insert(uploaded, self.uploadingAgentId, None)
 
         toManyResults = {
-            fieldname: _upload_to_manys(model, uploaded.id, fieldname, self.uploadingAgentId, self.auditor, self.cache, records)
+            fieldname: _upload_to_manys(pending.model, uploaded.id, fieldname, self.uploadingAgentId, self.auditor, self.cache, records)
             for fieldname, records in
             sorted(self.toMany.items(), key=lambda kv: kv[0]) # make the upload order deterministic
         }
-        return UploadResult(Uploaded(uploaded.id, info, picklist_additions), toOneResults, toManyResults)
+        return UploadResult(Uploaded(uploaded.id, pending.info, picklist_additions), pending.toOneResults, toManyResults)
 
     def _do_insert(self, model, **attrs) -> Any:
         return model.objects.create(**attrs)
@@ -531,6 +562,10 @@ class BoundUploadTable(NamedTuple):
         for parsedField in self.parsedFields:
             if parsedField.add_to_picklist is not None:
                 a = parsedField.add_to_picklist
+                if a.picklist.picklistitems.filter(title=a.value).exists():
+                    # an earlier row bound in the same prematch chunk
+                    # already added the item
+                    continue
                 pli = a.picklist.picklistitems.create(value=a.value, title=a.value, createdbyagent_id=self.uploadingAgentId)
                 self.auditor.insert(pli, self.uploadingAgentId, None)
                 added_picklist_items.append(PicklistAddition(name=a.picklist.name, caption=a.column, value=a.value, id=pli.id))
@@ -553,7 +588,7 @@ class BoundMustMatchTable(BoundUploadTable):
             for fieldname, to_one_def in self.toOne.items()
         }
 
-    def _do_upload(self, model, toOneResults: Dict[str, UploadResult], info: ReportInfo) -> UploadResult:
+    def _prepare_upload(self, model, toOneResults: Dict[str, UploadResult], info: ReportInfo) -> Union[UploadResult, PendingUpload]:
         return UploadResult(NoMatch(info), toOneResults, {})
 
 
@@ -573,7 +608,7 @@ def _to_many_filters_and_excludes(to_manys: Dict[str, List[BoundToManyRecord]])
 def _upload_to_manys(parent_model, parent_id, parent_field, uploadingAgentId: Optional[int], auditor: Auditor, cache: Optional[Dict], records) -> List[UploadResult]:
     fk_field = parent_model._meta.get_field(parent_field).remote_field.attname
 
-    return [
+    tables = [
         BoundUploadTable(
             name=record.name,
             scopingAttrs=record.scopingAttrs,
@@ -585,6 +620,111 @@ def _upload_to_manys(parent_model, parent_id, parent_field, uploadingAgentId: Op
             uploadingAgentId=uploadingAgentId,
             auditor=auditor,
             cache=cache,
-        ).force_upload_row()
+        )
         for record in records
     ]
+    prepared = [table._prepare_row(force_upload=True) for table in tables]
+    if auditor.inserts is not None and auditor.inserts.enabled:
+        return [
+            result if isinstance(result, UploadResult) else auditor.inserts.defer(table, result, parent_model, parent_id)
+            for table, result in zip(tables, prepared)
+        ]
+    uploaded = iter(_insert_together([
+        (table, pending) for table, pending in zip(tables, prepared)
+        if isinstance(pending, PendingUpload)
+    ]))
+    return [result if isinstance(result, UploadResult) else next(uploaded) for result in prepared]
+
+def _insert_together(pending: List[Tuple[BoundUploadTable, PendingUpload]]) -> List[UploadResult]:
+    """Insert the sibling to-many records with _insert_batch. If that
+    fails the records are inserted one at a time to find the ones at
+    fault.
+    """
+    if not pending:
+        return []
+    try:
+        return _insert_batch(pending)
+    except (BusinessRuleException, IntegrityError):
+        return [table._do_upload(p) for table, p in pending]
+
+def _insert_batch(pending: List[Tuple[BoundUploadTable, PendingUpload]]) -> List[UploadResult]:
+    """Insert the pending records, which must be of one table, with
+    insert_batch, so the business rules with a set-based implementation
+    run once for all of them. Raises the error of the first record that
+    fails, having inserted none of them.
+    """
+    instances = [p.model(**p.attrs) for _, p in pending]
+    with transaction.atomic():
+        insert_batch(instances)
+        picklist_additions = [table._do_picklist_additions() for table, _ in pending]
+
+    return [
+        table._finish_upload(p, instance, additions)
+        for (table, p), instance, additions in zip(pending, instances, picklist_additions)
+    ]
+
+class DeferredInserts(object):
+    """Collects the to-many records of the rows of a chunk, while
+    enabled, to be inserted with one _insert_batch per table. Nothing
+    else in an upload refers to them, so they can wait until the chunk
+    is done, see do_upload. Until then placeholder results stand for
+    them in the results of their rows, which resolve replaces.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.reset()
+
+    def reset(self) -> None:
+        "Drop the pending records and the placeholders, e.g. for a rolled back chunk."
+        self.pending: List[Tuple[BoundUploadTable, PendingUpload, UploadResult]] = []
+        # (model, id) of the records the pending records belong to
+        self.parents: Set[Tuple[Any, int]] = set()
+        # the results of the inserted records by the id of their
+        # placeholders, which self.placeholders keeps alive
+        self.resolved: Dict[int, UploadResult] = {}
+        self.placeholders: List[UploadResult] = []
+
+    def defer(self, table: BoundUploadTable, pending: PendingUpload, parent_model, parent_id: int) -> UploadResult:
+        self.parents.add((parent_model, parent_id))
+        placeholder = UploadResult(Uploaded(None, pending.info, []), pending.toOneResults, {}) # type: ignore
+        self.pending.append((table, pending, placeholder))
+        self.placeholders.append(placeholder)
+        return placeholder
+
+    def flush(self) -> None:
+        """Insert the pending records, table by table. Raises the
+        error of the first failing record, leaving the chunk to be
+        rolled back.
+        """
+        pending, self.pending = self.pending, []
+        self.parents = set()
+        by_model: Dict[Any, List[Tuple[BoundUploadTable, PendingUpload, UploadResult]]] = {}
+        for deferred in pending:
+            by_model.setdefault(deferred[1].model, []).append(deferred)
+
+        for group in by_model.values():
+            results = _insert_batch([(table, p) for table, p, _ in group])
+            for (_, _, placeholder), result in zip(group, results):
+                self.resolved[id(placeholder)] = result
+
+    def flush_for(self, model, candidates) -> None:
+        """Insert the pending records if any of them belong to the
+        records of model in the queryset candidates, which a match is
+        about to be made among by their to-many records.
+        """
+        parent_ids = [parent_id for parent_model, parent_id in self.parents if parent_model is model]
+        if parent_ids and candidates.filter(id__in=parent_ids).exists():
+            self.flush()
+
+    def resolve(self, result: UploadResult) -> UploadResult:
+        "result with the placeholders in it replaced by the results of the inserted records."
+        if not self.placeholders:
+            return result
+        inserted = self.resolved.get(id(result), None)
+        if inserted is not None:
+            return inserted
+        return result._replace(
+            toOne={field: self.resolve(r) for field, r in result.toOne.items()},
+            toMany={field: [self.resolve(r) for r in rs] for field, rs in result.toMany.items()},
+        )
@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 from uuid import uuid4
 
 from django import http
@@ -45,6 +45,37 @@ def regularize_rows(ncols: int, rows: List[List]) -> List[List[str]]:
 
     return [r for r in map(regularize, rows) if r is not None]
 
+def apply_row_changes(ncols: int, rows: List[List[str]], changes: Dict) -> List[List[str]]:
+    """Apply a row level diff to the rows of a dataset. Indexes in
+    'update' and 'delete' refer to the rows before the change. Updated
+    rows that are left empty are removed. 'append' rows are added at
+    the end.
+    """
+    if not isinstance(changes, dict):
+        raise ValueError("expected an object")
+
+    new_rows: List[Optional[List[str]]] = list(rows)
+
+    for change in changes.get('update', []):
+        if not (isinstance(change, list) and len(change) == 2 and isinstance(change[0], int) and isinstance(change[1], list)):
+            raise ValueError(f"malformed update {change!r}")
+        index, row = change
+        if not 0 <= index < len(rows):
+            raise ValueError(f"row index {index} out of range")
+        regularized = regularize_rows(ncols, [row])
+        new_rows[index] = regularized[0] if regularized else None
+
+    for index in changes.get('delete', []):
+        if not (isinstance(index, int) and 0 <= index < len(rows)):
+            raise ValueError(f"row index {index!r} out of range")
+        new_rows[index] = None
+
+    appended = changes.get('append', [])
+    if not (isinstance(appended, list) and all(isinstance(row, list) for row in appended)):
+        raise ValueError("malformed append")
+
+    return [r for r in new_rows if r is not None] + regularize_rows(ncols, appended)
+
 
 open_api_components = {
     'schemas': {
@@ -114,6 +145,18 @@ open_api_components = {
                                     "type": "string",
                                     "maxLength": 36,
                                     "example": "7d34dbb2-6e57-4c4b-9546-1fe7bec1acca",
+                                },
+                                "shards": {
+                                    "type": "array",
+                                    "description": "Row ranges of a validation split across workers",
+                                    "items": {
+                                        "type": "object",
+                                        "properties": {
+                                            "taskid": {"type": "string", "maxLength": 36},
+                                            "start": {"type": "number"},
+                                            "end": {"type": "number"},
+                                        }
+                                    }
                                 }
                             }
                         },
@@ -317,11 +360,11 @@ def datasets(request) -> http.HttpResponse:
             collection=request.specify_collection,
             name=data['name'],
             columns=columns,
-            data=rows,
             importedfilename=data['importedfilename'],
             createdbyagent=request.specify_user_agent,
             modifiedbyagent=request.specify_user_agent,
         )
+        ds.save_rows(rows)
         return http.JsonResponse({"id": ds.id, "name": ds.name}, status=201)
 
     else:
@@ -483,12 +526,15 @@ def dataset(request, ds: models.Spdataset) -> http.HttpResponse:
                     if new_cols:
                         ncols = len(ds.columns)
                         ds.columns += list(new_cols)
-                        for i, row in enumerate(ds.data):
-                            ds.data[i] = row[:ncols] + [""]*len(new_cols) + row[ncols:]
+                        ds.save_rows([
+                            row[:ncols] + [""]*len(new_cols) + row[ncols:]
+                            for row in ds.iter_rows()
+                        ])
 
                 ds.uploadplan = json.dumps(plan) if plan is not None else None
                 ds.rowresults = None
                 ds.uploadresult = None
+                ds.validationcache = None
 
             ds.save()
             return http.HttpResponse(status=204)
@@ -505,9 +551,43 @@ def dataset(request, ds: models.Spdataset) -> http.HttpResponse:
 
 @openapi(schema={
     "get": {
+        "parameters": [
+            {
+                "name": "offset",
+                "in": "query",
+                "required": False,
+                "schema": {"type": "integer", "minimum": 0},
+                "description": "Index of the first row to return."
+            },
+            {
+                "name": "limit",
+                "in": "query",
+                "required": False,
+                "schema": {"type": "integer", "minimum": 0},
+                "description": "Maximum number of rows to return. All remaining rows if absent."
+            },
+            {
+                "name": "columns",
+                "in": "query",
+                "required": False,
+                "schema": {"type": "string"},
+                "description":
+                    "Comma separated indexes of the columns to return, in that order. " +
+                    "The index one past the last column is the disambiguation column."
+            },
+            {
+                "name": "format",
+                "in": "query",
+                "required": False,
+                "schema": {"type": "string", "enum": ["json", "ndjson"]},
+                "description": "Return a JSON array (the default) or one JSON array per line."
+            }
+        ],
         "responses": {
             "200": {
-                "description": "Successful response",
+                "description":
+                    "Successful response. The total number of rows in the data set " +
+                    "is given by the X-Total-Count header.",
                 "content": {
                     "application/json": {
                         "schema": {
@@ -524,9 +604,16 @@ def dataset(request, ds: models.Spdataset) -> http.HttpResponse:
                                 "disambiguation results as a JSON object or be an " +
                                 "empty string"
                         }
+                    },
+                    "application/x-ndjson": {
+                        "schema": {
+                            "type": "string",
+                            "description": "One JSON array of cells per line"
+                        }
                     }
                 }
-            }
+            },
+            "400": {"description": "Invalid offset, limit or columns."}
         }
     },
     'put': {
@@ -557,13 +644,55 @@ def dataset(request, ds: models.Spdataset) -> http.HttpResponse:
             "409": {"description": "Dataset in use by uploader"}
         }
     },
+    'patch': {
+        "requestBody": {
+            "required": True,
+            "description":
+                "Row level changes. Unlike a PUT, only the changed rows " +
+                "are revalidated by the next validation.",
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "update": {
+                                "type": "array",
+                                "items": {
+                                    "type": "array",
+                                    "description": "Pair of the index of the row to replace and the new row",
+                                },
+                            },
+                            "delete": {
+                                "type": "array",
+                                "items": {"type": "integer"},
+                                "description": "Indexes of the rows to remove",
+                            },
+                            "append": {
+                                "type": "array",
+                                "items": {"type": "array", "items": {"type": "string"}},
+                                "description": "Rows to add at the end of the data set",
+                            },
+                        },
+                        "additionalProperties": False,
+                    }
+                }
+            }
+        },
+        "responses": {
+            "204": {"description": "Data set rows updated."},
+            "400": {"description": "Invalid row changes."},
+            "409": {"description": "Dataset in use by uploader"}
+        }
+    },
 }, components=open_api_components)
 @login_maybe_required
-@require_http_methods(["GET", "PUT"])
+@require_http_methods(["GET", "PUT", "PATCH"])
 @transaction.atomic
 @models.Spdataset.validate_dataset_request(raise_404=False, lock_object=True)
 def rows(request, ds) -> http.HttpResponse:
-    """Returns (GET) or sets (PUT) the row data for dataset <ds_id>."""
+    """Returns (GET), sets (PUT) or changes individual rows of (PATCH)
+    the row data for dataset <ds_id>.
+    """
 
     if request.method == "PUT":
         check_permission_targets(request.specify_collection.id, request.specify_user.id, [DataSetPT.update])
@@ -574,15 +703,66 @@ def rows(request, ds) -> http.HttpResponse:
 
         rows = regularize_rows(len(ds.columns), json.load(request))
 
-        ds.data = rows
-        ds.rowresults = None
-        ds.uploadresult = None
+        ds.set_rows(rows)
+        ds.modifiedbyagent = request.specify_user_agent
+        ds.save()
+        return http.HttpResponse(status=204)
+
+    elif request.method == "PATCH":
+        check_permission_targets(request.specify_collection.id, request.specify_user.id, [DataSetPT.update])
+        if ds.uploaderstatus is not None:
+            return http.HttpResponse('dataset in use by uploader.', status=409)
+        if ds.was_uploaded():
+            return http.HttpResponse('dataset has been uploaded. changing data not allowed.', status=400)
+
+        try:
+            rows = apply_row_changes(len(ds.columns), ds.get_rows(), json.load(request))
+        except ValueError as e:
+            return http.HttpResponseBadRequest(f"invalid row changes: {e}")
+
+        ds.set_rows(rows)
         ds.modifiedbyagent = request.specify_user_agent
         ds.save()
         return http.HttpResponse(status=204)
 
     else: # GET
-        return http.JsonResponse(ds.data, safe=False)
+        try:
+            offset = int(request.GET.get('offset', 0))
+            limit = int(request.GET['limit']) if 'limit' in request.GET else None
+            columns = [int(c) for c in request.GET['columns'].split(',')] if 'columns' in request.GET else None
+        except ValueError:
+            return http.HttpResponseBadRequest("offset, limit and columns must be integers")
+
+        if offset < 0 or (limit is not None and limit < 0):
+            return http.HttpResponseBadRequest("offset and limit must not be negative")
+        if columns is not None and any(not 0 <= c <= len(ds.columns) for c in columns):
+            return http.HttpResponseBadRequest("column index out of range")
+
+        ndjson = request.GET.get('format', 'json') == 'ndjson'
+        rows = ds.iter_rows(offset, None if limit is None else offset + limit)
+        if columns is not None:
+            rows = ([row[c] for c in columns] for row in rows)
+
+        response = http.StreamingHttpResponse(
+            stream_rows(rows, ndjson),
+            content_type='application/x-ndjson' if ndjson else 'application/json',
+        )
+        response['X-Total-Count'] = str(ds.rowcount)
+        return response
+
+def stream_rows(rows: Iterable[List[str]], ndjson: bool, batch_size: int=500) -> Iterator[str]:
+    """Serialize rows incrementally as a JSON array, or as one array per
+    line, batch_size rows at a time.
+    """
+    if not ndjson:
+        yield "["
+    for i, batch in enumerate(uploader.chunked(rows, batch_size)):
+        if ndjson:
+            yield "".join(json.dumps(row) + "\n" for row in batch)
+        else:
+            yield ("," if i > 0 else "") + ",".join(json.dumps(row) for row in batch)
+    if not ndjson:
+        yield "]"
 
 
 @openapi(schema={
@@ -719,6 +899,14 @@ def status(request, ds_id: int) -> http.HttpResponse:
         'validating': tasks.upload,
         'unuploading': tasks.unupload,
     }[ds.uploaderstatus['operation']]
+    if 'shards' in ds.uploaderstatus:
+        state, info = tasks.sharded_validation_status(ds.uploaderstatus)
+        return http.JsonResponse({
+            'uploaderstatus': ds.uploaderstatus,
+            'taskstatus': state,
+            'taskinfo': info,
+        })
+
     result = task.AsyncResult(ds.uploaderstatus['taskid'])
     status = {
         'uploaderstatus': ds.uploaderstatus,
@@ -777,6 +965,8 @@ def abort(request, ds) -> http.HttpResponse:
         'unuploading': tasks.unupload,
     }[ds.uploaderstatus['operation']]
     result = task.AsyncResult(ds.uploaderstatus['taskid']).revoke(terminate=True)
+    for shard in ds.uploaderstatus.get('shards', []):
+        tasks.validate_shard.AsyncResult(shard['taskid']).revoke(terminate=True)
 
     try:
         models.Spdataset.objects.filter(id=ds.id).update(uploaderstatus=None)